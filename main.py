@@ -13,7 +13,7 @@ import os
 # Adiciona o diretório src ao path para imports
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from src.core.rag_service import RAGService
+from src.core.query_client import get_query_client
 
 
 def imprimir_cabecalho():
@@ -46,13 +46,21 @@ def loop_principal(rag_service):
                 continue
 
             print("🔍 Processando...")
-            resposta = rag_service.answer_question(pergunta)
-
-            if resposta:
-                print("\n✅ Resposta:")
-                print("-" * 30)
-                print(resposta)
+            # Resposta em streaming: os tokens aparecem conforme o LLM gera
+            recebeu = False
+            stats = {}
+            for trecho in rag_service.stream_answer(pergunta, stats=stats):
+                if not recebeu:
+                    print("\n✅ Resposta:")
+                    print("-" * 30)
+                    recebeu = True
+                print(trecho, end="", flush=True)
+
+            if recebeu:
+                print()
                 print("-" * 30)
+                if stats.get("error"):
+                    print(f"⚠️ Resposta interrompida ({stats['error']}); refaça a pergunta")
             else:
                 print("❌ Não foi possível processar a pergunta")
                 print("💡 Verifique se o Ollama está funcionando")
@@ -71,8 +79,14 @@ def main():
         # Cabeçalho
         imprimir_cabecalho()
 
-        # Inicializa o serviço RAG
-        rag_service = RAGService()
+        # Servidor de consultas no ar: cliente fino, sem carregar índice nem modelos aqui
+        rag_service = get_query_client()
+        if rag_service is not None:
+            print(f"🌐 Usando servidor de consultas em {rag_service.url}")
+        else:
+            # Inicializa o serviço RAG
+            from src.core.rag_service import RAGService
+            rag_service = RAGService()
 
         # Loop principal de interação
         loop_principal(rag_service)
@@ -7,40 +7,123 @@ class Settings:
     """Configurações do sistema"""
 
     # Ollama
-    OLLAMA_URL = "http://localhost:11434"
+    OLLAMA_URL = os.environ.get("PF_RAG_OLLAMA_URL", "http://localhost:11434")
     OLLAMA_TIMEOUT = 5
+    # Transporte HTTP compartilhado: conexões/requisições simultâneas, retentativas e backoff (s)
+    OLLAMA_MAX_CONCURRENCY = int(os.environ.get("PF_RAG_OLLAMA_CONCURRENCY", 4))
+    OLLAMA_RETRIES = int(os.environ.get("PF_RAG_OLLAMA_RETRIES", 3))
+    OLLAMA_BACKOFF = float(os.environ.get("PF_RAG_OLLAMA_BACKOFF", 0.5))
+    OLLAMA_REQUEST_TIMEOUT = float(os.environ.get("PF_RAG_OLLAMA_REQUEST_TIMEOUT", 120))
     EMBEDDING_MODEL = "nomic-embed-text:latest"
     LLM_MODEL = "llama3.2:latest"
+    # Modelo residente entre consultas e janela de contexto fixa (mudar num_ctx recarrega o
+    # modelo e descarta o cache KV do prefixo); aquecimento com o prefixo do prompt na inicialização
+    LLM_KEEP_ALIVE = os.environ.get("PF_RAG_LLM_KEEP_ALIVE", "30m")
+    LLM_NUM_CTX = int(os.environ.get("PF_RAG_LLM_NUM_CTX", 6144))
+    LLM_WARMUP = os.environ.get("PF_RAG_LLM_WARMUP", "true").lower() == "true"
+    # Saúde do Ollama fora do caminho da pergunta: sondagem de fundo, validade do status
+    # e disjuntor (falhas consecutivas para abrir, segundos até nova tentativa)
+    OLLAMA_HEALTH_INTERVAL = float(os.environ.get("PF_RAG_OLLAMA_HEALTH_INTERVAL", 30))
+    OLLAMA_HEALTH_TTL = float(os.environ.get("PF_RAG_OLLAMA_HEALTH_TTL", 90))
+    OLLAMA_BREAKER_FAILURES = int(os.environ.get("PF_RAG_OLLAMA_BREAKER_FAILURES", 3))
+    OLLAMA_BREAKER_COOLDOWN = float(os.environ.get("PF_RAG_OLLAMA_BREAKER_COOLDOWN", 15))
 
     # Paths
     # Pasta de PDFs (nome canônico: SGP)
     PDF_FOLDER = os.environ.get("PF_RAG_PDF_FOLDER", "SGP")
     FAISS_DB_PATH = os.environ.get("PF_RAG_FAISS_PATH", "faissDB")
     QDRANT_PATH = os.environ.get("PF_RAG_QDRANT_PATH", "qdrantDB")
-    CACHE_FILE = "faissDB/cache_respostas.json"
+    CACHE_FILE = "faissDB/cache_respostas.json"  # legado: migrado para ANSWER_CACHE_PATH
+    ANSWER_CACHE_PATH = os.environ.get("PF_RAG_ANSWER_CACHE", "faissDB/cache_respostas.sqlite")
+    # Geração do índice e anchors indexados (invalidação seletiva do cache na reindexação)
+    INDEX_GENERATION_PATH = os.environ.get("PF_RAG_INDEX_GENERATION", "faissDB/index_generation.sqlite")
     HASH_FILE = "faissDB/sgp_hash.json"
     CHUNKS_JSONL_PATH = os.environ.get("PF_RAG_CHUNKS_JSONL", "faissDB/chunks.jsonl")
     EXPORT_CHUNKS_JSONL = os.environ.get("PF_RAG_EXPORT_JSONL", "true").lower() == "true"
+    # Extras de layout (Docling) persistidos por hash de conteúdo do PDF
+    LAYOUT_STORE_PATH = os.environ.get("PF_RAG_LAYOUT_STORE", "faissDB/layout_store.sqlite")
+    LAYOUT_STORE_MAX_MB = int(os.environ.get("PF_RAG_LAYOUT_STORE_MAX_MB", 256))
 
     # RAG Configurações
     CHUNK_SIZE = 500
     CHUNK_OVERLAP = 200
     RETRIEVAL_K = 6
+    # Contexto do LLM: orçamento de tokens (tokens_estimados) e candidatos buscados por trecho pedido
+    CONTEXT_TOKEN_BUDGET = int(os.environ.get("PF_RAG_CONTEXT_TOKENS", 3000))
+    CONTEXT_OVERFETCH = int(os.environ.get("PF_RAG_CONTEXT_OVERFETCH", 2))
+    # Expansão hierárquica dos trechos (caput do pai, incisos vizinhos): tokens extras por pergunta
+    CONTEXT_EXPAND_TOKENS = int(os.environ.get("PF_RAG_EXPAND_TOKENS", 600))
     CACHE_LRU_SIZE = 50
+    # Resultados da busca híbrida em memória (consulta, top_k, filtros, geração do índice)
+    RETRIEVAL_CACHE_SIZE = int(os.environ.get("PF_RAG_RETRIEVAL_CACHE", CACHE_LRU_SIZE))
+    # Serviço assíncrono de consultas: tempo limite por requisição (s) e gerações simultâneas no LLM
+    QUERY_TIMEOUT = float(os.environ.get("PF_RAG_QUERY_TIMEOUT", 120))
+    LLM_MAX_CONCURRENCY = int(os.environ.get("PF_RAG_LLM_CONCURRENCY", OLLAMA_MAX_CONCURRENCY))
+    # Servidor local de consultas (índice, BM25 e caches aquecidos); vazio = cada processo carrega o seu
+    QUERY_SERVER_URL = os.environ.get("PF_RAG_QUERY_SERVER", "http://127.0.0.1:8765")
+    # Workers (pre-fork) do servidor, intervalo (s) de checagem da geração do índice (0 desativa)
+    # e FAISS mapeado em memória (páginas compartilhadas entre processos)
+    QUERY_WORKERS = int(os.environ.get("PF_RAG_QUERY_WORKERS", 1))
+    QUERY_RELOAD_INTERVAL = float(os.environ.get("PF_RAG_QUERY_RELOAD_INTERVAL", 2))
+    FAISS_MMAP = os.environ.get("PF_RAG_FAISS_MMAP", "true").lower() == "true"
+    # Cache de respostas: máximo de entradas (LRU) e validade em horas (0 = sem expiração)
+    CACHE_MAX_ENTRIES = int(os.environ.get("PF_RAG_CACHE_MAX", 10000))
+    CACHE_TTL_HOURS = float(os.environ.get("PF_RAG_CACHE_TTL_HOURS", 720))
+    # Cache semântico de respostas: similaridade mínima (cosseno) e perguntas indexadas
+    SEMANTIC_CACHE_ENABLED = os.environ.get("PF_RAG_SEMANTIC_CACHE", "true").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("PF_RAG_SEMANTIC_CACHE_THRESHOLD", 0.92))
+    SEMANTIC_CACHE_MAX = int(os.environ.get("PF_RAG_SEMANTIC_CACHE_MAX", 5000))
 
     # Pipeline PF RAG
     TOKEN_TARGET_MIN = int(os.environ.get("PF_RAG_TOKEN_MIN", 400))
     TOKEN_TARGET_MAX = int(os.environ.get("PF_RAG_TOKEN_MAX", 1200))
     OCR_ENABLED = os.environ.get("PF_RAG_OCR_ENABLED", "true").lower() == "true"
     OCR_LANG = os.environ.get("PF_RAG_OCR_LANG", "por")
-    EMBEDDING_BACKEND = os.environ.get("PF_RAG_EMBED_BACKEND", "ollama").lower()  # ollama | sbert
+    # OCR seletivo por página: DPI de rasterização, processos do pool e mínimo de caracteres úteis
+    OCR_DPI = int(os.environ.get("PF_RAG_OCR_DPI", 300))
+    OCR_WORKERS = int(os.environ.get("PF_RAG_OCR_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+    OCR_MIN_CHARS = int(os.environ.get("PF_RAG_OCR_MIN_CHARS", 25))
+    # pdfminer por faixas de páginas em processos para PDFs grandes (0 desativa)
+    PDFMINER_PARALLEL_MIN_PAGES = int(os.environ.get("PF_RAG_PDFMINER_PARALLEL_PAGES", 200))
+    PDFMINER_WORKERS = int(os.environ.get("PF_RAG_PDFMINER_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+    # Cabeçalhos/rodapés: linhas examinadas no topo/base de cada página e fração mínima de páginas
+    HF_SCAN_LINES = int(os.environ.get("PF_RAG_HF_LINES", 3))
+    HF_MIN_RATIO = float(os.environ.get("PF_RAG_HF_RATIO", 0.5))
+    EMBEDDING_BACKEND = os.environ.get("PF_RAG_EMBED_BACKEND", "ollama").lower()  # ollama | sbert | onnx
+    SBERT_MODEL = os.environ.get("PF_RAG_SBERT_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+    # Backend onnx: modelo SBERT exportado/quantizado (int8) nesta pasta, threads de inferência,
+    # textos por lote (agrupados por tamanho) e limite de tokens por texto
+    ONNX_DIR = os.environ.get("PF_RAG_ONNX_DIR", "models/onnx")
+    ONNX_THREADS = int(os.environ.get("PF_RAG_ONNX_THREADS", os.cpu_count() or 4))
+    ONNX_BATCH = int(os.environ.get("PF_RAG_ONNX_BATCH", 32))
+    ONNX_MAX_LENGTH = int(os.environ.get("PF_RAG_ONNX_MAX_LENGTH", 128))
     BM25_ENABLED = os.environ.get("PF_RAG_BM25_ENABLED", "true").lower() == "true"
     VECTOR_INDEX_NAME = os.environ.get("PF_RAG_INDEX_NAME", "pf_normativos")
     VECTOR_DB_BACKEND = os.environ.get("PF_RAG_VECTOR_DB", "qdrant").lower()  # faiss | qdrant | chroma (futuro)
     QDRANT_COLLECTION = os.environ.get("PF_RAG_QDRANT_COLLECTION", VECTOR_INDEX_NAME)
     EMBED_BATCH_SIZE = int(os.environ.get("PF_RAG_EMBED_BATCH", 64))
+    # Agendador de embeddings: lotes simultâneos, faixa adaptativa do lote, teto de tokens
+    # por lote e latência-alvo (s) usada para crescer/encolher o lote
+    EMBED_IN_FLIGHT = int(os.environ.get("PF_RAG_EMBED_IN_FLIGHT", 4))
+    EMBED_BATCH_MIN = int(os.environ.get("PF_RAG_EMBED_BATCH_MIN", 8))
+    EMBED_BATCH_MAX = int(os.environ.get("PF_RAG_EMBED_BATCH_MAX", 256))
+    EMBED_BATCH_TOKENS = int(os.environ.get("PF_RAG_EMBED_BATCH_TOKENS", 16384))
+    EMBED_TARGET_LATENCY = float(os.environ.get("PF_RAG_EMBED_TARGET_LATENCY", 2.0))
+    # Cache LRU dos vetores de consulta (0 desativa) e validade das entradas em segundos (0 = sem expiração)
+    QUERY_EMBED_CACHE_SIZE = int(os.environ.get("PF_RAG_QUERY_EMBED_CACHE", 1024))
+    QUERY_EMBED_CACHE_TTL = float(os.environ.get("PF_RAG_QUERY_EMBED_TTL", 3600))
     VERBOSE = os.environ.get("PF_RAG_VERBOSE", "true").lower() == "true"
+    # Métricas por etapa (GET /metrics no servidor de consultas) e log JSON dos spans
+    # (arquivo .jsonl ou "-" para stderr; vazio desativa)
+    METRICS_ENABLED = os.environ.get("PF_RAG_METRICS", "true").lower() == "true"
+    TRACE_LOG = os.environ.get("PF_RAG_TRACE_LOG", "")
+    # Servidor com workers: pasta dos snapshots de métricas por processo (vazio = temporária)
+    # e intervalo (s) de gravação do snapshot de cada worker
+    METRICS_DIR = os.environ.get("PF_RAG_METRICS_DIR", "")
+    METRICS_FLUSH_INTERVAL = float(os.environ.get("PF_RAG_METRICS_FLUSH_INTERVAL", 5))
     DOCLING_ENABLED = os.environ.get("PF_RAG_USE_DOCLING", "true").lower() == "true"
+    # Tempo máximo de conversão Docling por página (s); excedido, o documento vai para pdfminer. 0 desativa
+    DOCLING_PAGE_TIMEOUT = float(os.environ.get("PF_RAG_DOCLING_PAGE_TIMEOUT", 10))
 
     # Modo offline por padrão: impede downloads remotos de modelos (ex.: sentence-transformers)
     OFFLINE_MODE = os.environ.get("PF_RAG_OFFLINE", "true").lower() == "true"
@@ -0,0 +1,230 @@
+"""
+Serviço assíncrono de consultas RAG
+
+Várias perguntas em andamento no mesmo processo sem fila única: etapas bloqueantes
+(cache de respostas, embedding + busca densa, BM25) rodam em threads e, quando
+independentes, ao mesmo tempo; o LLM é chamado de forma assíncrona com limite de
+gerações simultâneas. Cada requisição tem seu próprio tempo limite.
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from ..config.settings import Settings
+from ..pf_rag.context import pack_context
+from ..services.llm_timings import LLMTimings
+from ..utils.telemetry import record, span
+
+
+class AsyncRAGService:
+    """Coroutines answer/search/stream sobre um RAGService já inicializado"""
+
+    def __init__(self, service=None, timeout: Optional[float] = None,
+                 llm_concurrency: Optional[int] = None):
+        if service is None:
+            from .rag_service import RAGService
+            service = RAGService()
+        self.service = service
+        self.timeout = timeout if timeout is not None else Settings.QUERY_TIMEOUT
+        self.llm_concurrency = max(1, llm_concurrency or Settings.LLM_MAX_CONCURRENCY)
+        # Criado no primeiro uso, dentro do loop que atende as requisições
+        self._llm_slots: Optional[asyncio.Semaphore] = None
+
+    def _slots(self) -> asyncio.Semaphore:
+        if self._llm_slots is None:
+            self._llm_slots = asyncio.Semaphore(self.llm_concurrency)
+        return self._llm_slots
+
+    def _deadline(self, timeout: Optional[float]) -> float:
+        return time.monotonic() + (timeout if timeout is not None else self.timeout)
+
+    @staticmethod
+    def _remaining(deadline: float) -> float:
+        restante = deadline - time.monotonic()
+        if restante <= 0:
+            raise asyncio.TimeoutError()
+        return restante
+
+    async def _until(self, deadline: float, factory):
+        """Aguarda factory() até o prazo da requisição (o awaitable só é criado dentro do prazo)"""
+        restante = self._remaining(deadline)
+        return await asyncio.wait_for(factory(), restante)
+
+    async def _acquire(self, deadline: float) -> None:
+        """Vaga no LLM até o prazo; sem vaga, a tentativa liberada pelo disjuntor é devolvida"""
+        try:
+            await self._until(deadline, self._slots().acquire)
+        except BaseException:
+            self.service._release_probe()
+            raise
+
+    async def _retrieve(self, pergunta: str, top_k: Optional[int],
+                        filters: Optional[Dict[str, Any]] = None) -> List[Tuple[Any, float]]:
+        """Busca híbrida com as pernas densa (embedding + vetor) e BM25 em paralelo"""
+        searcher = self.service.searcher
+        k = top_k or Settings.RETRIEVAL_K
+        cached = searcher.cached(pergunta, k, filters)
+        if cached is not None:
+            return cached
+        n = k * 3
+        docs_dense, docs_sparse = await asyncio.gather(
+            asyncio.to_thread(searcher.dense, pergunta, n, filters),
+            asyncio.to_thread(searcher.sparse, pergunta, n, filters),
+        )
+        results = searcher.fuse(pergunta, docs_dense, docs_sparse, k)
+        searcher.remember(pergunta, k, filters, results)
+        return results
+
+    async def _prepare(self, pergunta: str, top_k: Optional[int]) -> Tuple[Optional[str], List[Any]]:
+        """Consulta ao cache de respostas e busca dos trechos, ao mesmo tempo"""
+        k = (top_k or Settings.RETRIEVAL_K) * Settings.CONTEXT_OVERFETCH
+        resposta_cache, results = await asyncio.gather(
+            asyncio.to_thread(self.service._cached_answer, pergunta),
+            self._retrieve(pergunta, k),
+        )
+        searcher = self.service.searcher
+        with span("query.context", candidatos=len(results)):
+            docs = searcher.expand([doc for doc, _ in results])
+            return resposta_cache, pack_context(docs, lookup=searcher.lookup)
+
+    async def search(self, pergunta: str, top_k: Optional[int] = None,
+                     filters: Optional[Dict[str, Any]] = None,
+                     timeout: Optional[float] = None) -> List[Tuple[Any, float]]:
+        """Trechos (documento, score) da busca híbrida; lista vazia no tempo limite"""
+        try:
+            return await self._until(
+                self._deadline(timeout), lambda: self._retrieve(pergunta, top_k, filters)
+            )
+        except asyncio.TimeoutError:
+            print("⏱️ Tempo limite excedido na busca")
+            return []
+
+    async def answer(self, pergunta: str, top_k: Optional[int] = None,
+                     timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Resposta completa: {"result": texto ou None, "source_documents": trechos usados,
+        "stats": tempos do Ollama}. result é None em falha do Ollama, circuito aberto ou
+        tempo limite.
+        """
+        deadline = self._deadline(timeout)
+        docs: List[Any] = []
+        # Geração do índice antes da busca: a resposta fica carimbada com ela no cache
+        geracao = self.service.searcher.generation
+        try:
+            resposta_cache, docs = await self._until(deadline, lambda: self._prepare(pergunta, top_k))
+            if resposta_cache:
+                return {"result": resposta_cache, "source_documents": docs}
+            if not self.service._circuit_allows():
+                return {"result": None, "source_documents": docs}
+
+            prompt = self.service._build_prompt(pergunta, docs)
+            tempos = LLMTimings()
+            # A espera por uma vaga no LLM também conta no tempo limite
+            await self._acquire(deadline)
+            try:
+                with span("query.llm"):
+                    resposta = await self._until(
+                        deadline, lambda: self.service.llm.ainvoke(prompt, config={"callbacks": [tempos]})
+                    )
+            except asyncio.TimeoutError:
+                self.service._record_timeout()
+                raise
+            except asyncio.CancelledError:
+                self.service._release_probe()
+                raise
+            finally:
+                self._slots().release()
+        except asyncio.TimeoutError:
+            print("⏱️ Tempo limite excedido ao responder a pergunta")
+            return {"result": None, "source_documents": docs}
+        except Exception as e:
+            self.service._record_error(e)
+            return {"result": None, "source_documents": docs}
+
+        self.service._record_success()
+        await asyncio.to_thread(
+            self.service.cache.save_response, pergunta, resposta, self.service._fontes(docs), geracao
+        )
+        return {"result": resposta, "source_documents": docs, "stats": tempos.stats}
+
+    async def stream(self, pergunta: str, top_k: Optional[int] = None,
+                     sources: Optional[List[Any]] = None, stats: Optional[Dict[str, float]] = None,
+                     timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Trechos da resposta à medida que o LLM gera. `sources` recebe os documentos de
+        contexto e `stats` as métricas desta requisição (ttft_s, total_s, chunks e os
+        tempos do Ollama: prompt_eval_s x eval_s).
+        No tempo limite ou em falha do LLM o stream termina, stats["error"] recebe o
+        código ("TIMEOUT", ...) e a resposta parcial não vai para o cache.
+        """
+        t0 = time.time()
+        deadline = self._deadline(timeout)
+        stats = stats if stats is not None else {}
+        geracao = self.service.searcher.generation
+        try:
+            resposta_cache, docs = await self._until(deadline, lambda: self._prepare(pergunta, top_k))
+        except asyncio.TimeoutError:
+            print("⏱️ Tempo limite excedido na busca")
+            stats["error"] = "TIMEOUT"
+            return
+        if sources is not None:
+            sources.extend(docs)
+        if resposta_cache:
+            stats.update({"ttft_s": time.time() - t0, "total_s": time.time() - t0, "chunks": 1})
+            yield resposta_cache
+            return
+        if not self.service._circuit_allows():
+            return
+
+        partes: List[str] = []
+        prompt = self.service._build_prompt(pergunta, docs)
+        gerador = None
+        tempos = LLMTimings()
+        try:
+            await self._acquire(deadline)
+        except asyncio.TimeoutError:
+            print("⏱️ Tempo limite excedido aguardando o LLM")
+            stats["error"] = "TIMEOUT"
+            return
+        t_llm = time.time()
+        try:
+            gerador = self.service.llm.astream(prompt, config={"callbacks": [tempos]}).__aiter__()
+            while True:
+                try:
+                    trecho = await self._until(deadline, gerador.__anext__)
+                except StopAsyncIteration:
+                    break
+                if not partes:
+                    stats["ttft_s"] = time.time() - t0
+                    record("query.first_token", stats["ttft_s"])
+                partes.append(trecho)
+                yield trecho
+        except asyncio.TimeoutError:
+            self.service._record_timeout()
+            print("⏱️ Tempo limite excedido durante a geração")
+            stats["error"] = "TIMEOUT"
+            return
+        except Exception as e:
+            stats["error"] = self.service._record_error(e)
+            return
+        except GeneratorExit:
+            # Consumidor abandonou o stream: o Ollama respondeu, libera o disjuntor
+            self.service._record_success()
+            raise
+        except asyncio.CancelledError:
+            self.service._release_probe()
+            raise
+        finally:
+            self._slots().release()
+            if gerador is not None and hasattr(gerador, "aclose"):
+                await gerador.aclose()
+
+        self.service._record_success()
+        record("query.llm", time.time() - t_llm, chunks=len(partes))
+        stats.update({"total_s": time.time() - t0, "chunks": len(partes)})
+        stats.update(tempos.stats)
+        resposta = "".join(partes)
+        if resposta:
+            await asyncio.to_thread(
+                self.service.cache.save_response, pergunta, resposta, self.service._fontes(docs), geracao
+            )
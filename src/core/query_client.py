@@ -0,0 +1,133 @@
+"""
+Cliente do servidor local de consultas
+
+Só biblioteca padrão: main.py, a CLI e o Streamlit falam com o processo que mantém o
+índice aquecido sem carregar embeddings, vector store ou LangChain.
+"""
+import json
+import time
+import urllib.request
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ..config.settings import Settings
+
+# Tempo máximo para descobrir se o servidor está no ar (conexão local)
+_HEALTH_TIMEOUT = 0.5
+
+
+@dataclass
+class RemoteDocument:
+    """Trecho devolvido pelo servidor (mesmos atributos usados de um Document LangChain)"""
+    page_content: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+def doc_to_dict(doc: Any, score: Optional[float] = None) -> Dict[str, Any]:
+    item = {"page_content": doc.page_content, "metadata": dict(doc.metadata or {})}
+    if score is not None:
+        item["score"] = score
+    return item
+
+
+def dict_to_doc(item: Dict[str, Any]) -> RemoteDocument:
+    return RemoteDocument(item.get("page_content", ""), item.get("metadata") or {})
+
+
+class QueryClient:
+    """Cliente HTTP com a mesma interface de consulta do RAGService (stream_answer/answer)"""
+
+    def __init__(self, url: Optional[str] = None, timeout: Optional[float] = None):
+        self.url = (url if url is not None else Settings.QUERY_SERVER_URL).rstrip("/")
+        self.timeout = timeout if timeout is not None else Settings.QUERY_TIMEOUT
+
+    def _request(self, endpoint: str, payload: Optional[Dict[str, Any]] = None,
+                 timeout: Optional[float] = None):
+        data = None
+        headers = {}
+        if payload is not None:
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        req = urllib.request.Request(self.url + endpoint, data=data, headers=headers,
+                                     method="POST" if data is not None else "GET")
+        return urllib.request.urlopen(req, timeout=timeout or self.timeout)
+
+    def _json(self, endpoint: str, payload: Optional[Dict[str, Any]] = None,
+              timeout: Optional[float] = None) -> Dict[str, Any]:
+        with self._request(endpoint, payload, timeout) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+
+    def health(self) -> Optional[Dict[str, Any]]:
+        """Estado do servidor ou None se não houver servidor no endereço configurado"""
+        if not self.url:
+            return None
+        try:
+            return self._json("/health", timeout=_HEALTH_TIMEOUT)
+        except (OSError, ValueError):
+            return None
+
+    def available(self) -> bool:
+        return self.health() is not None
+
+    def search(self, pergunta: str, top_k: int = 5,
+               filters: Optional[Dict[str, Any]] = None) -> List[Tuple[RemoteDocument, float]]:
+        dados = self._json("/search", {"q": pergunta, "top_k": top_k, "filters": filters})
+        return [(dict_to_doc(item), item.get("score", 0.0)) for item in dados.get("results", [])]
+
+    def answer(self, pergunta: str, top_k: Optional[int] = None) -> Dict[str, Any]:
+        """{"result": resposta ou None, "source_documents": trechos usados}"""
+        dados = self._json("/answer", {"q": pergunta, "top_k": top_k})
+        return {"result": dados.get("result"),
+                "source_documents": [dict_to_doc(item) for item in dados.get("sources", [])]}
+
+    def answer_question(self, pergunta: str, top_k: Optional[int] = None) -> Optional[str]:
+        try:
+            return self.answer(pergunta, top_k)["result"]
+        except OSError as e:
+            print(f"❌ Servidor de consultas indisponível: {e}")
+            return None
+
+    def stream_answer(self, pergunta: str, top_k: Optional[int] = None,
+                      sources: Optional[List[Any]] = None,
+                      stats: Optional[Dict[str, float]] = None) -> Iterator[str]:
+        """
+        Trechos da resposta à medida que o servidor os recebe do LLM (NDJSON).
+        Se `sources` for informado, recebe os documentos usados como contexto; `stats`
+        recebe as métricas desta chamada (ttft_s, total_s, chunks) e "error" quando a
+        resposta vem truncada (falha do LLM no servidor ou servidor inacessível).
+        """
+        t0 = time.time()
+        stats = {} if stats is None else stats
+        try:
+            with self._request("/stream", {"q": pergunta, "top_k": top_k}) as resp:
+                for linha in resp:
+                    if not linha.strip():
+                        continue
+                    evento = json.loads(linha.decode("utf-8"))
+                    if "sources" in evento:
+                        if sources is not None:
+                            sources.extend(dict_to_doc(item) for item in evento["sources"])
+                    elif "token" in evento:
+                        if "ttft_s" not in stats:
+                            stats["ttft_s"] = time.time() - t0
+                        yield evento["token"]
+                    elif "error" in evento:
+                        stats["error"] = evento["error"]
+                    elif evento.get("done"):
+                        # ttft/total medidos aqui (incluem a rede); o servidor completa o resto
+                        for chave, valor in (evento.get("stats") or {}).items():
+                            stats.setdefault(chave, valor)
+                        stats["total_s"] = time.time() - t0
+        except (OSError, ValueError) as e:
+            print(f"❌ Servidor de consultas indisponível: {e}")
+            stats["error"] = "CONNECTION_REFUSED"
+
+    def reload(self) -> Dict[str, Any]:
+        """Pede ao servidor que recarregue o índice do disco (após reindexação)"""
+        return self._json("/reload", {})
+
+
+def get_query_client() -> Optional[QueryClient]:
+    """Cliente do servidor configurado, se ele estiver no ar"""
+    client = QueryClient()
+    return client if client.available() else None
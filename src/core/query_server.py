@@ -0,0 +1,352 @@
+"""
+Servidor local de consultas RAG
+
+Processo de longa duração que mantém embeddings, índice vetorial, BM25 e caches
+carregados; main.py, a CLI e o Streamlit viram clientes finos (src/core/query_client.py).
+
+Endpoints (JSON):
+    GET  /health   estado do servidor e geração do índice
+    GET  /metrics  métricas por etapa no formato texto do Prometheus (src/utils/telemetry.py)
+    POST /search   {"q", "top_k", "filters"} -> {"results": [{page_content, metadata, score}]}
+    POST /answer   {"q", "top_k"} -> {"result", "sources"}
+    POST /stream   {"q", "top_k"} -> NDJSON: {"sources"}, {"token"}..., [{"error"}], {"done", "stats"}
+    POST /reload   recarrega do disco o índice gravado por uma reindexação
+
+Com --workers N (POSIX) o processo pai carrega tudo uma vez e cria N workers por fork
+sobre o mesmo socket: índice FAISS, chunks e postings BM25 (src/pf_rag/chunk_store.py)
+são lidos de arquivos mapeados em memória, com as páginas compartilhadas, sem cópia por worker. Cada worker acompanha a geração do índice
+e troca de Searcher quando uma reindexação a avança, sem reiniciar.
+
+Uso: python -m src.core.query_server [--host 127.0.0.1] [--port 8765] [--workers 4]
+"""
+import asyncio
+import gc
+import json
+import math
+import os
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Union
+from urllib.parse import urlparse
+
+from ..config.settings import Settings
+from ..utils.index_generation import IndexGeneration
+from ..utils.telemetry import (enable_multiprocess, exposition, flush_periodically, metrics, multiprocess_dir,
+                               reset_after_fork, span)
+from .async_rag_service import AsyncRAGService
+from .query_client import doc_to_dict
+
+
+def _positivo(valor: Any, tipo: type) -> Optional[Union[int, float]]:
+    """top_k/timeout do corpo JSON: número positivo (aceita "5"); None se ausente; ValueError se inválido"""
+    if valor is None:
+        return None
+    if isinstance(valor, bool):
+        raise ValueError(valor)
+    numero = float(valor)
+    if not math.isfinite(numero) or numero <= 0 or (tipo is int and not numero.is_integer()):
+        raise ValueError(valor)
+    return tipo(numero)
+
+
+class QueryServer(ThreadingHTTPServer):
+    """
+    Uma thread por conexão HTTP; as coroutines do AsyncRAGService rodam em um único
+    loop asyncio em segundo plano, onde ficam o limite de gerações e os prazos.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, rag: AsyncRAGService, host: str = "127.0.0.1", port: int = 8765,
+                 generation: Optional[IndexGeneration] = None):
+        super().__init__((host, port), QueryHandler)
+        self.rag = rag
+        self.generation = generation or IndexGeneration()
+        # Loop e threads nascem em serve_forever: em modo pre-fork, já dentro de cada worker
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._watch_stop = threading.Event()
+        self._reload_lock = threading.Lock()
+
+    def serve_forever(self, poll_interval: float = 0.5) -> None:
+        self.loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self.loop.run_forever, name="pf-rag-query-loop", daemon=True)
+        self._loop_thread.start()
+        if Settings.QUERY_RELOAD_INTERVAL > 0:
+            threading.Thread(target=self._watch_generation, name="pf-rag-generation", daemon=True).start()
+        if multiprocess_dir():
+            threading.Thread(target=flush_periodically, args=(self._watch_stop,),
+                             name="pf-rag-metrics", daemon=True).start()
+        super().serve_forever(poll_interval)
+
+    def run(self, coro) -> Any:
+        """Executa a coroutine no loop do servidor e aguarda o resultado na thread da conexão"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def reload(self) -> Dict[str, Any]:
+        with self._reload_lock:
+            ok = self.rag.service.reload_database()
+        return {"reloaded": ok, "geracao": self.rag.service.searcher.generation}
+
+    def check_generation(self) -> bool:
+        """
+        Recarrega o índice se uma reindexação avançou a geração. A troca é atômica para
+        as requisições: cada uma usa o Searcher que leu ao começar; as novas já pegam o novo.
+        """
+        if self.generation.current() == self.rag.service.searcher.generation:
+            return False
+        resultado = self.reload()
+        if resultado["reloaded"]:
+            print(f"🔁 [{os.getpid()}] Índice recarregado (geração {resultado['geracao']})")
+        return resultado["reloaded"]
+
+    def _watch_generation(self) -> None:
+        while not self._watch_stop.wait(Settings.QUERY_RELOAD_INTERVAL):
+            try:
+                self.check_generation()
+            except Exception as e:
+                print(f"⚠️ Falha ao recarregar índice: {e}")
+
+    def health(self) -> Dict[str, Any]:
+        service = self.rag.service
+        ollama, _ = service.health.status()
+        dados = {"status": "ok", "geracao": service.searcher.generation, "ollama": bool(ollama)}
+        embeddings = getattr(getattr(service, "document_service", None), "embeddings", None)
+        if hasattr(embeddings, "stats"):
+            dados["embed_cache"] = embeddings.stats()
+        return dados
+
+    def server_close(self) -> None:
+        super().server_close()
+        self._watch_stop.set()
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._loop_thread.join(timeout=5)
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: QueryServer
+
+    def log_message(self, format: str, *args) -> None:
+        if Settings.VERBOSE:
+            super().log_message(format, *args)
+
+    def _send_json(self, dados: Dict[str, Any], status: int = 200) -> None:
+        corpo = json.dumps(dados, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _send_text(self, texto: str, content_type: str) -> None:
+        corpo = texto.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _read_json(self) -> Optional[Dict[str, Any]]:
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        try:
+            dados = json.loads(self.rfile.read(tamanho) or b"{}")
+        except ValueError:
+            return None
+        return dados if isinstance(dados, dict) else None
+
+    def do_GET(self) -> None:
+        endpoint = urlparse(self.path).path
+        if endpoint == "/health":
+            self._send_json(self.server.health())
+        elif endpoint == "/metrics":
+            self._send_text(exposition(), "text/plain; version=0.0.4; charset=utf-8")
+        else:
+            self._send_json({"error": "endpoint não encontrado"}, 404)
+
+    def do_POST(self) -> None:
+        endpoint = urlparse(self.path).path
+        dados = self._read_json()
+        if dados is None:
+            self._send_json({"error": "JSON inválido"}, 400)
+            return
+        if endpoint == "/reload":
+            self._send_json(self.server.reload())
+            return
+        pergunta = str(dados.get("q") or "").strip()
+        if endpoint not in ("/search", "/answer", "/stream"):
+            self._send_json({"error": "endpoint não encontrado"}, 404)
+            return
+        if not pergunta:
+            self._send_json({"error": "informe 'q' com a pergunta"}, 400)
+            return
+        try:
+            top_k = _positivo(dados.get("top_k"), int)
+            timeout = _positivo(dados.get("timeout"), float)
+        except (TypeError, ValueError):
+            self._send_json({"error": "'top_k' e 'timeout' devem ser números positivos"}, 400)
+            return
+        if dados.get("filters") is not None and not isinstance(dados["filters"], dict):
+            self._send_json({"error": "'filters' deve ser um objeto"}, 400)
+            return
+        metrics.inc("pf_rag_requests_total", endpoint=endpoint)
+        with span("http" + endpoint.replace("/", ".")):
+            self._dispatch(endpoint, pergunta, dados, top_k, timeout)
+
+    def _dispatch(self, endpoint: str, pergunta: str, dados: Dict[str, Any],
+                  top_k: Optional[int], timeout: Optional[float]) -> None:
+        rag = self.server.rag
+
+        if endpoint == "/search":
+            resultados = self.server.run(rag.search(pergunta, top_k=top_k, filters=dados.get("filters"), timeout=timeout))
+            self._send_json({"results": [doc_to_dict(doc, score) for doc, score in resultados]})
+        elif endpoint == "/answer":
+            resposta = self.server.run(rag.answer(pergunta, top_k=top_k, timeout=timeout))
+            self._send_json({"result": resposta["result"], "stats": resposta.get("stats") or {},
+                             "sources": [doc_to_dict(d) for d in resposta["source_documents"]]})
+        else:
+            self._stream(pergunta, top_k, timeout)
+
+    def _write_chunk(self, evento: Dict[str, Any]) -> None:
+        linha = (json.dumps(evento, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(linha):x}\r\n".encode("ascii") + linha + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, pergunta: str, top_k: Optional[int], timeout: Optional[float]) -> None:
+        """NDJSON com transferência em partes: cada token sai assim que o LLM o produz"""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        sources, stats = [], {}
+        gerador = self.server.rag.stream(pergunta, top_k=top_k, sources=sources, stats=stats, timeout=timeout)
+        enviou_fontes = False
+        try:
+            while True:
+                try:
+                    trecho = self.server.run(gerador.__anext__())
+                except StopAsyncIteration:
+                    break
+                if not enviou_fontes:
+                    self._write_chunk({"sources": [doc_to_dict(d) for d in sources]})
+                    enviou_fontes = True
+                self._write_chunk({"token": trecho})
+            if not enviou_fontes:
+                self._write_chunk({"sources": [doc_to_dict(d) for d in sources]})
+            if "error" in stats:
+                # Resposta truncada (falha ou tempo limite no LLM): o cliente precisa saber
+                self._write_chunk({"error": stats["error"]})
+            self._write_chunk({"done": True, "stats": stats})
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Cliente desistiu: encerra a geração no LLM
+            self.server.run(gerador.aclose())
+            self.close_connection = True
+
+
+def serve(host: Optional[str] = None, port: Optional[int] = None, workers: Optional[int] = None) -> None:
+    """Carrega o RAGService uma vez e atende consultas até Ctrl+C"""
+    padrao = urlparse(Settings.QUERY_SERVER_URL or "http://127.0.0.1:8765")
+    host = host or padrao.hostname or "127.0.0.1"
+    port = port or padrao.port or 8765
+    workers = max(1, workers or Settings.QUERY_WORKERS)
+    if workers > 1 and not hasattr(os, "fork"):
+        print("⚠️ Workers múltiplos exigem fork (Linux/macOS); usando um processo")
+        workers = 1
+    if workers > 1 and Settings.VECTOR_DB_BACKEND == "qdrant":
+        # Qdrant embarcado não aceita o mesmo armazenamento aberto em vários processos
+        print("⚠️ Workers múltiplos exigem PF_RAG_VECTOR_DB=faiss; usando um processo")
+        workers = 1
+
+    from .rag_service import RAGService
+
+    # Com workers, o pai aquece o modelo de forma síncrona e não inicia threads antes do fork
+    server = QueryServer(AsyncRAGService(RAGService(prefork=workers > 1)), host, port)
+    print(f"🌐 Servidor de consultas em http://{host}:{port} ({workers} worker(s); Ctrl+C para encerrar)")
+    if workers == 1:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n👋 Servidor encerrado")
+        finally:
+            server.server_close()
+        return
+    _serve_prefork(server, workers)
+
+
+def _fork_worker(server: QueryServer) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    # Filho: atende no socket herdado até ser encerrado
+    codigo = 0
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        reset_after_fork()
+        server.rag.service.after_fork()
+        server.generation.reset_connections()
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"❌ [{os.getpid()}] Worker encerrado: {e}")
+        codigo = 1
+    finally:
+        os._exit(codigo)
+
+
+def _serve_prefork(server: QueryServer, workers: int) -> None:
+    """
+    Pai supervisiona: cria os workers, repõe os que morrerem e encerra todos no Ctrl+C
+    ou no SIGTERM (systemd, docker stop, kill), sem deixar workers órfãos no socket
+    """
+    # Métricas somadas entre os workers (snapshots em pasta comum), seja qual for o que responde
+    enable_multiprocess()
+    # Objetos carregados até aqui saem do alcance do GC: contagem/varredura não suja as
+    # páginas compartilhadas (copy-on-write) entre os workers
+    gc.collect()
+    gc.freeze()
+    # SIGTERM no pai segue o caminho do Ctrl+C; os workers voltam ao padrão em _fork_worker
+    anterior = signal.signal(signal.SIGTERM, _raise_interrupt)
+    filhos = {_fork_worker(server) for _ in range(workers)}
+    try:
+        while True:
+            pid, _ = os.wait()
+            filhos.discard(pid)
+            print(f"⚠️ Worker {pid} terminou; iniciando outro")
+            time.sleep(1)
+            filhos.add(_fork_worker(server))
+    except KeyboardInterrupt:
+        print("\n👋 Servidor encerrado")
+    finally:
+        for pid in filhos:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in filhos:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        server.server_close()
+        signal.signal(signal.SIGTERM, anterior)
+
+
+def _raise_interrupt(signum, frame) -> None:
+    raise KeyboardInterrupt
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Servidor local de consultas RAG-PF (índice aquecido)")
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None, help="processos (pre-fork) atendendo no mesmo socket")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers)
@@ -2,24 +2,64 @@
 Serviço principal do sistema RAG
 """
 import sys
-from typing import Optional
-from langchain.chains import RetrievalQA
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Union
 from langchain_ollama import OllamaLLM
 from langchain.prompts import PromptTemplate
 
 from ..config.settings import Settings
 from ..utils.cache_utils import CacheUtils
 from ..services.document_service import DocumentService
-from ..services.ollama_service import OllamaService
+from ..pf_rag.search import Searcher
+from ..pf_rag.context import pack_context
+from ..pf_rag.retrieval_cache import RetrievalCache
+from ..services.ollama_client import get_transport, reset_transport
+from ..services.llm_timings import LLMTimings, format_timings
+from ..utils.telemetry import record, span
+from ..services.ollama_service import (
+    OllamaService, CircuitBreaker, CONNECTION_ERRORS, get_health_monitor
+)
+
+
+# Prefixo estático (instruções) antes do contexto: idêntico em toda pergunta, o Ollama
+# reaproveita do cache KV a avaliação dele e só processa contexto + pergunta
+PROMPT_PREFIX = """Use o contexto fornecido para responder à pergunta de forma precisa e específica.
+
+Instruções:
+- Responda apenas com base no contexto fornecido
+- Se a informação não estiver no contexto, diga "Informação não encontrada no contexto fornecido"
+- Seja específico e cite detalhes relevantes quando disponíveis
+- Mantenha a resposta clara e organizada
+
+"""
+
+PROMPT_TEMPLATE = PROMPT_PREFIX + """Contexto relevante:
+{context}
+
+Pergunta: {question}
+
+Resposta:"""
 
 
 class RAGService:
     """Serviço principal para consultas RAG"""
 
-    def __init__(self, progress_callback=None):
-        self.cache = CacheUtils()
+    def __init__(self, progress_callback=None, prefork: bool = False):
         self.document_service = DocumentService()
-        self.qa_chain = None
+        # Cache de respostas com camada semântica sobre os mesmos embeddings da base
+        self.cache = CacheUtils(embeddings=self.document_service.embeddings)
+        # Busca híbrida e cache de resultados compartilhados entre resposta e prévia de trechos
+        self.searcher: Optional[Searcher] = None
+        self.retrieval_cache = RetrievalCache()
+        self.llm = None
+        self.prompt = None
+        # Saúde do Ollama: status em cache (thread de fundo) e disjuntor nas chamadas
+        self.health = get_health_monitor()
+        self.breaker = CircuitBreaker()
+        # Pre-fork (servidor com workers): nenhuma thread no pai, que só carrega e faz fork;
+        # uma thread em voo no fork deixaria locks (transporte, monitor, stdout) presos nos filhos
+        self._prefork = prefork
         self._initialize_chain(progress_callback)
 
     def _initialize_chain(self, progress_callback=None):
@@ -32,54 +72,43 @@ class RAGService:
             print("❌ Falha ao carregar base de dados")
             sys.exit(1)
 
-        # Verifica conexão com Ollama para o LLM
-        conectado, erro = OllamaService.check_connection()
+        # Verifica conexão com Ollama uma única vez; depois o monitor segue em segundo plano
+        conectado, erro = self.health.refresh()
         if not conectado:
             print("❌ Ollama não está acessível")
             OllamaService.print_connection_error(erro)
             sys.exit(1)
         print("✅ Ollama conectado!")
+        if self._prefork:
+            # Aquecimento síncrono antes do fork; a thread de saúde nasce em cada worker (after_fork)
+            if Settings.LLM_WARMUP:
+                self._warm_llm()
+        else:
+            self.health.start()
+            if Settings.LLM_WARMUP:
+                # Modelo carregado e prefixo no cache KV antes da primeira pergunta, sem travar a inicialização
+                threading.Thread(target=self._warm_llm, name="ollama-warmup", daemon=True).start()
 
         # Cria chain RAG
         self._create_qa_chain(database)
 
     def _create_qa_chain(self, database):
-        """Cria a cadeia de perguntas e respostas"""
-        if hasattr(database, "as_retriever"):
-            retriever = database.as_retriever(search_kwargs={"k": Settings.RETRIEVAL_K})
-        else:
-            raise RuntimeError("Vector store não suporta 'as_retriever'.")
-
-        # Template de prompt otimizado
-        prompt_template = """Use o contexto fornecido para responder à pergunta de forma precisa e específica.
-
-Contexto relevante:
-{context}
-
-Pergunta: {question}
-
-Instruções:
-- Responda apenas com base no contexto fornecido
-- Se a informação não estiver no contexto, diga "Informação não encontrada no contexto fornecido"
-- Seja específico e cite detalhes relevantes quando disponíveis
-- Mantenha a resposta clara e organizada
-
-Resposta:"""
+        """Monta a cadeia de perguntas e respostas: busca híbrida, prompt e LLM"""
+        if not hasattr(database, "similarity_search"):
+            raise RuntimeError("Vector store não suporta 'similarity_search'.")
+        self.retrieval_cache.clear()
+        self.searcher = Searcher(database, cache=self.retrieval_cache, generation=self.cache.generation.current())
 
+        # Template de prompt otimizado: instruções fixas primeiro (prefixo reaproveitável)
         custom_prompt = PromptTemplate(
-            template=prompt_template,
+            template=PROMPT_TEMPLATE,
             input_variables=["context", "question"]
         )
 
-        llm = OllamaLLM(model=Settings.LLM_MODEL)
-
-        self.qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=retriever,
-            chain_type_kwargs={"prompt": custom_prompt},
-            return_source_documents=False
-        )
+        # keep_alive e num_ctx fixos: o mesmo modelo carregado atende todas as consultas
+        # answer_question/stream_answer usam retrieve(): a mesma busca alimenta o contexto e as fontes
+        self.llm = OllamaLLM(model=Settings.LLM_MODEL, keep_alive=Settings.LLM_KEEP_ALIVE, num_ctx=Settings.LLM_NUM_CTX)
+        self.prompt = custom_prompt
 
         print("✅ Sistema RAG inicializado com sucesso!")
 
@@ -90,48 +119,249 @@ Resposta:"""
             return
         self._create_qa_chain(self.document_service.database)
 
-    def answer_question(self, pergunta: str) -> Optional[str]:
-        """Responde uma pergunta usando o sistema RAG"""
-        # Tenta buscar no cache primeiro
+    def reload_database(self) -> bool:
+        """
+        Recarrega do disco o índice gravado por outra reindexação (CLI, Streamlit) e
+        reconstrói a cadeia; a camada semântica do cache volta a refletir o store.
+        """
+        database = self.document_service._load_existing_database()
+        if not database:
+            return False
+        self.document_service.database = database
+        self._create_qa_chain(database)
+        if self.cache.semantic is not None:
+            self.cache.semantic.clear()
+            self.cache.load_cache()
+        return True
+
+    def _warm_llm(self) -> None:
+        try:
+            get_transport().warm(Settings.LLM_MODEL, PROMPT_PREFIX, {"num_ctx": Settings.LLM_NUM_CTX},
+                                 keep_alive=Settings.LLM_KEEP_ALIVE)
+            if Settings.VERBOSE:
+                print(f"🔥 Modelo {Settings.LLM_MODEL} aquecido")
+        except Exception as e:
+            print(f"⚠️ Falha ao aquecer o modelo: {str(e)[:120]}")
+
+    def _record_timings(self, stats: Dict[str, float]) -> None:
+        if stats and Settings.VERBOSE:
+            print(format_timings(stats))
+
+    def after_fork(self) -> None:
+        """
+        Preparação do processo filho (worker pre-fork): índice, chunks e postings BM25
+        são arquivos mapeados, com as páginas compartilhadas com o pai; conexões
+        SQLite/HTTP e a thread de saúde são recriadas.
+        """
+        reset_transport()
+        self.cache.store.reset_connections()
+        self.cache.generation.reset_connections()
+        if self.searcher is not None:
+            self.searcher.reset_connections()
+        self.health.start()
+
+    def _cached_answer(self, pergunta: str, sources: Optional[List[Any]] = None,
+                       top_k: Optional[int] = None) -> Optional[str]:
+        """
+        Texto da resposta em cache. Se `sources` for informado, recebe os trechos que
+        geraram a resposta (anchor_ids gravados com ela), sem nova busca; entradas
+        antigas, gravadas sem a lista, recorrem à busca atual.
+        """
         resposta_cache = self.cache.get_cached_response(pergunta)
+        if not resposta_cache:
+            return None
+        print("⚡ Resposta do cache!")
+        if sources is not None:
+            fontes = resposta_cache.get("fontes") if isinstance(resposta_cache, dict) else None
+            sources.extend(self._docs_from_fontes(fontes) if fontes is not None else self.retrieve(pergunta, top_k))
+        # Se vier no formato {"resposta": "..."}, retorne apenas o texto
+        if isinstance(resposta_cache, dict) and "resposta" in resposta_cache:
+            return str(resposta_cache["resposta"]) if resposta_cache["resposta"] is not None else None
+        # Caso legacy, já seja string
+        return str(resposta_cache)
+
+    def _docs_from_fontes(self, fontes: List[str]) -> List[Any]:
+        """Chunks dos anchor_ids gravados, na ordem do contexto (o caput é derivado do pai)"""
+        docs = []
+        for anchor in fontes:
+            if anchor.endswith("#caput"):
+                pai = self.searcher.lookup(anchor[:-len("#caput")])
+                doc = self.searcher.caput(pai) if pai is not None else None
+            else:
+                doc = self.searcher.lookup(anchor)
+            if doc is not None:
+                docs.append(doc)
+        return docs
+
+    @staticmethod
+    def _fontes(docs) -> List[str]:
+        """anchor_ids dos chunks usados como contexto (marcação para invalidação do cache)"""
+        return [d.metadata["anchor_id"] for d in docs or [] if d.metadata.get("anchor_id")]
+
+    @staticmethod
+    def _print_error(e: Exception) -> None:
+        error_str = str(e)
+        print("❌ Erro ao processar pergunta:")
+
+        if "Connection refused" in error_str or "503" in error_str:
+            print("🔧 Ollama perdeu conexão durante consulta")
+            print("💡 Execute 'ollama serve' e tente novamente")
+        elif "proxy" in error_str.lower():
+            print("🌐 Bloqueio de proxy detectado")
+            print("💡 Configure bypass para localhost:11434")
+        else:
+            print(f"📝 Detalhes: {error_str[:150]}...")
+
+    def _circuit_allows(self) -> bool:
+        """Falha rápida enquanto o disjuntor estiver aberto (sem ida à rede)"""
+        if self.breaker.allow():
+            return True
+        _, erro = self.health.status()
+        print("❌ Ollama indisponível (circuito aberto); nova tentativa em instantes")
+        OllamaService.print_connection_error(erro)
+        return False
+
+    def _record_success(self) -> None:
+        self.breaker.record_success()
+        self.health.report(True, "OK")
+
+    def _record_timeout(self) -> None:
+        """Geração que estourou o tempo limite conta como falha do Ollama no disjuntor"""
+        self.breaker.record_failure()
+
+    def _release_probe(self) -> None:
+        """Liberado pelo disjuntor, mas sem chamada ao Ollama (fila do LLM, cancelamento)"""
+        self.breaker.release()
+
+    def _record_error(self, e: Exception) -> str:
+        """
+        Erro real da chamada alimenta disjuntor e monitor; demais erros não abrem o circuito.
+        Retorna o código do erro (o mesmo de check_connection).
+        """
+        codigo = OllamaService.classify_error(e)
+        if codigo in CONNECTION_ERRORS:
+            self.breaker.record_failure()
+            self.health.report(False, codigo)
+        else:
+            self.breaker.record_success()
+        self._print_error(e)
+        return codigo
+
+    def retrieve(self, pergunta: str, top_k: Optional[int] = None) -> List[Any]:
+        """
+        Busca híbrida única por pergunta: o mesmo resultado vira o contexto do LLM e as
+        fontes exibidas (repetições saem do cache de resultados). Os candidatos, com o
+        caput e os vizinhos de cada trecho, são empacotados no orçamento de tokens.
+        """
+        k = (top_k or Settings.RETRIEVAL_K) * Settings.CONTEXT_OVERFETCH
+        docs = self.searcher.query(pergunta, top_k=k)
+        with span("query.context", candidatos=len(docs)):
+            return pack_context(docs, lookup=self.searcher.lookup)
+
+    def _build_prompt(self, pergunta: str, docs: List[Any]) -> str:
+        contexto = "\n\n".join(d.page_content for d in docs)
+        return self.prompt.format(context=contexto, question=pergunta)
+
+    def answer_question(self, pergunta: str, top_k: Optional[int] = None,
+                        return_source_documents: bool = False) -> Union[Optional[str], Dict[str, Any]]:
+        """
+        Responde uma pergunta usando o sistema RAG.
+        Com return_source_documents=True retorna {"result": resposta, "source_documents": docs},
+        onde docs são os trechos entregues ao LLM (em respostas do cache, os gravados com ela).
+        """
+        def saida(resposta: Optional[str], docs: List[Any]):
+            if return_source_documents:
+                return {"result": resposta, "source_documents": docs}
+            return resposta
+
+        # Tenta buscar no cache primeiro
+        fontes: List[Any] = []
+        resposta_cache = self._cached_answer(pergunta, fontes if return_source_documents else None, top_k)
         if resposta_cache:
-            print("⚡ Resposta do cache!")
-            # Se vier no formato {"resposta": "..."}, retorne apenas o texto
-            if isinstance(resposta_cache, dict) and "resposta" in resposta_cache:
-                return str(resposta_cache["resposta"]) if resposta_cache["resposta"] is not None else None
-            # Caso legacy, já seja string
-            return str(resposta_cache)
+            return saida(resposta_cache, fontes)
+
+        if not self._circuit_allows():
+            return saida(None, [])
 
+        docs: List[Any] = []
         try:
             print("🔍 Buscando resposta...")
 
-            # Verifica conexão antes de consultar
-            conectado, erro = OllamaService.check_connection()
-            if not conectado:
-                print("❌ Conexão perdida com Ollama")
-                OllamaService.print_connection_error(erro)
-                return None
+            geracao = self.searcher.generation
+            docs = self.retrieve(pergunta, top_k)
+            # Falhas de conexão (embeddings da busca ou LLM) surgem aqui
+            tempos = LLMTimings()
+            with span("query.llm"):
+                resposta = self.llm.invoke(self._build_prompt(pergunta, docs), config={"callbacks": [tempos]})
+        except Exception as e:
+            self._record_error(e)
+            return saida(None, docs)
 
-            # Faz a consulta (API nova do LangChain)
-            out = self.qa_chain.invoke({"query": pergunta})
-            resposta = out["result"] if isinstance(out, dict) and "result" in out else str(out)
+        self._record_success()
+        self._record_timings(tempos.stats)
+        # Salva no cache
+        self.cache.save_response(pergunta, resposta, self._fontes(docs), geracao=geracao)
+        return saida(resposta, docs)
 
-            # Salva no cache
-            self.cache.save_response(pergunta, resposta)
+    def stream_answer(self, pergunta: str, top_k: Optional[int] = None,
+                      sources: Optional[List[Any]] = None,
+                      stats: Optional[Dict[str, float]] = None) -> Iterator[str]:
+        """
+        Responde em streaming: produz os trechos de texto à medida que o LLM gera.
+        Respostas em cache saem em um único trecho; a resposta completa vai para o cache
+        ao final. Se `sources` for informado, recebe os documentos usados como contexto;
+        `stats` recebe as métricas desta chamada (ttft_s, total_s, chunks + tempos do
+        Ollama) e, se o LLM falhar no meio, "error" com o código da falha. Ambos são do
+        chamador: o serviço é compartilhado entre sessões.
+        """
+        t0 = time.time()
+        stats = {} if stats is None else stats
+        resposta_cache = self._cached_answer(pergunta, sources, top_k)
+        if resposta_cache:
+            stats.update({"ttft_s": time.time() - t0, "total_s": time.time() - t0, "chunks": 1})
+            yield resposta_cache
+            return
 
-            return resposta
+        if not self._circuit_allows():
+            return
+
+        partes = []
+        docs: List[Any] = []
+        try:
+            print("🔍 Buscando resposta...")
+
+            geracao = self.searcher.generation
+            docs = self.retrieve(pergunta, top_k)
+            if sources is not None:
+                sources.extend(docs)
+            prompt = self._build_prompt(pergunta, docs)
 
+            tempos = LLMTimings()
+            t_llm = time.time()
+            for trecho in self.llm.stream(prompt, config={"callbacks": [tempos]}):
+                if not partes:
+                    stats["ttft_s"] = time.time() - t0
+                    record("query.first_token", stats["ttft_s"])
+                    if Settings.VERBOSE:
+                        print(f"⏱️ Primeiro token em {stats['ttft_s']:.2f}s")
+                partes.append(trecho)
+                yield trecho
         except Exception as e:
-            error_str = str(e)
-            print("❌ Erro ao processar pergunta:")
-
-            if "Connection refused" in error_str or "503" in error_str:
-                print("🔧 Ollama perdeu conexão durante consulta")
-                print("💡 Execute 'ollama serve' e tente novamente")
-            elif "proxy" in error_str.lower():
-                print("🌐 Bloqueio de proxy detectado")
-                print("💡 Configure bypass para localhost:11434")
-            else:
-                print(f"📝 Detalhes: {error_str[:150]}...")
+            # Resposta parcial: o chamador descobre pela chave "error" de stats
+            stats["error"] = self._record_error(e)
+            return
+        except GeneratorExit:
+            # Consumidor abandonou o stream: o Ollama respondeu, libera o disjuntor
+            self._record_success()
+            raise
 
-            return None
+        self._record_success()
+        self._record_timings(tempos.stats)
+        record("query.llm", time.time() - t_llm, chunks=len(partes))
+
+        stats.update({"total_s": time.time() - t0, "chunks": len(partes)})
+        stats.update(tempos.stats)
+        resposta = "".join(partes)
+        if resposta:
+            # Salva no cache somente respostas completas
+            self.cache.save_response(pergunta, resposta, self._fontes(docs), geracao=geracao)
@@ -3,6 +3,7 @@ Pipeline RAG especializado para documentos normativos da Polícia Federal (DPF/P
 
 Módulos principais:
 - io_pdf: extração de texto de PDFs com fallback OCR
+- layout_store: extras de layout (Docling) persistidos por hash de conteúdo
 - normalize: limpeza e normalização textual
 - regexes: padrões regex para estruturas jurídicas brasileiras
 - parse_norma: detecção hierárquica de unidades normativas
@@ -15,6 +16,7 @@ Módulos principais:
 
 __all__ = [
     "io_pdf",
+    "layout_store",
     "normalize",
     "regexes",
     "parse_norma",
@@ -94,7 +94,7 @@ def analyze_folder(pdf_folder: str | None = None) -> Dict[str, any]:
             # chunk to get token distribution
             from .metadata_pf import extract as meta_extract
             meta = meta_extract(text, heading, os.path.basename(pdf))
-            chunks = build_chunks(nodes, text, meta, os.path.basename(pdf), [p.index for p in pages2])
+            chunks = build_chunks(nodes, text, meta, os.path.basename(pdf), [p.index for p in pages2], source_path=pdf)
             toks = [c.tokens_estimados for c in chunks]
             all_chunk_tokens.extend(toks)
             reports.append({
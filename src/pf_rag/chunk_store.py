@@ -0,0 +1,224 @@
+"""
+Chunks e postings BM25 de uma versão do índice, em formato somente leitura mapeado em memória.
+
+save_faiss grava, na pasta da versão, chunks.sqlite (texto, metadados e adjacência
+anchor -> chunk / pai -> filhos, na ordem das posições do FAISS) e os postings BM25 em
+arrays numpy (.npy). Os workers do servidor de consultas abrem o SQLite imutável com mmap
+e os arrays com np.load(mmap_mode="r"): as páginas vêm do cache do SO e são as mesmas em
+todos os processos, em vez de um docstore, um BM25 e dicionários de adjacência em objetos
+Python por worker (que a contagem de referências acaba copiando, página a página).
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+STORE_FILE = "chunks.sqlite"
+_BM25_FILES = ("bm25_docs.npy", "bm25_tf.npy", "bm25_norm.npy")
+# Parâmetros do BM25Okapi (rank_bm25): mesmos scores da busca em memória
+_K1, _B, _EPSILON = 1.5, 0.75, 0.25
+
+
+def tokenize(texto: str) -> List[str]:
+    """Tokenização do BM25 (corpus e consulta)"""
+    return texto.lower().split()
+
+
+def adjacency(docs: Sequence[Any]) -> Tuple[Dict[str, int], Dict[str, List[int]]]:
+    """
+    Posições de anchor -> chunk e pai -> filhos (ordem do texto).
+    O anchor_id é único no documento (caminho desde o artigo); em índices gerados antes
+    disso o "inciso I" de artigos diferentes repete o anchor: esses ficam fora, pois
+    expandir por eles traria texto de outro artigo.
+    """
+    por_anchor: Dict[str, int] = {}
+    ambiguos = set()
+    for i, d in enumerate(docs):
+        anchor = (d.metadata or {}).get("anchor_id")
+        if not anchor:
+            continue
+        anterior = por_anchor.setdefault(anchor, i)
+        if anterior != i and docs[anterior].page_content != d.page_content:
+            ambiguos.add(anchor)
+    for anchor in ambiguos:
+        del por_anchor[anchor]
+    filhos: Dict[str, List[int]] = {}
+    for i, d in enumerate(docs):
+        meta = d.metadata or {}
+        if meta.get("parent_id") in por_anchor and por_anchor.get(meta.get("anchor_id")) == i:
+            filhos.setdefault(meta["parent_id"], []).append(i)
+    for lista in filhos.values():
+        lista.sort(key=lambda i: (docs[i].metadata or {}).get("ordem") or 0)
+    return por_anchor, filhos
+
+
+def write_chunk_store(folder: str, docs: Sequence[Any]) -> None:
+    """Grava chunks.sqlite e os postings BM25 de `docs` (na ordem das posições do FAISS)"""
+    por_anchor, filhos = adjacency(docs)
+    canonicos = set(por_anchor.values())
+    com_pai = {i for lista in filhos.values() for i in lista}
+    path = os.path.join(folder, STORE_FILE)
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(
+            """
+            CREATE TABLE chunks (pos INTEGER PRIMARY KEY, anchor_id TEXT, parent_id TEXT, ordem INTEGER,
+                                 canonico INTEGER NOT NULL, filho INTEGER NOT NULL,
+                                 page_content TEXT NOT NULL, metadata TEXT NOT NULL);
+            CREATE TABLE termos (termo TEXT PRIMARY KEY, inicio INTEGER NOT NULL, fim INTEGER NOT NULL,
+                                 idf REAL NOT NULL) WITHOUT ROWID;
+            """
+        )
+        conn.executemany(
+            "INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (i, meta.get("anchor_id"), meta.get("parent_id"), meta.get("ordem") or 0,
+                 int(i in canonicos), int(i in com_pai), d.page_content,
+                 json.dumps(meta, ensure_ascii=False, default=str))
+                for i, d in enumerate(docs)
+                for meta in (d.metadata or {},)
+            ),
+        )
+        conn.execute("CREATE INDEX chunks_anchor ON chunks (anchor_id) WHERE canonico = 1")
+        conn.execute("CREATE INDEX chunks_filhos ON chunks (parent_id, ordem) WHERE filho = 1")
+        _write_bm25(conn, folder, docs)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _write_bm25(conn: sqlite3.Connection, folder: str, docs: Sequence[Any]) -> None:
+    """Postings (posição, frequência) por termo e o termo de normalização por chunk"""
+    if not docs:
+        return
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    tamanhos = np.empty(len(docs), dtype=np.float64)
+    for i, d in enumerate(docs):
+        tokens = tokenize(d.page_content)
+        tamanhos[i] = len(tokens)
+        for termo, tf in Counter(tokens).items():
+            postings.setdefault(termo, []).append((i, tf))
+    if not postings:
+        return
+    n = len(docs)
+    idfs = {t: math.log(n - len(p) + 0.5) - math.log(len(p) + 0.5) for t, p in postings.items()}
+    eps = _EPSILON * sum(idfs.values()) / len(idfs)
+    pos = np.empty(sum(len(p) for p in postings.values()), dtype=np.int32)
+    tfs = np.empty(len(pos), dtype=np.int32)
+    linhas = []
+    inicio = 0
+    for termo in sorted(postings):
+        lista = postings[termo]
+        fim = inicio + len(lista)
+        pos[inicio:fim] = [i for i, _ in lista]
+        tfs[inicio:fim] = [tf for _, tf in lista]
+        linhas.append((termo, inicio, fim, idfs[termo] if idfs[termo] >= 0 else eps))
+        inicio = fim
+    conn.executemany("INSERT INTO termos VALUES (?, ?, ?, ?)", linhas)
+    norma = _K1 * (1 - _B + _B * tamanhos / (tamanhos.sum() / n))
+    for nome, arr in zip(_BM25_FILES, (pos, tfs, norma)):
+        np.save(os.path.join(folder, nome), arr)
+
+
+class ChunkStore:
+    """Leitura de chunks.sqlite (imutável, mmap) com uma conexão por thread"""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.path = os.path.join(folder, STORE_FILE)
+        self._local = threading.local()
+        self._bm25: Optional["MappedBM25"] = None
+        from langchain_core.documents import Document
+
+        self._document = Document
+        self.size = self._conn().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    @classmethod
+    def open(cls, folder: str) -> Optional["ChunkStore"]:
+        """Store da pasta da versão; None em índices gravados sem ele"""
+        if not os.path.exists(os.path.join(folder, STORE_FILE)):
+            return None
+        try:
+            return cls(folder)
+        except Exception:
+            return None
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # immutable: a pasta da versão nunca muda depois de publicada (sem locks/WAL)
+            conn = sqlite3.connect(f"file:{os.path.abspath(self.path)}?mode=ro&immutable=1", uri=True)
+            conn.execute(f"PRAGMA mmap_size={os.path.getsize(self.path)}")
+            self._local.conn = conn
+        return conn
+
+    def reset_connections(self) -> None:
+        """Esquece as conexões herdadas após fork; cada thread do filho abre a sua"""
+        self._local = threading.local()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _docs(self, sql: str, args: Tuple) -> List[Any]:
+        return [self._document(page_content=texto, metadata=json.loads(meta))
+                for texto, meta in self._conn().execute(sql, args)]
+
+    def get(self, pos: int) -> Optional[Any]:
+        """Chunk na posição `pos` do índice FAISS"""
+        docs = self._docs("SELECT page_content, metadata FROM chunks WHERE pos = ?", (int(pos),))
+        return docs[0] if docs else None
+
+    def lookup(self, anchor: str) -> Optional[Any]:
+        docs = self._docs("SELECT page_content, metadata FROM chunks WHERE anchor_id = ? AND canonico = 1",
+                          (anchor,))
+        return docs[0] if docs else None
+
+    def children(self, anchor: str) -> List[Any]:
+        """Filhos do dispositivo na ordem do texto"""
+        return self._docs("SELECT page_content, metadata FROM chunks WHERE parent_id = ? AND filho = 1"
+                          " ORDER BY ordem, pos", (anchor,))
+
+    def bm25(self) -> Optional["MappedBM25"]:
+        """Postings BM25 mapeados; None se a versão não os tiver"""
+        if self._bm25 is None:
+            caminhos = [os.path.join(self.folder, nome) for nome in _BM25_FILES]
+            if not all(os.path.exists(c) for c in caminhos):
+                return None
+            self._bm25 = MappedBM25(self, *(np.load(c, mmap_mode="r") for c in caminhos))
+        return self._bm25
+
+
+class MappedBM25:
+    """BM25Okapi sobre postings em disco: mesma interface (get_scores) e mesmos scores"""
+
+    def __init__(self, store: ChunkStore, docs: np.ndarray, tf: np.ndarray, norma: np.ndarray):
+        self.store = store
+        self.docs = docs
+        self.tf = tf
+        self.norma = norma
+
+    def get_scores(self, query: List[str]) -> np.ndarray:
+        scores = np.zeros(len(self.norma))
+        termos = list(set(query))
+        if not termos:
+            return scores
+        faixas = {
+            termo: (inicio, fim, idf)
+            for termo, inicio, fim, idf in self.store._conn().execute(
+                f"SELECT termo, inicio, fim, idf FROM termos WHERE termo IN ({','.join('?' * len(termos))})",
+                termos,
+            )
+        }
+        for termo in query:
+            if termo not in faixas:
+                continue
+            inicio, fim, idf = faixas[termo]
+            docs = self.docs[inicio:fim]
+            tf = self.tf[inicio:fim]
+            scores[docs] += idf * (tf * (_K1 + 1) / (tf + self.norma[docs]))
+        return scores
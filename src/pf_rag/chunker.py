@@ -1,7 +1,7 @@
 from __future__ import annotations
 import hashlib
-from typing import List, Dict, Any, Optional
-from .types import Node, Chunk, PFDocumentMetadata
+from typing import List, Dict, Any, Optional, Set
+from .types import Node, Chunk, PFDocumentMetadata, OffsetMap
 from .io_pdf import get_layout_extras
 from src.config.settings import Settings
 
@@ -21,6 +21,9 @@ def slugify(*parts: str) -> str:
     return s
 
 
+# 1.1.0: anchor_id com o caminho desde o artigo (único por documento)
+VERSAO_PARSER = "1.1.0"
+
 HIER_ORDER = [
     "documento",
     "parte",
@@ -62,10 +65,38 @@ def _breadcrumb(node: Node, id_to_node: Dict[str, Node]) -> List[Dict[str, str]]
     return [p for p in path if p["nivel"] != "documento"]
 
 
-def build_chunks(nodes: List[Node], text: str, meta: PFDocumentMetadata, pdf_file: str, pages: List[int]) -> List[Chunk]:
+def _anchors(doc_id: str, nodes: List[Node], id_to_node: Dict[str, Node]) -> Dict[str, str]:
+    """
+    anchor_id de cada nó, único no documento: o caminho desde o artigo (artigo-2-inciso-i,
+    artigo-2-paragrafo-1-inciso-ii) ou, fora de artigos, a hierarquia inteira
+    (titulo-ii-capitulo-i). O "inciso I" de artigos diferentes não colide; repetições
+    restantes (ex.: artigo transcrito em anexo) recebem sufixo -2, -3...
+    """
+    anchors: Dict[str, str] = {}
+    usados: Dict[str, int] = {}
+    for n in nodes:
+        partes: List[str] = []
+        cur: Optional[Node] = n
+        while cur is not None and cur.nivel != "documento":
+            partes[:0] = [cur.nivel, _ordinal_normalizado(cur.nivel, cur.rotulo)]
+            if cur.nivel == "artigo":
+                break
+            cur = id_to_node.get(cur.parent_id) if cur.parent_id else None
+        anchor = slugify(doc_id, *partes)
+        usados[anchor] = usados.get(anchor, 0) + 1
+        anchors[n.id] = anchor if usados[anchor] == 1 else f"{anchor}-{usados[anchor]}"
+    return anchors
+
+
+def build_chunks(nodes: List[Node], text: str, meta: PFDocumentMetadata, pdf_file: str, pages: List[int], offsets: Optional[OffsetMap] = None, source_path: Optional[str] = None) -> List[Chunk]:
+    # offsets (normalize.clean_text_with_offsets) restringe origem_pdf.paginas às páginas do próprio dispositivo
+    # source_path: caminho do PDF no disco quando pdf_file é só o nome exibido (layout por hash de conteúdo)
+    def paginas_de(start: int, end: int) -> List[int]:
+        return (offsets.pages_between(start, end) or pages) if offsets else pages
+
     id_to_node = {n.id: n for n in nodes}
     # Layout extras (Docling) para evitar cortes ruins e enriquecer metadados
-    layout = get_layout_extras(pdf_file)
+    layout = get_layout_extras(source_path or pdf_file)
     layout_map = layout.get("layout_blocks", {}) if isinstance(layout, dict) else {}
 
     # lista linear por ordem e gerar chunks por granularidade, respeitando limites
@@ -73,11 +104,15 @@ def build_chunks(nodes: List[Node], text: str, meta: PFDocumentMetadata, pdf_fil
     sorted_nodes = [n for n in nodes if n.nivel in level_priority]
     sorted_nodes.sort(key=lambda n: (n.start, level_priority[n.nivel]))
 
+    anchors = _anchors(meta.doc_id, [n for n in sorted_nodes if n.nivel != "documento"], id_to_node)
+
     chunks: List[Chunk] = []
     prev_by_parent: Dict[str, Optional[str]] = {}
+    # filhos já emitidos pela divisão de um pai grande não saem de novo (mesmo anchor)
+    emitidos: Set[str] = set()
 
     for n in sorted_nodes:
-        if n.nivel == "documento":
+        if n.nivel == "documento" or n.id in emitidos:
             continue
         content = text[n.start:n.end].strip()
         if not content:
@@ -100,8 +135,8 @@ def build_chunks(nodes: List[Node], text: str, meta: PFDocumentMetadata, pdf_fil
                                 layout_refs.append(blk)
                 except Exception:
                     pass
-                anchor = slugify(meta.doc_id, n.nivel, _ordinal_normalizado(n.nivel, n.rotulo), c.nivel, _ordinal_normalizado(c.nivel, c.rotulo))
-                parent_anchor = slugify(meta.doc_id, n.nivel, _ordinal_normalizado(n.nivel, n.rotulo))
+                anchor = anchors.get(c.id) or slugify(meta.doc_id, c.nivel, _ordinal_normalizado(c.nivel, c.rotulo))
+                parent_anchor = anchors[n.id]
                 prev_id = prev_by_parent.get(parent_anchor)
                 chunk = Chunk(
                     doc_id=meta.doc_id,
@@ -115,10 +150,10 @@ def build_chunks(nodes: List[Node], text: str, meta: PFDocumentMetadata, pdf_fil
                     parent_id=parent_anchor,
                     siblings_prev_id=prev_id,
                     siblings_next_id=None,
-                    origem_pdf={"arquivo": pdf_file, "paginas": pages},
+                    origem_pdf={"arquivo": pdf_file, "paginas": paginas_de(c.start, c.end)},
                     hash_conteudo=hashlib.sha256(c_text.encode("utf-8")).hexdigest(),
                     texto_limpo=True,
-                    versao_parser="1.0.0",
+                    versao_parser=VERSAO_PARSER,
                 )
                 if layout_refs:
                     chunk.layout_refs = layout_refs
@@ -146,13 +181,13 @@ def build_chunks(nodes: List[Node], text: str, meta: PFDocumentMetadata, pdf_fil
                             ch.siblings_next_id = anchor
                             break
                 chunks.append(chunk)
+                emitidos.add(c.id)
                 prev_by_parent[parent_anchor] = anchor
         else:
-            anchor = slugify(meta.doc_id, n.nivel, _ordinal_normalizado(n.nivel, n.rotulo))
+            anchor = anchors[n.id]
             parent_anchor = None
             if n.parent_id and id_to_node[n.parent_id].nivel != "documento":
-                parent = id_to_node[n.parent_id]
-                parent_anchor = slugify(meta.doc_id, parent.nivel, _ordinal_normalizado(parent.nivel, parent.rotulo))
+                parent_anchor = anchors.get(n.parent_id)
             prev_id = prev_by_parent.get(parent_anchor or "root")
             layout_refs = []
             try:
@@ -175,10 +210,10 @@ def build_chunks(nodes: List[Node], text: str, meta: PFDocumentMetadata, pdf_fil
                 parent_id=parent_anchor,
                 siblings_prev_id=prev_id,
                 siblings_next_id=None,
-                origem_pdf={"arquivo": pdf_file, "paginas": pages},
+                origem_pdf={"arquivo": pdf_file, "paginas": paginas_de(n.start, n.end)},
                 hash_conteudo=hashlib.sha256(content.encode("utf-8")).hexdigest(),
                 texto_limpo=True,
-                versao_parser="1.0.0",
+                versao_parser=VERSAO_PARSER,
             )
             if layout_refs:
                 chunk.layout_refs = layout_refs
@@ -5,18 +5,21 @@ import os
 from typing import List
 
 from src.config.settings import Settings
-from .io_pdf import extract_text
-from .normalize import clean_text
-from .parse_norma import detect_structure
-from .metadata_pf import extract as meta_extract
-from .chunker import build_chunks
-from .embed_index import Indexer, SbertEmbeddings
-from .types import PFDocumentMetadata
-from .export_jsonl import export_chunks_jsonl
-from .calibrate import analyze_folder, write_markdown_report
+
+# Cada comando importa só o que usa: `query` com o servidor no ar não carrega
+# pdfminer/Docling/OCR, embeddings nem FAISS neste processo
 
 
 def ingest_index(pdf_folder: str | None = None, index_path: str | None = None) -> None:
+    from .io_pdf import iter_extract_text
+    from .normalize import clean_text_with_offsets
+    from .parse_norma import detect_structure
+    from .metadata_pf import extract as meta_extract
+    from .chunker import build_chunks
+    from .embed_index import Indexer
+    from .export_jsonl import export_chunks_jsonl
+    from src.utils.telemetry import metrics, print_stage_summary, span
+
     pdf_folder = pdf_folder or Settings.PDF_FOLDER
     index_path = index_path or Settings.FAISS_DB_PATH
     pdfs = glob.glob(os.path.join(pdf_folder, "*.pdf"))
@@ -24,37 +27,53 @@ def ingest_index(pdf_folder: str | None = None, index_path: str | None = None) -
         raise RuntimeError(f"Nenhum PDF encontrado em {pdf_folder}. Certifique-se de colocar os arquivos em 'SGP/'")
 
     all_chunks = []
-    for pdf in pdfs:
-        raw, pages, ocr = extract_text(pdf)
-        text, pages2 = clean_text(raw, pages)
-        nodes, heading = detect_structure(text)
-        meta = meta_extract(text, heading, os.path.basename(pdf))
-        chunks = build_chunks(nodes, text, meta, os.path.basename(pdf), [p.index for p in pages2])
+    for pdf, (raw, pages, ocr) in iter_extract_text(pdfs):
+        nome = os.path.basename(pdf)
+        with span("ingest.normalize", arquivo=nome):
+            text, pages2, offsets = clean_text_with_offsets(raw, pages)
+        with span("ingest.parse", arquivo=nome):
+            nodes, heading = detect_structure(text)
+            meta = meta_extract(text, heading, nome)
+        with span("ingest.chunk", arquivo=nome) as etapa:
+            chunks = build_chunks(nodes, text, meta, nome, [p.index for p in pages2], offsets, source_path=pdf)
+            etapa.set(chunks=len(chunks))
+        metrics.inc("pf_rag_chunks_total", len(chunks), stage="chunked")
         all_chunks.extend(chunks)
 
     indexer = Indexer()
     db = indexer.build_faiss(all_chunks)
     indexer.save_faiss(db, index_path)
+    # Nova geração do índice: cache de respostas invalidado só onde os chunks mudaram
+    from src.utils.cache_utils import invalidate_for_reindex
+    invalidate_for_reindex(all_chunks, full=True)
+    # Servidor de consultas no ar passa a responder com o índice novo
+    from src.core.query_client import get_query_client
+    client = get_query_client()
+    if client is not None:
+        client.reload()
     # Export JSONL (auditoria)
-    from src.config.settings import Settings
     if Settings.EXPORT_CHUNKS_JSONL:
         msg = export_chunks_jsonl(all_chunks, Settings.CHUNKS_JSONL_PATH)
         print("📝", msg)
+    print_stage_summary("ingest.")
 
 
 def query_cli(question: str, top_k: int = 5) -> List[dict]:
-    from .search import Searcher
-    from langchain_community.vectorstores import FAISS
-    from langchain_ollama import OllamaEmbeddings
+    from src.core.query_client import get_query_client
 
-    if Settings.EMBEDDING_BACKEND == "sbert":
-        embeddings = SbertEmbeddings()
+    # Servidor de consultas no ar: índice já carregado lá, sem embeddings/FAISS neste processo
+    client = get_query_client()
+    if client is not None:
+        docs = [doc for doc, _ in client.search(question, top_k=top_k)]
     else:
-        embeddings = OllamaEmbeddings(model=Settings.EMBEDDING_MODEL)
+        from .search import Searcher
+        from .embed_index import Indexer
 
-    db = FAISS.load_local(Settings.FAISS_DB_PATH, embeddings, allow_dangerous_deserialization=True)
-    searcher = Searcher(db)
-    docs = searcher.query(question, top_k=top_k)
+        db = Indexer.load_faiss(Settings.FAISS_DB_PATH)
+        if db is None:
+            raise SystemExit(f"Índice FAISS ausente ou ilegível em {Settings.FAISS_DB_PATH}")
+        # mesmos trechos do /search do servidor: busca híbrida, sem expansão de contexto
+        docs = [doc for doc, _ in Searcher(db).search(question, top_k=top_k)]
     results = []
     for d in docs:
         md = d.metadata
@@ -71,8 +90,9 @@ def query_cli(question: str, top_k: int = 5) -> List[dict]:
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description="Pipeline PF RAG - ingestão e busca (offline por padrão)")
-    parser.add_argument("command", choices=["ingest", "query", "calibrate"], help="Comando a executar")
+    parser.add_argument("command", choices=["ingest", "query", "calibrate", "serve", "onnx-parity"], help="Comando a executar")
     parser.add_argument("--q", dest="query_text", help="Consulta para buscar")
+    parser.add_argument("--workers", type=int, default=None, help="serve: processos atendendo consultas")
     args = parser.parse_args()
 
     if args.command == "ingest":
@@ -83,7 +103,17 @@ if __name__ == "__main__":
             raise SystemExit("Informe --q com a consulta")
         res = query_cli(args.query_text)
         print(json.dumps(res, ensure_ascii=False, indent=2))
+    elif args.command == "serve":
+        from src.core.query_server import serve
+        serve(workers=args.workers)
+    elif args.command == "onnx-parity":
+        from .embed_onnx import parity_check
+        res = parity_check([args.query_text] if args.query_text else None)
+        print(json.dumps(res, ensure_ascii=False, indent=2))
+        if res["cos_min"] < 0.98:
+            print("⚠️ Concordância abaixo de 0.98: prefira PF_RAG_EMBED_BACKEND=sbert")
     elif args.command == "calibrate":
+        from .calibrate import analyze_folder, write_markdown_report
         data = analyze_folder()
         out = os.path.join("docs", "sgp_calibration.md")
         write_markdown_report(out, data)
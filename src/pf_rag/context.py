@@ -0,0 +1,97 @@
+from __future__ import annotations
+import hashlib
+from typing import Any, Callable, Dict, List, Optional
+
+from src.config.settings import Settings
+from .chunker import estimate_tokens
+from .search import chunk_id
+
+# anchor_id -> documento (índice de adjacência do Searcher); None quando não disponível
+Lookup = Callable[[str], Optional[Any]]
+
+
+def doc_tokens(doc: Any) -> int:
+    """tokens_estimados do chunk (metadado do pipeline PF) ou estimativa pelo texto"""
+    tokens = (doc.metadata or {}).get("tokens_estimados")
+    return int(tokens) if tokens else estimate_tokens(doc.page_content)
+
+
+def _ancestors(doc: Any, known: Dict[str, Any], lookup: Optional[Lookup]) -> List[str]:
+    """anchor_ids dos ancestrais (caput do artigo, parágrafo...) seguindo parent_id"""
+    out: List[str] = []
+    parent = (doc.metadata or {}).get("parent_id")
+    while parent and parent not in out:
+        out.append(parent)
+        pai = known.get(parent) or (lookup(parent) if lookup else None)
+        parent = (pai.metadata or {}).get("parent_id") if pai is not None else None
+    return out
+
+
+def _identities(docs: List[Any]) -> List[str]:
+    """
+    chunk_id de cada trecho (anchor_id, único no documento). Em índices anteriores ao
+    parser 1.1.0 o "inciso I" de artigos diferentes repete o anchor: esses passam a valer
+    pelo texto, para não serem tomados um pelo outro.
+    """
+    textos: Dict[str, str] = {}
+    ambiguos = set()
+    for d in docs:
+        cid = chunk_id(d)
+        if textos.setdefault(cid, d.page_content) != d.page_content:
+            ambiguos.add(cid)
+    return [
+        f"{cid}#{hashlib.sha1(d.page_content.encode('utf-8')).hexdigest()[:12]}" if cid in ambiguos else cid
+        for d, cid in ((d, chunk_id(d)) for d in docs)
+    ]
+
+
+def _position(doc: Any, rank: int) -> tuple:
+    meta = doc.metadata or {}
+    if meta.get("ordem") is not None:
+        return (0, int(meta["ordem"]))
+    paginas = (meta.get("origem_pdf") or {}).get("paginas") or [0]
+    return (1, min(paginas), rank)
+
+
+def pack_context(docs: List[Any], budget: Optional[int] = None, lookup: Optional[Lookup] = None) -> List[Any]:
+    """
+    Seleciona, em ordem de relevância, os trechos que cabem no orçamento de tokens.
+
+    Um artigo contém o texto dos próprios parágrafos/incisos: se um ancestral já entrou,
+    o filho é descartado; se o ancestral entra depois, os filhos já escolhidos saem e
+    devolvem o orçamento. Trechos que não cabem são pulados (um menor pode caber).
+    O resultado sai agrupado por documento (o mais relevante primeiro) e na ordem do texto.
+    """
+    budget = budget or Settings.CONTEXT_TOKEN_BUDGET
+    ids = _identities(docs)
+    known = {cid: d for cid, d in zip(ids, docs)}
+    selected: Dict[int, Any] = {}
+    ancestors: Dict[int, List[str]] = {}
+    used = 0
+    for rank, doc in enumerate(docs):
+        cid = ids[rank]
+        linhagem = _ancestors(doc, known, lookup)
+        escolhidos = {ids[r] for r in selected}
+        if cid in escolhidos or escolhidos.intersection(linhagem):
+            continue
+        cobertos = [r for r, anc in ancestors.items() if cid in anc]
+        custo = doc_tokens(doc) - sum(doc_tokens(selected[r]) for r in cobertos)
+        if used + custo > budget and selected:
+            # o mais relevante sempre entra, mesmo sozinho acima do orçamento
+            continue
+        for r in cobertos:
+            del selected[r]
+            del ancestors[r]
+        selected[rank] = doc
+        ancestors[rank] = linhagem
+        used += custo
+
+    ordem_docs: Dict[Any, int] = {}
+    for rank in sorted(selected):
+        ordem_docs.setdefault((selected[rank].metadata or {}).get("doc_id"), rank)
+    return [
+        selected[rank] for rank in sorted(
+            selected,
+            key=lambda r: (ordem_docs[(selected[r].metadata or {}).get("doc_id")], _position(selected[r], r)),
+        )
+    ]
@@ -0,0 +1,85 @@
+from __future__ import annotations
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from langchain.embeddings.base import Embeddings
+
+from src.config.settings import Settings
+from src.utils.telemetry import cache_result, span
+
+_ESPACOS = re.compile(r"\s+")
+
+
+def model_id(embeddings: Embeddings) -> str:
+    """Identificador do modelo: nome no Ollama ou nome do SentenceTransformer"""
+    nome = getattr(embeddings, "model_name", None) or getattr(embeddings, "model", None)
+    return nome if isinstance(nome, str) else type(embeddings).__name__
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LRU com validade (TTL) dos vetores de consulta, na frente do modelo de embeddings.
+
+    Chave: (modelo, texto com espaços normalizados). Caixa e pontuação são preservadas:
+    o modelo distingue "Art." de "art", e o vetor em cache é idêntico ao recalculado.
+    Perguntas repetidas (sessão, cache semântico, prévia de trechos) não voltam ao
+    Ollama/SBERT. embed_documents (indexação) passa direto, sem ocupar o cache.
+    """
+
+    def __init__(self, base: Embeddings, max_size: Optional[int] = None, ttl: Optional[float] = None):
+        self.base = base
+        self.max_size = max(1, max_size or Settings.QUERY_EMBED_CACHE_SIZE)
+        self.ttl = Settings.QUERY_EMBED_CACHE_TTL if ttl is None else ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Tuple[float, ...]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name: str):
+        # model, transport etc. continuam acessíveis como no modelo original
+        if name == "base":
+            raise AttributeError(name)
+        return getattr(self.base, name)
+
+    def make_key(self, text: str) -> Hashable:
+        return model_id(self.base), _ESPACOS.sub(" ", text).strip()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:  # type: ignore[override]
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:  # type: ignore[override]
+        key = self.make_key(text)
+        agora = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (self.ttl <= 0 or agora - item[0] <= self.ttl):
+                self._data.move_to_end(key)
+                self.hits += 1
+                vetor = item[1]
+            else:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                vetor = None
+        cache_result("embed", vetor is not None)
+        if vetor is not None:
+            return list(vetor)
+        with span("query.embed"):
+            vetor = self.base.embed_query(key[1])
+        with self._lock:
+            self._data[key] = (agora, tuple(vetor))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+        return list(vetor)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
@@ -1,38 +1,106 @@
 from __future__ import annotations
-from typing import List, Dict, Any, Optional, Callable
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from collections.abc import Mapping
+from typing import Iterator, List, Dict, Any, Optional, Callable, Union
 
+import numpy as np
+from langchain_community.docstore.base import Docstore
 from langchain_community.vectorstores import FAISS
 from langchain.embeddings.base import Embeddings
-from langchain_ollama import OllamaEmbeddings
-
-try:
-    from sentence_transformers import SentenceTransformer  # type: ignore
-except Exception:  # pragma: no cover
-    SentenceTransformer = None  # type: ignore
 
 from src.config.settings import Settings
+from src.services.ollama_client import OllamaTransport, get_transport
+from src.utils.telemetry import metrics, span
 from .types import Chunk
+from .embed_scheduler import EmbeddingScheduler
+from .embed_cache import CachedEmbeddings
+from .chunk_store import ChunkStore, write_chunk_store
+
+# Versões publicadas do índice (uma pasta cada) e ponteiro para a atual
+_VERSIONS_DIR = "versions"
+_POINTER = "CURRENT"
 
 
 class SbertEmbeddings(Embeddings):
-    def __init__(self, model_name: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"):
-        if SentenceTransformer is None:
+    """
+    SentenceTransformer local. `embed_array`/`embed_query_array` devolvem float32 direto
+    do encode (caminho da indexação); a API em listas do LangChain é só uma conversão final.
+    """
+
+    def __init__(self, model_name: str = Settings.SBERT_MODEL):
+        # torch/sentence-transformers só carregam com o backend sbert (segundos de importação)
+        try:
+            from sentence_transformers import SentenceTransformer  # type: ignore
+        except Exception:  # pragma: no cover
             raise RuntimeError("sentence-transformers não instalado")
+        self.model_name = model_name
         self.model = SentenceTransformer(model_name)
 
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        vetores = self.model.encode(list(texts), show_progress_bar=False, normalize_embeddings=True,
+                                    convert_to_numpy=True)
+        return np.asarray(vetores, dtype=np.float32)
+
+    def embed_query_array(self, text: str) -> np.ndarray:
+        return self.embed_array([text])[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:  # type: ignore[override]
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:  # type: ignore[override]
+        return self.embed_query_array(text).tolist()
+
+
+class OllamaPooledEmbeddings(Embeddings):
+    """Embeddings do Ollama pelo transporte compartilhado (keep-alive, /api/embed em lote)."""
+
+    def __init__(self, model: str = Settings.EMBEDDING_MODEL, transport: Optional[OllamaTransport] = None):
+        self.model = model
+        self._transport = transport
+
+    @property
+    def transport(self) -> OllamaTransport:
+        # Sem transporte fixo, resolve a cada chamada: após fork (reset_transport) o
+        # worker usa o seu pool, nunca a sessão herdada do pai
+        return self._transport or get_transport()
+
     def embed_documents(self, texts: List[str]) -> List[List[float]]:  # type: ignore[override]
-        return [list(map(float, v)) for v in self.model.encode(texts, show_progress_bar=False, normalize_embeddings=True)]
+        # Lotes do EmbeddingScheduler seguem inteiros numa única requisição
+        return self.transport.embed(list(texts), self.model, batch_size=Settings.EMBED_BATCH_MAX)
 
     def embed_query(self, text: str) -> List[float]:  # type: ignore[override]
-        return list(map(float, self.model.encode([text], show_progress_bar=False, normalize_embeddings=True)[0]))
+        return self.transport.embed([text], self.model)[0]
+
+
+def make_embeddings(backend: Optional[str] = None) -> Embeddings:
+    """Embeddings conforme o backend configurado (ollama | sbert | onnx), com cache dos vetores de consulta."""
+    backend = backend or Settings.EMBEDDING_BACKEND
+    if backend == "sbert":
+        base: Embeddings = SbertEmbeddings()
+    elif backend == "onnx":
+        from .embed_onnx import OnnxEmbeddings
+        base = OnnxEmbeddings()
+    else:
+        base = OllamaPooledEmbeddings(model=Settings.EMBEDDING_MODEL)
+    if Settings.QUERY_EMBED_CACHE_SIZE > 0:
+        return CachedEmbeddings(base)
+    return base
+
+
+def scheduler_for(embeddings: Embeddings) -> EmbeddingScheduler:
+    """Agendador de lotes; SBERT/ONNX rodam local (já usam todas as threads) e não ganham com lotes simultâneos."""
+    base = embeddings.base if isinstance(embeddings, CachedEmbeddings) else embeddings
+    in_flight = 1 if isinstance(base, SbertEmbeddings) else Settings.EMBED_IN_FLIGHT
+    return EmbeddingScheduler(embeddings, in_flight=in_flight)
 
 
 class Indexer:
     def __init__(self, backend: str = Settings.EMBEDDING_BACKEND):
-        if backend == "ollama":
-            self.embeddings: Embeddings = OllamaEmbeddings(model=Settings.EMBEDDING_MODEL)
-        else:
-            self.embeddings = SbertEmbeddings()
+        self.embeddings: Embeddings = make_embeddings(backend)
 
     def to_texts_and_metadatas(self, chunks: List[Chunk]) -> tuple[List[str], List[Dict[str, Any]]]:
         texts: List[str] = []
@@ -65,7 +133,7 @@ class Indexer:
             if nivel == "artigo":
                 return f"{nome} {r}" if r else nome
             return f"{nome} {r}" if r else nome
-        for ch in chunks:
+        for ordem, ch in enumerate(chunks):
             # caminho_hierarquico já inclui o próprio nó atual
             caminho = ch.caminho_hierarquico
             breadcrumb = " > ".join([fmt_label(n["nivel"], n["rotulo"]) for n in caminho])
@@ -73,60 +141,174 @@ class Indexer:
             texts.append(text_for_embed)
             md = {k: v for k, v in ch.__dict__.items() if k not in {"texto"}}
             md["breadcrumb"] = breadcrumb
+            # posição no documento (chunks saem do chunker na ordem do texto)
+            md["ordem"] = ordem
             metas.append(md)
         return texts, metas
 
+    def embed_chunks(self, texts: List[str], chunks: List[Chunk],
+                     progress_cb: Optional[Callable[[float, str], None]] = None) -> np.ndarray:
+        # tokens_estimados do chunk + breadcrumb prefixado ao texto de embedding
+        tokens = [ch.tokens_estimados + (len(t) - len(ch.texto)) // 4 for t, ch in zip(texts, chunks)]
+        return scheduler_for(self.embeddings).embed_array(texts, tokens=tokens, progress_cb=progress_cb)
+
     def build_faiss(self, chunks: List[Chunk], progress_cb: Optional[Callable[[float, str], None]] = None) -> FAISS:
-        import time
         texts, metas = self.to_texts_and_metadatas(chunks)
-        bs = max(1, Settings.EMBED_BATCH_SIZE)
         if Settings.VERBOSE:
-            print(f"🔢 Total de chunks: {len(texts)} | Batch: {bs}")
+            print(f"🔢 Total de chunks: {len(texts)} | Lotes simultâneos: {Settings.EMBED_IN_FLIGHT}")
         if progress_cb:
             progress_cb(0.0, "Iniciando embeddings")
-        # Fast path: some embeddings support internal batching via from_texts; fallback to manual batched add
-        if hasattr(FAISS, "from_texts") and bs >= len(texts):
-            t0 = time.time()
-            db = FAISS.from_texts(texts, embedding=self.embeddings, metadatas=metas)
-            if Settings.VERBOSE:
-                print(f"✅ Embeddings concluídos em {time.time() - t0:.2f}s (single call)")
-            if progress_cb:
-                progress_cb(1.0, "Embeddings concluídos")
-            return db
-        # Manual batching
-        db = None
-        t0 = time.time()
-        total_batches = (len(texts)+bs-1)//bs if len(texts) else 1
-        for i in range(0, len(texts), bs):
-            bt = texts[i:i+bs]
-            bm = metas[i:i+bs]
-            bstart = time.time()
-            if db is None:
-                db = FAISS.from_texts(bt, embedding=self.embeddings, metadatas=bm)
-            else:
-                db.add_texts(bt, metadatas=bm)
-            if Settings.VERBOSE:
-                print(f"🧩 Lote {i//bs + 1}/{total_batches} -> {len(bt)} itens em {time.time()-bstart:.2f}s")
-            if progress_cb:
-                frac = min(1.0, (i//bs + 1) / total_batches)
-                progress_cb(frac, f"Lote {i//bs + 1}/{total_batches}")
-        if Settings.VERBOSE:
-            print(f"✅ Embeddings totais em {time.time() - t0:.2f}s")
+        with span("ingest.embed", verbose=True, chunks=len(texts)):
+            vectors = self.embed_chunks(texts, chunks, progress_cb)
+        with span("ingest.upsert", verbose=True, chunks=len(texts), backend="faiss"):
+            # linhas da matriz float32: o FAISS empilha as fatias sem passar por floats Python
+            db = FAISS.from_embeddings(list(zip(texts, vectors)), embedding=self.embeddings, metadatas=metas)
+        metrics.inc("pf_rag_chunks_total", len(texts), stage="indexed")
         if progress_cb:
             progress_cb(1.0, "Embeddings concluídos")
-        return db  # type: ignore
+        return db
 
-    def save_faiss(self, db: FAISS, path: str = Settings.FAISS_DB_PATH):
-        db.save_local(path)
+    @staticmethod
+    def save_faiss(db: FAISS, path: str = Settings.FAISS_DB_PATH):
+        """
+        Publica o índice como nova versão: os arquivos vão para uma pasta própria em
+        `versions/` e só então o ponteiro CURRENT é trocado (um único rename atômico).
+        Quem carrega resolve o ponteiro uma vez e lê o par index.faiss/index.pkl da mesma
+        versão; processos com uma versão aberta (inclusive mapeada em memória) seguem nela.
+        A versão leva também o chunk store (chunks, adjacência e postings BM25) lido
+        mapeado pelos workers do servidor de consultas.
+        """
+        versoes = os.path.join(path, _VERSIONS_DIR)
+        os.makedirs(versoes, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=versoes)
+        try:
+            db.save_local(tmp)
+            _save_chunk_store(db, tmp)
+            nome = f"{time.time_ns():020d}"
+            os.rename(tmp, os.path.join(versoes, nome))
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        ponteiro = os.path.join(path, f".{_POINTER}.tmp-{os.getpid()}")
+        with open(ponteiro, "w", encoding="utf-8") as f:
+            f.write(nome)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(ponteiro, os.path.join(path, _POINTER))
+        _prune_versions(path, nome)
 
     @staticmethod
-    def load_faiss(path: str = Settings.FAISS_DB_PATH, embeddings: Optional[Embeddings] = None) -> Optional[FAISS]:
+    def load_faiss(path: str = Settings.FAISS_DB_PATH, embeddings: Optional[Embeddings] = None,
+                   mmap: bool = False) -> Optional[FAISS]:
+        """
+        Carrega a versão atual do índice FAISS. mmap=True mapeia os vetores em memória
+        (somente leitura) quando a versão do faiss suporta o tipo de índice, e lê chunks e
+        postings BM25 do chunk store: vários processos compartilham as mesmas páginas dos
+        arquivos, sem cópia por processo. O índice mapeado não aceita novos documentos.
+        """
         try:
             if embeddings is None:
-                if Settings.EMBEDDING_BACKEND == "sbert":
-                    embeddings = SbertEmbeddings()
-                else:
-                    embeddings = OllamaEmbeddings(model=Settings.EMBEDDING_MODEL)
-            return FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+                embeddings = make_embeddings()
+            pasta = current_index_dir(path)
+            if mmap:
+                db = _load_faiss_mmap(pasta, embeddings)
+                if db is not None:
+                    return db
+            return FAISS.load_local(pasta, embeddings, allow_dangerous_deserialization=True)
         except Exception:
             return None
+
+
+def current_index_dir(path: str = Settings.FAISS_DB_PATH) -> str:
+    """Pasta da versão publicada em CURRENT; índices anteriores ao ponteiro ficam na raiz"""
+    try:
+        with open(os.path.join(path, _POINTER), encoding="utf-8") as f:
+            nome = f.read().strip()
+    except OSError:
+        return path
+    pasta = os.path.join(path, _VERSIONS_DIR, nome)
+    return pasta if nome and os.path.isdir(pasta) else path
+
+
+def _prune_versions(path: str, atual: str) -> None:
+    """
+    Remove versões antigas, mantendo a atual e a anterior (workers que ainda não
+    recarregaram), e o par legado da raiz, agora substituído pelo ponteiro
+    """
+    versoes = os.path.join(path, _VERSIONS_DIR)
+    nomes = sorted(n for n in os.listdir(versoes) if not n.startswith(".") and n <= atual)
+    for nome in nomes[:-2]:
+        shutil.rmtree(os.path.join(versoes, nome), ignore_errors=True)
+    for nome in ("index.pkl", "index.faiss"):
+        try:
+            os.remove(os.path.join(path, nome))
+        except OSError:
+            pass
+
+
+def _save_chunk_store(db: FAISS, folder: str) -> None:
+    """Chunk store da versão; sem ele (falha na gravação) o carregamento usa o index.pkl"""
+    try:
+        docs = [db.docstore.search(db.index_to_docstore_id[i]) for i in range(db.index.ntotal)]
+        write_chunk_store(folder, docs)
+    except Exception as e:
+        print(f"⚠️ Chunk store não gravado ({e}); workers carregam o docstore do index.pkl")
+        for nome in os.listdir(folder):
+            if nome not in ("index.faiss", "index.pkl"):
+                os.remove(os.path.join(folder, nome))
+
+
+class _Positions(Mapping):
+    """index_to_docstore_id do índice mapeado: a posição no FAISS é o id no chunk store"""
+
+    def __init__(self, size: int):
+        self.size = size
+
+    def __getitem__(self, i: int) -> int:
+        if not 0 <= i < self.size:
+            raise KeyError(i)
+        return int(i)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self.size))
+
+
+class ChunkDocstore(Docstore):
+    """Docstore somente leitura sobre o chunk store (sem AddableMixin: add_texts recusa)"""
+
+    def __init__(self, store: ChunkStore):
+        self.store = store
+
+    def search(self, search: Union[int, str]) -> Union[str, Any]:
+        doc = self.store.get(int(search))
+        return doc if doc is not None else f"ID {search} not found."
+
+
+def _load_faiss_mmap(path: str, embeddings: Embeddings) -> Optional[FAISS]:
+    """
+    Índice lido com IO_FLAG_MMAP(_IFC) e chunks do chunk store (sem desserializar o
+    docstore); None se o faiss instalado não suportar
+    """
+    try:
+        import faiss  # type: ignore
+    except Exception:
+        return None
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", 0) or getattr(faiss, "IO_FLAG_MMAP", 0)
+    if not flags:
+        return None
+    try:
+        index = faiss.read_index(os.path.join(path, "index.faiss"), flags | getattr(faiss, "IO_FLAG_READ_ONLY", 0))
+        store = ChunkStore.open(path)
+        if store is not None and len(store) == index.ntotal:
+            db = FAISS(embeddings, index, ChunkDocstore(store), _Positions(index.ntotal))
+            # o Searcher lê chunks, adjacência e BM25 direto do store
+            db.chunk_store = store
+            return db
+        with open(os.path.join(path, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+    except Exception:
+        return None
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
@@ -0,0 +1,164 @@
+"""
+Backend de embeddings ONNX int8 para CPU (PF_RAG_EMBED_BACKEND=onnx)
+
+O mesmo modelo do SBERT é exportado uma vez para ONNX e quantizado dinamicamente
+para int8 (pesos das camadas lineares); a inferência roda no onnxruntime com várias
+threads. Os textos são tokenizados uma vez, ordenados por tamanho e agrupados em
+lotes de comprimento parecido: cada lote é preenchido (padding) só até o maior
+texto do próprio lote, não até o máximo do modelo.
+
+A exportação exige torch/transformers (já instalados com sentence-transformers);
+depois disso a indexação e as consultas usam só onnxruntime + tokenizer.
+
+Conferência com o modelo PyTorch: python -m src.pf_rag.cli onnx-parity
+"""
+from __future__ import annotations
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+try:
+    import onnxruntime as ort  # type: ignore
+except Exception:  # pragma: no cover
+    ort = None  # type: ignore
+try:
+    from transformers import AutoTokenizer  # type: ignore
+except Exception:  # pragma: no cover
+    AutoTokenizer = None  # type: ignore
+
+from src.config.settings import Settings
+from .embed_index import SbertEmbeddings
+
+_ARQUIVO_INT8 = "model.int8.onnx"
+
+# Amostra da conferência de paridade: frases no registro dos normativos indexados
+AMOSTRA_PARIDADE = [
+    "Art. 1º Esta Instrução Normativa estabelece os procedimentos para concessão de férias aos servidores.",
+    "§ 2º O prazo para a posse será de trinta dias, contados da publicação do ato de provimento.",
+    "I - o servidor em estágio probatório não poderá ser cedido a outro órgão;",
+    "a) licença para tratamento de saúde, mediante inspeção por junta médica oficial;",
+    "Qual o prazo para tomar posse após a nomeação?",
+    "Como solicitar a remoção a pedido para outra localidade?",
+    "Parágrafo único. Os casos omissos serão resolvidos pela Diretoria de Gestão de Pessoas.",
+    "CAPÍTULO III DA JORNADA DE TRABALHO E DO CONTROLE DE FREQUÊNCIA",
+]
+
+
+def _model_dir(model_name: str) -> str:
+    return os.path.join(Settings.ONNX_DIR, model_name.replace("/", "__"))
+
+
+def export_onnx(model_name: str, destino: Optional[str] = None) -> str:
+    """Exporta o transformer para ONNX e quantiza os pesos para int8; devolve o caminho do modelo"""
+    import torch  # type: ignore
+    from transformers import AutoModel  # type: ignore
+    from onnxruntime.quantization import QuantType, quantize_dynamic  # type: ignore
+
+    destino = destino or _model_dir(model_name)
+    os.makedirs(destino, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    tokenizer.save_pretrained(destino)
+    model = AutoModel.from_pretrained(model_name).eval()
+
+    exemplo = tokenizer(["exemplo de exportação"], return_tensors="pt")
+    nomes = list(exemplo.keys())
+    eixos: Dict[str, Dict[int, str]] = {n: {0: "lote", 1: "tokens"} for n in nomes}
+    eixos["last_hidden_state"] = {0: "lote", 1: "tokens"}
+    fp32 = os.path.join(destino, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(model, (dict(exemplo),), fp32, input_names=nomes,
+                          output_names=["last_hidden_state"], dynamic_axes=eixos, opset_version=14)
+    int8 = os.path.join(destino, _ARQUIVO_INT8)
+    quantize_dynamic(fp32, int8, weight_type=QuantType.QInt8)
+    os.remove(fp32)
+    if Settings.VERBOSE:
+        print(f"📦 Modelo ONNX int8 exportado em {int8}")
+    return int8
+
+
+def _mean_pool(hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Média dos tokens (como o pooling do SentenceTransformer) seguida de norma L2"""
+    mask = mask[..., None].astype(np.float32)
+    soma = (hidden * mask).sum(axis=1)
+    vetores = soma / np.clip(mask.sum(axis=1), 1e-9, None)
+    return (vetores / np.clip(np.linalg.norm(vetores, axis=1, keepdims=True), 1e-12, None)).astype(np.float32)
+
+
+class OnnxEmbeddings(SbertEmbeddings):
+    """
+    SentenceTransformer exportado para ONNX int8. Só embed_array muda: as consultas e
+    a API em listas do LangChain vêm do SbertEmbeddings.
+    """
+
+    def __init__(self, model_name: Optional[str] = None, threads: Optional[int] = None,
+                 batch_size: Optional[int] = None, max_length: Optional[int] = None):
+        if ort is None or AutoTokenizer is None:
+            raise RuntimeError("onnxruntime/transformers não instalados")
+        self.model_name = model_name or Settings.SBERT_MODEL
+        self.batch_size = max(1, batch_size or Settings.ONNX_BATCH)
+        self.max_length = max_length or Settings.ONNX_MAX_LENGTH
+        pasta = _model_dir(self.model_name)
+        caminho = os.path.join(pasta, _ARQUIVO_INT8)
+        if not os.path.exists(caminho):
+            caminho = export_onnx(self.model_name, pasta)
+        self.tokenizer = AutoTokenizer.from_pretrained(pasta)
+
+        opcoes = ort.SessionOptions()
+        opcoes.intra_op_num_threads = max(1, threads or Settings.ONNX_THREADS)
+        opcoes.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(caminho, sess_options=opcoes, providers=["CPUExecutionProvider"])
+        self._inputs = [i.name for i in self.session.get_inputs()]
+
+    def _run(self, encoded: Dict[str, Any]) -> np.ndarray:
+        mask = np.asarray(encoded["attention_mask"], dtype=np.int64)
+        feed = {}
+        for nome in self._inputs:
+            valor = encoded.get(nome)
+            feed[nome] = np.zeros_like(mask) if valor is None else np.asarray(valor, dtype=np.int64)
+        hidden = self.session.run(None, feed)[0]
+        return _mean_pool(hidden, mask)
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        tokens = self.tokenizer(texts, truncation=True, max_length=self.max_length)
+        ordem = sorted(range(len(texts)), key=lambda i: len(tokens["input_ids"][i]))
+        saida: Optional[np.ndarray] = None
+        for inicio in range(0, len(ordem), self.batch_size):
+            lote = ordem[inicio:inicio + self.batch_size]
+            encoded = self.tokenizer.pad({k: [v[i] for i in lote] for k, v in tokens.items()},
+                                         padding=True, return_tensors="np")
+            vetores = self._run(encoded)
+            if saida is None:
+                saida = np.empty((len(texts), vetores.shape[1]), dtype=np.float32)
+            saida[lote] = vetores
+        return saida  # type: ignore[return-value]
+
+
+def parity_check(texts: Optional[List[str]] = None, model_name: Optional[str] = None,
+                 repeat: int = 8) -> Dict[str, float]:
+    """
+    Concordância ONNX int8 x PyTorch: cosseno por texto (vetores já normalizados) e
+    vazão de cada backend sobre a mesma amostra repetida `repeat` vezes.
+    """
+    texts = list(texts or AMOSTRA_PARIDADE) * max(1, repeat)
+    onnx = OnnxEmbeddings(model_name)
+    torch_model = SbertEmbeddings(onnx.model_name)
+    t0 = time.time()
+    a = onnx.embed_array(texts)
+    onnx_s = time.time() - t0
+    t0 = time.time()
+    b = torch_model.embed_array(texts)
+    torch_s = time.time() - t0
+    cos = (a * b).sum(axis=1)
+    return {
+        "textos": len(texts),
+        "cos_min": float(cos.min()),
+        "cos_media": float(cos.mean()),
+        "onnx_textos_s": len(texts) / max(1e-9, onnx_s),
+        "torch_textos_s": len(texts) / max(1e-9, torch_s),
+        "aceleracao": torch_s / max(1e-9, onnx_s),
+    }
@@ -0,0 +1,172 @@
+from __future__ import annotations
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain.embeddings.base import Embeddings
+
+try:
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover
+    np = None  # type: ignore
+
+from src.config.settings import Settings
+
+
+class EmbeddingScheduler:
+    """
+    Agenda os embeddings de um corpus em lotes concorrentes.
+
+    - Mantém até `in_flight` lotes em andamento (a fila nunca esvazia à espera do lote anterior).
+    - Ordena os textos por tamanho estimado (tokens) para que cada lote tenha textos parecidos,
+      reduzindo padding no SBERT e variação de latência no Ollama.
+    - Ajusta o tamanho do lote pela latência observada: cresce enquanto os lotes terminam bem
+      abaixo de `target_latency`, encolhe quando passam dela; `max_tokens` limita o payload.
+    - Informa progresso e vazão (chunks/s) pelo callback (frac, msg).
+    """
+
+    def __init__(self, embeddings: Embeddings, in_flight: Optional[int] = None,
+                 batch_size: Optional[int] = None, min_batch: Optional[int] = None,
+                 max_batch: Optional[int] = None, max_tokens: Optional[int] = None,
+                 target_latency: Optional[float] = None):
+        self.embeddings = embeddings
+        self.in_flight = max(1, in_flight or Settings.EMBED_IN_FLIGHT)
+        self.min_batch = max(1, min_batch or Settings.EMBED_BATCH_MIN)
+        self.max_batch = max(self.min_batch, max_batch or Settings.EMBED_BATCH_MAX)
+        self.batch_size = min(self.max_batch, max(self.min_batch, batch_size or Settings.EMBED_BATCH_SIZE))
+        self.max_tokens = max_tokens or Settings.EMBED_BATCH_TOKENS
+        self.target_latency = target_latency or Settings.EMBED_TARGET_LATENCY
+        # Histórico (tamanho do lote, latência) para diagnóstico
+        self.history: List[Tuple[int, float]] = []
+
+    def _adapt(self, size: int, latency: float) -> None:
+        self.history.append((size, latency))
+        if size < self.batch_size:
+            # lote final/limitado por tokens não diz nada sobre lotes maiores
+            if latency > self.target_latency:
+                self.batch_size = max(self.min_batch, size // 2 or 1)
+            return
+        if latency > self.target_latency:
+            self.batch_size = max(self.min_batch, self.batch_size // 2)
+        elif latency < self.target_latency / 2:
+            self.batch_size = min(self.max_batch, int(self.batch_size * 1.5) + 1)
+
+    def _next_batch(self, order: List[int], start: int, tokens: Sequence[int]) -> List[int]:
+        batch: List[int] = []
+        total = 0
+        for idx in order[start:start + self.batch_size]:
+            t = max(1, tokens[idx])
+            if batch and total + t > self.max_tokens:
+                break
+            batch.append(idx)
+            total += t
+        return batch
+
+    def embed(self, texts: List[str], tokens: Optional[Sequence[int]] = None,
+              progress_cb: Optional[Callable[[float, str], None]] = None) -> List[List[float]]:
+        """Retorna os vetores na ordem original de `texts`."""
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+
+        def store(batch: List[int], result: Any) -> None:
+            for i, vec in zip(batch, result):
+                vectors[i] = vec
+
+        self._run(texts, tokens, progress_cb, self.embeddings.embed_documents, store)
+        return vectors  # type: ignore[return-value]
+
+    def embed_array(self, texts: List[str], tokens: Optional[Sequence[int]] = None,
+                    progress_cb: Optional[Callable[[float, str], None]] = None) -> "np.ndarray":
+        """
+        Matriz float32 (n, dim) na ordem original de `texts`. Usa `embed_array` do modelo
+        quando existe (SBERT); os demais lotes são convertidos ao chegar. Nenhum vetor do
+        corpus vira lista de floats Python no caminho até o FAISS/Qdrant.
+        """
+        if np is None:
+            raise RuntimeError("numpy não instalado")
+        call = getattr(self.embeddings, "embed_array", None) or self.embeddings.embed_documents
+        matrix: List[Optional["np.ndarray"]] = [None]
+
+        def store(batch: List[int], result: Any) -> None:
+            lote = np.asarray(result, dtype=np.float32)
+            if matrix[0] is None:
+                matrix[0] = np.empty((len(texts), lote.shape[1]), dtype=np.float32)
+            matrix[0][batch] = lote
+
+        self._run(texts, tokens, progress_cb, call, store)
+        return matrix[0] if matrix[0] is not None else np.empty((0, 0), dtype=np.float32)
+
+    def _run(self, texts: List[str], tokens: Optional[Sequence[int]],
+             progress_cb: Optional[Callable[[float, str], None]],
+             call: Callable[[List[str]], Any], store: Callable[[List[int], Any], None]) -> None:
+        n = len(texts)
+        if n == 0:
+            return
+        if tokens is None or len(tokens) != n:
+            tokens = [max(1, len(t) // 4) for t in texts]
+        order = sorted(range(n), key=lambda i: tokens[i])
+        done = 0
+        cursor = 0
+        t0 = time.time()
+        pending: Dict[Future, Tuple[List[int], float]] = {}
+
+        def submit(pool: ThreadPoolExecutor) -> None:
+            nonlocal cursor
+            batch = self._next_batch(order, cursor, tokens)
+            cursor += len(batch)
+            fut = pool.submit(call, [texts[i] for i in batch])
+            pending[fut] = (batch, time.time())
+
+        with ThreadPoolExecutor(max_workers=self.in_flight, thread_name_prefix="embed") as pool:
+            while cursor < n and len(pending) < self.in_flight:
+                submit(pool)
+            while pending:
+                finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    batch, started = pending.pop(fut)
+                    result = fut.result()
+                    if len(result) != len(batch):
+                        raise RuntimeError(f"Embeddings: {len(result)} vetores para {len(batch)} textos")
+                    store(batch, result)
+                    done += len(batch)
+                    self._adapt(len(batch), time.time() - started)
+                    rate = done / max(1e-6, time.time() - t0)
+                    if Settings.VERBOSE:
+                        print(f"🧩 Lote {len(batch)} itens em {time.time()-started:.2f}s | {done}/{n} | {rate:.1f} chunks/s")
+                    if progress_cb:
+                        progress_cb(done / n, f"Embeddings {done}/{n} ({rate:.1f} chunks/s)")
+                while cursor < n and len(pending) < self.in_flight:
+                    submit(pool)
+
+
+class PrecomputedEmbeddings(Embeddings):
+    """
+    Serve vetores já calculados pelo scheduler aos construtores de vector store
+    (from_texts) e delega ao modelo original os textos desconhecidos e as consultas.
+    Com a matriz float32 do scheduler (embed_array), cada lote sai como fatia da matriz;
+    o vector store converte só o lote em andamento.
+    """
+
+    def __init__(self, base: Embeddings, texts: List[str], vectors: Any):
+        self.base = base
+        self._matrix = vectors if np is not None and isinstance(vectors, np.ndarray) else None
+        self._rows: Dict[str, int] = {t: i for i, t in enumerate(texts)} if self._matrix is not None else {}
+        self._lookup: Dict[str, List[float]] = {} if self._matrix is not None else dict(zip(texts, vectors))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:  # type: ignore[override]
+        if self._matrix is not None:
+            linhas = [self._rows.get(t) for t in texts]
+            if None not in linhas:
+                return self._matrix[linhas]
+        missing = [t for t in texts if t not in self._lookup and t not in self._rows]
+        if missing:
+            self._lookup.update(zip(missing, self.base.embed_documents(missing)))
+        return [self._lookup[t] if t in self._lookup else self._matrix[self._rows[t]].tolist() for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:  # type: ignore[override]
+        return self.base.embed_query(text)
+
+    def release(self) -> None:
+        """Libera os vetores após a construção; daí em diante tudo vai ao modelo original."""
+        self._lookup = {}
+        self._rows = {}
+        self._matrix = None
@@ -1,8 +1,14 @@
 from __future__ import annotations
+import contextvars
 import os
+import re
 import warnings
 import logging
-from typing import List, Tuple, Dict, Any
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Dict, Any, Optional, Iterable, Iterator
 from .types import PDFPage
 
 # Suprimir warnings específicos do pdfminer sobre cores inválidas
@@ -12,47 +18,185 @@ warnings.filterwarnings('ignore', message='Invalid float value')
 # Configurar logging do pdfminer para ERROR apenas (suprime warnings)
 logging.getLogger('pdfminer').setLevel(logging.ERROR)
 
-from pdfminer.high_level import extract_text as pdfminer_extract_text  # type: ignore
+from src.config.settings import Settings
+from src.utils.telemetry import span
+from .layout_store import get_store
 
-try:
-    import pytesseract  # type: ignore
-    from PIL import Image  # type: ignore
-    import pdf2image  # type: ignore
-except Exception:  # pragma: no cover
-    pytesseract = None  # type: ignore
-    Image = None  # type: ignore
-    pdf2image = None  # type: ignore
+# pdfminer, OCR (pytesseract/pdf2image) e Docling carregam no primeiro uso (_load_*):
+# importar este módulo (ou a UI/consulta que o referencia) não paga a pilha de ingestão.
+# Os nomes ficam no módulo para que os testes possam substituí-los.
+_NAO_CARREGADO: Any = object()
+pdfminer_extract_text: Any = _NAO_CARREGADO
+pytesseract: Any = _NAO_CARREGADO
+pdf2image: Any = _NAO_CARREGADO
+DocumentConverter: Any = _NAO_CARREGADO
+ConverterConfig: Any = _NAO_CARREGADO
+TextBlock: Any = _NAO_CARREGADO
+TableBlock: Any = _NAO_CARREGADO
 
-from src.config.settings import Settings
 
-# Docling optional import
-try:  # pragma: no cover
-    from docling.document_converter import DocumentConverter  # type: ignore
-    from docling.models.converter import ConverterConfig  # type: ignore
-    from docling.models.doc import DoclingDocument, TextBlock, TableBlock  # type: ignore
-except Exception:
-    DocumentConverter = None  # type: ignore
-    ConverterConfig = None  # type: ignore
-    DoclingDocument = None  # type: ignore
-    TextBlock = None  # type: ignore
-    TableBlock = None  # type: ignore
-
-# Cache interno para extras de layout por arquivo (usado pelo chunker)
-_LAYOUT_CACHE: Dict[str, Dict[str, Any]] = {}
+def _load_pdfminer() -> Any:
+    global pdfminer_extract_text
+    if pdfminer_extract_text is _NAO_CARREGADO:
+        from pdfminer.high_level import extract_text  # type: ignore
+        pdfminer_extract_text = extract_text
+    return pdfminer_extract_text
+
+
+def _load_ocr() -> bool:
+    """pytesseract + pdf2image; False quando não instalados"""
+    global pytesseract, pdf2image
+    if pytesseract is _NAO_CARREGADO or pdf2image is _NAO_CARREGADO:
+        try:
+            import pytesseract as tesseract  # type: ignore
+            import pdf2image as p2i  # type: ignore
+        except Exception:  # pragma: no cover
+            tesseract = p2i = None
+        if pytesseract is _NAO_CARREGADO:
+            pytesseract = tesseract
+        if pdf2image is _NAO_CARREGADO:
+            pdf2image = p2i
+    return pytesseract is not None and pdf2image is not None
+
+
+def _load_docling() -> bool:
+    """Conversor e blocos do Docling; False quando não instalado"""
+    global DocumentConverter, ConverterConfig, TextBlock, TableBlock
+    nomes = (DocumentConverter, ConverterConfig, TextBlock, TableBlock)
+    if any(n is _NAO_CARREGADO for n in nomes):
+        try:  # pragma: no cover
+            from docling.document_converter import DocumentConverter as conv  # type: ignore
+            from docling.models.converter import ConverterConfig as cfg  # type: ignore
+            from docling.models.doc import TextBlock as txt, TableBlock as tbl  # type: ignore
+            carregados = (conv, cfg, txt, tbl)
+        except Exception:
+            carregados = (None, None, None, None)
+        DocumentConverter, ConverterConfig, TextBlock, TableBlock = (
+            c if n is _NAO_CARREGADO else n for n, c in zip(nomes, carregados)
+        )
+    return DocumentConverter is not None
+
+
+def _resolve_pdf_path(path: str) -> str:
+    """Aceita caminho completo ou apenas o nome do arquivo (relativo a PDF_FOLDER)."""
+    if os.path.exists(path):
+        return path
+    return os.path.join(Settings.PDF_FOLDER, os.path.basename(path))
+
 
 def get_layout_extras(path: str) -> Dict[str, Any]:
-    return _LAYOUT_CACHE.get(path, {})
+    """
+    Extras de layout (Docling) do PDF, buscados pelo hash de conteúdo (usado pelo chunker
+    e pela UI). Sem Docling ou sem store gravado, retorna {} sem ler o PDF.
+    """
+    if not Settings.DOCLING_ENABLED:
+        return {}
+    try:
+        store = get_store()
+        if not store.exists():
+            return {}
+        return store.get_for_path(_resolve_pdf_path(path))
+    except Exception:
+        return {}
+
+
+# Conversor Docling do processo (modelos de layout carregados uma única vez por processo/worker)
+_CONVERTER: Optional[Any] = None
+_CONVERTER_LOCK = threading.Lock()
+
+
+def _get_converter() -> Any:
+    global _CONVERTER
+    with _CONVERTER_LOCK:
+        if _CONVERTER is None:
+            if not _load_docling():
+                raise RuntimeError("Docling não instalado")
+            _CONVERTER = DocumentConverter(ConverterConfig())
+        return _CONVERTER
+
 
+def _discard_converter(converter: Any) -> None:
+    """Descarta um conversor preso em conversão lenta; o próximo uso cria outro."""
+    global _CONVERTER
+    with _CONVERTER_LOCK:
+        if _CONVERTER is converter:
+            _CONVERTER = None
+
+
+def _docling_timeout(path: str) -> Optional[float]:
+    per_page = Settings.DOCLING_PAGE_TIMEOUT
+    if per_page <= 0:
+        return None
+    n_pages = _page_count(path)
+    return per_page * n_pages if n_pages else None
+
+
+def _docling_convert(paths: List[str]) -> Iterator[Tuple[str, Optional[Any]]]:
+    """
+    Converte documentos em lote com o conversor compartilhado, em thread de fundo.
+    Produz (path, doc) na ordem de entrada; doc=None indica erro ou estouro do
+    tempo limite (DOCLING_PAGE_TIMEOUT x páginas, contado do início da conversão
+    daquele documento) e o chamador recorre ao pdfminer.
 
-def _extract_with_docling(path: str) -> Tuple[str, List[PDFPage], bool, Dict[str, Any]]:
-    """Extrai usando Docling (quando habilitado) com preservação de layout.
+    A thread converte no máximo um documento à frente do consumidor (fila de tamanho 1).
+    O Docling não tem cancelamento: no tempo limite a conversão é abandonada, não
+    interrompida. A thread presa segue até terminar o documento corrente, com o
+    conversor antigo em memória, enquanto um conversor novo é criado para o restante.
+    """
+    pending = list(paths)
+    while pending:
+        converter = _get_converter()
+        results: "queue.Queue[Tuple[str, Optional[Any]]]" = queue.Queue(maxsize=1)
+        started: Dict[str, float] = {}
+        cancelled = threading.Event()
+
+        def run(batch=pending, conv=converter, out=results, inicio=started, stop=cancelled) -> None:
+            for p in batch:
+                if stop.is_set():
+                    return
+                inicio[p] = time.monotonic()
+                try:
+                    with span("ingest.extract", arquivo=os.path.basename(p), motor="docling"):
+                        doc = conv.convert(p)
+                except Exception:
+                    doc = None
+                # Fila cheia: espera o consumidor, mas desiste se ele abandonou o lote
+                while not stop.is_set():
+                    try:
+                        out.put((p, doc), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+
+        # contexto copiado: os spans da thread entram no rastro da ingestão que a disparou
+        ctx = contextvars.copy_context()
+        threading.Thread(target=ctx.run, args=(run,), name="docling-convert", daemon=True).start()
+        try:
+            for i, path in enumerate(pending):
+                limite = _docling_timeout(path)
+                # Documento ainda não iniciado (a thread acabou de entregar o anterior): prazo a partir de agora
+                agora = time.monotonic()
+                espera = None if limite is None else max(0.0, started.get(path, agora) + limite - agora)
+                try:
+                    _, doc = results.get(timeout=espera)
+                except queue.Empty:
+                    print(f"⏱️ Docling excedeu o tempo limite em {os.path.basename(path)}; usando pdfminer")
+                    _discard_converter(converter)
+                    yield path, None
+                    pending = pending[i + 1:]
+                    break
+                yield path, doc
+            else:
+                pending = []
+        finally:
+            # interrompe a thread após o documento corrente (timeout ou consumidor encerrado)
+            cancelled.set()
+
+
+def _docling_to_pages(doc: Any, path: str) -> Tuple[str, List[PDFPage], bool, Dict[str, Any]]:
+    """Monta texto/páginas a partir do documento Docling com preservação de layout.
     Retorna (texto, pages, ocr_usado=False, extras) onde extras pode conter blocos, tabelas, bbox por página.
     """
-    if DocumentConverter is None:
-        raise RuntimeError("Docling não instalado")
-    cfg = ConverterConfig()
-    converter = DocumentConverter(cfg)
-    doc = converter.convert(path)
     # Concatenar blocos em ordem de leitura
     pages: List[PDFPage] = []
     texts: List[str] = []
@@ -123,81 +267,227 @@ def _extract_with_docling(path: str) -> Tuple[str, List[PDFPage], bool, Dict[str
         full_cursor += len(page_text) + 1
     full_text = "\f".join(texts)
     extras = {"layout_blocks": page_map}
-    _LAYOUT_CACHE[path] = extras
+    try:
+        get_store().put_for_path(path, extras)
+    except Exception as e:
+        print(f"⚠️ Falha ao persistir layout de {os.path.basename(path)}: {e}")
     return full_text, pages, False, extras
 
 
-def _safe_pdfminer_extract(path: str) -> str:
-    """
-    Wrapper robusto para pdfminer que captura warnings sobre cores inválidas.
-    """
+def _pdfminer_quiet(path: str, page_numbers: Optional[range] = None) -> str:
+    """pdfminer com stderr e warnings suprimidos (cores inválidas etc.)."""
     import io
-    import sys
     import contextlib
 
-    # Capturar stderr temporariamente para suprimir warnings
-    old_stderr = sys.stderr
+    with contextlib.redirect_stderr(io.StringIO()):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            return _load_pdfminer()(path, page_numbers=page_numbers) or ""
+
 
+def _pdfminer_range(job: Tuple[str, int, int]) -> str:
+    """Extrai as páginas [início, fim) (base 0); executado nos processos do pool."""
+    path, start, end = job
+    return _pdfminer_quiet(path, range(start, end))
+
+
+def _pdfminer_parallel(path: str, n_pages: int) -> str:
+    """
+    Extração por faixas contíguas de páginas em processos. Cada página do pdfminer
+    termina em "\\f" e é independente das demais: a concatenação em ordem é
+    idêntica (byte a byte) à extração sequencial.
+    """
+    workers = min(Settings.PDFMINER_WORKERS, n_pages)
+    step = max(16, -(-n_pages // (workers * 4)))
+    jobs = [(path, s, min(s + step, n_pages)) for s in range(0, n_pages, step)]
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        return "".join(ex.map(_pdfminer_range, jobs))
+
+
+def _safe_pdfminer_extract(path: str) -> str:
+    """
+    Wrapper robusto para pdfminer que captura warnings sobre cores inválidas.
+    PDFs com PDFMINER_PARALLEL_MIN_PAGES páginas ou mais são extraídos em paralelo.
+    """
     try:
-        with contextlib.redirect_stderr(io.StringIO()):
-            # Suprimir warnings temporariamente
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                text = pdfminer_extract_text(path) or ""
-                return text
+        min_pages = Settings.PDFMINER_PARALLEL_MIN_PAGES
+        if min_pages > 0 and Settings.PDFMINER_WORKERS > 1:
+            n_pages = _pdfminer_page_count(path)
+            if n_pages >= min_pages:
+                try:
+                    return _pdfminer_parallel(path, n_pages)
+                except Exception as e:
+                    if Settings.VERBOSE:
+                        print(f"⚠️ Extração paralela indisponível ({e}); seguindo sequencialmente")
+        return _pdfminer_quiet(path)
     except Exception as e:
         # Log apenas erros críticos, não warnings de cor
         if "gray non-stroke color" not in str(e):
             print(f"Erro na extração PDF: {e}")
         return ""
-    finally:
-        sys.stderr = old_stderr
 
 
-def extract_text(path: str) -> Tuple[str, List[PDFPage], bool]:
+_CID = re.compile(r"\(cid:\d+\)")
+
+
+def _split_pages(text: str) -> List[str]:
+    """Separa páginas do pdfminer (um "\\f" ao final de cada página)."""
+    parts = text.split("\f")
+    if len(parts) > 1 and parts[-1] == "":
+        parts.pop()
+    return parts
+
+
+def _garbled(page_text: str) -> bool:
+    """Camada de texto dominada por glifos não mapeados (\ufffd ou (cid:N) do pdfminer)."""
+    t = _CID.sub("\ufffd", page_text)
+    visible = len(t) - sum(map(str.isspace, t))
+    return visible > 0 and t.count("\ufffd") / visible > 0.1
+
+
+def _needs_ocr(page_text: str) -> bool:
     """
-    Extrai o texto do PDF com preferência por Docling (layout-aware).
-    Fallback: pdfminer + OCR. Returns: (texto_concatenado, pages, ocr_usado)
+    Página sem camada de texto útil: vazia/quase vazia ou com glifos não mapeados.
+    Sumários com pontilhado, capas ("ANEXO I") e tabelas numéricas ficam com o pdfminer.
     """
-    if not os.path.exists(path):
-        raise FileNotFoundError(path)
+    visible = len(page_text) - sum(map(str.isspace, page_text))
+    return visible < Settings.OCR_MIN_CHARS or _garbled(page_text)
 
-    text = ""
-    ocr_used = False
-    pages: List[PDFPage] = []
-    # Docling preferencial
-    if Settings.DOCLING_ENABLED and DocumentConverter is not None:
+
+def _ocr_is_better(original: str, ocr_text: Optional[str]) -> bool:
+    """
+    Troca o texto do pdfminer pelo OCR apenas quando o ganho é claro: página vazia, com
+    glifos não mapeados ou OCR com pelo menos o dobro de caracteres alfanuméricos
+    (página digitalizada com só um carimbo ou número na camada de texto).
+    """
+    if not ocr_text or not ocr_text.strip():
+        return False
+    if not original.strip() or _garbled(original):
+        return True
+    achados = sum(map(str.isalnum, ocr_text))
+    return achados >= Settings.OCR_MIN_CHARS and achados >= 2 * sum(map(str.isalnum, original))
+
+
+def _pdfminer_page_count(path: str) -> int:
+    """Número de páginas segundo o próprio pdfminer (mesma árvore usada na extração)."""
+    try:
+        from pdfminer.pdfpage import PDFPage as MinerPage  # type: ignore
+        with open(path, "rb") as fh:
+            return sum(1 for _ in MinerPage.get_pages(fh))
+    except Exception:
+        return 0
+
+
+def _page_count(path: str) -> int:
+    if _load_ocr():
         try:
-            full_text, pages, ocr_used, extras = _extract_with_docling(path)
-            # Guardar extras em arquivo lateral opcional (para debug/auditoria)
-            # Poderíamos expor via metadados em etapas posteriores
-            return full_text, pages, ocr_used
+            return int(pdf2image.pdfinfo_from_path(path).get("Pages", 0))
         except Exception:
-            # Fallback silencioso
             pass
+    return _pdfminer_page_count(path)
+
+
+def _ocr_page(job: Tuple[str, int, int, str]) -> Optional[str]:
+    """Rasteriza e reconhece uma única página (executado nos processos do pool)."""
+    path, page_no, dpi, lang = job
+    if not _load_ocr():
+        return None
+    try:
+        images = pdf2image.convert_from_path(path, dpi=dpi, first_page=page_no, last_page=page_no)
+    except Exception:
+        return None
+    try:
+        return pytesseract.image_to_string(images[0], lang=lang) if images else None
+    except Exception:
+        return None
+    finally:
+        for img in images:
+            img.close()
+
+
+def _ocr_pages(path: str, page_numbers: List[int]) -> Dict[int, Optional[str]]:
+    """OCR apenas das páginas pedidas, uma página por vez em cada processo (memória limitada)."""
+    jobs = [(path, n, Settings.OCR_DPI, Settings.OCR_LANG) for n in page_numbers]
+    workers = min(max(1, Settings.OCR_WORKERS), len(jobs))
+    if workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                return dict(zip(page_numbers, ex.map(_ocr_page, jobs)))
+        except Exception as e:
+            if Settings.VERBOSE:
+                print(f"⚠️ Pool de OCR indisponível ({e}); seguindo sequencialmente")
+    return {n: _ocr_page(job) for n, job in zip(page_numbers, jobs)}
 
+
+def _extract_pdfminer_ocr(path: str) -> Tuple[str, List[PDFPage], bool]:
+    """pdfminer + OCR seletivo apenas nas páginas sem camada de texto útil."""
+    text = ""
+    ocr_used = False
+    pages: List[PDFPage] = []
     try:
-        text = _safe_pdfminer_extract(path)
+        with span("ingest.extract", arquivo=os.path.basename(path), motor="pdfminer"):
+            text = _safe_pdfminer_extract(path)
     except Exception:
         text = ""
 
-    if text.strip():
-        # pdf pesquisável
-        split = text.split("\f") if "\f" in text else text.split("\x0c")
-        for i, t in enumerate(split):
-            pages.append(PDFPage(index=i + 1, text=t))
-        return text, pages, ocr_used
-
-    # Fallback OCR
-    if Settings.OCR_ENABLED and pdf2image is not None and pytesseract is not None:
-        images = pdf2image.convert_from_path(path)
-        buf: List[str] = []
-        for i, img in enumerate(images):
-            page_text = pytesseract.image_to_string(img, lang=Settings.OCR_LANG)
-            pages.append(PDFPage(index=i + 1, text=page_text))
-            buf.append(page_text)
-        ocr_used = True
-        return "\n\n".join(buf), pages, ocr_used
-
-    # Sem OCR disponível
-    raise RuntimeError("Falha ao extrair texto do PDF (sem OCR disponível)")
+    page_texts = _split_pages(text)
+    ocr_available = Settings.OCR_ENABLED and _load_ocr()
+    if not text.strip():
+        if not ocr_available:
+            # Sem OCR disponível
+            raise RuntimeError("Falha ao extrair texto do PDF (sem OCR disponível)")
+        # Documento inteiramente digitalizado: pdfminer não informa as páginas
+        page_texts = [""] * max(len(page_texts), _page_count(path))
+
+    if ocr_available:
+        targets = [i + 1 for i, t in enumerate(page_texts) if _needs_ocr(t)]
+        if targets:
+            if Settings.VERBOSE:
+                print(f"🔎 OCR em {len(targets)}/{len(page_texts)} páginas de {os.path.basename(path)}")
+            with span("ingest.ocr", arquivo=os.path.basename(path), paginas=len(targets)):
+                reconhecidas = _ocr_pages(path, targets)
+            for n, page_text in reconhecidas.items():
+                if _ocr_is_better(page_texts[n - 1], page_text):
+                    page_texts[n - 1] = page_text
+                    ocr_used = True
+
+    for i, t in enumerate(page_texts):
+        pages.append(PDFPage(index=i + 1, text=t))
+    return ("\f".join(page_texts) if ocr_used else text), pages, ocr_used
+
+
+def iter_extract_text(paths: Iterable[str]) -> Iterator[Tuple[str, Tuple[str, List[PDFPage], bool]]]:
+    """
+    Extrai vários PDFs reaproveitando o mesmo conversor Docling (conversão em lote).
+    Produz (path, (texto_concatenado, pages, ocr_usado)) na ordem de entrada.
+    """
+    paths = list(paths)
+    for path in paths:
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+
+    if not (Settings.DOCLING_ENABLED and _load_docling()):
+        for path in paths:
+            yield path, _extract_pdfminer_ocr(path)
+        return
+
+    for path, doc in _docling_convert(paths):
+        if doc is not None:
+            try:
+                full_text, pages, ocr_used, extras = _docling_to_pages(doc, path)
+                yield path, (full_text, pages, ocr_used)
+                continue
+            except Exception:
+                # Fallback silencioso
+                pass
+        yield path, _extract_pdfminer_ocr(path)
+
+
+def extract_text(path: str) -> Tuple[str, List[PDFPage], bool]:
+    """
+    Extrai o texto do PDF com preferência por Docling (layout-aware).
+    Fallback: pdfminer + OCR seletivo. Returns: (texto_concatenado, pages, ocr_usado)
+    """
+    for _, result in iter_extract_text([path]):
+        return result
+    raise RuntimeError(f"Falha ao extrair texto de {path}")
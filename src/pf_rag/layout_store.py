@@ -0,0 +1,155 @@
+"""
+Armazenamento persistente dos extras de layout (Docling) por hash de conteúdo do PDF.
+
+SQLite em modo WAL: compartilhado entre processos (workers de ingestão, UI) sem
+reexecutar o Docling, com tamanho limitado (LAYOUT_STORE_MAX_MB). Leituras abrem o
+arquivo só para leitura; o descarte sai pelas entradas gravadas (extraídas) há mais tempo.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+from src.config.settings import Settings
+
+# caminho absoluto -> (tamanho, mtime, sha256): evita reler o arquivo a cada consulta.
+# Limitado (processos longos veem muitos PDFs): sai o caminho memorizado há mais tempo
+_HASH_MEMO: Dict[str, Tuple[int, float, str]] = {}
+_HASH_MEMO_MAX = 4096
+_MEMO_LOCK = threading.Lock()
+
+
+def content_hash(path: str) -> Optional[str]:
+    """SHA-256 do conteúdo do arquivo; None se o arquivo não existir."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = os.path.abspath(path)
+    with _MEMO_LOCK:
+        memo = _HASH_MEMO.get(key)
+    if memo and memo[0] == st.st_size and memo[1] == st.st_mtime:
+        return memo[2]
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    with _MEMO_LOCK:
+        _HASH_MEMO.pop(key, None)
+        while len(_HASH_MEMO) >= _HASH_MEMO_MAX:
+            del _HASH_MEMO[next(iter(_HASH_MEMO))]
+        _HASH_MEMO[key] = (st.st_size, st.st_mtime, digest)
+    return digest
+
+
+def _decode(blob: bytes) -> Dict[str, Any]:
+    extras = json.loads(zlib.decompress(blob).decode("utf-8"))
+    # JSON converte as chaves de página em str; o chunker consulta por int
+    blocks = extras.get("layout_blocks")
+    if isinstance(blocks, dict):
+        extras["layout_blocks"] = {int(k) if str(k).isdigit() else k: v for k, v in blocks.items()}
+    return extras
+
+
+class LayoutStore:
+    """Extras de layout por hash de conteúdo, persistidos em SQLite."""
+
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.path = path or Settings.LAYOUT_STORE_PATH
+        self.max_bytes = max_bytes if max_bytes is not None else Settings.LAYOUT_STORE_MAX_MB * 1024 * 1024
+
+    def _connect(self) -> sqlite3.Connection:
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS layout ("
+            " hash TEXT PRIMARY KEY, arquivo TEXT, dados BLOB NOT NULL,"
+            " tamanho INTEGER NOT NULL, acesso REAL NOT NULL)"
+        )
+        return conn
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def get(self, key: str) -> Dict[str, Any]:
+        """Consulta só leitura: não cria o arquivo nem grava (o chunker chama por PDF)"""
+        if not self.exists():
+            return {}
+        conn = sqlite3.connect(f"file:{os.path.abspath(self.path)}?mode=ro", uri=True, timeout=30)
+        try:
+            row = conn.execute("SELECT dados FROM layout WHERE hash = ?", (key,)).fetchone()
+            return _decode(row[0]) if row else {}
+        except sqlite3.OperationalError:
+            # arquivo ainda sem a tabela (criado por outro processo neste instante)
+            return {}
+        finally:
+            conn.close()
+
+    def put(self, key: str, extras: Dict[str, Any], arquivo: Optional[str] = None) -> None:
+        blob = zlib.compress(json.dumps(extras, ensure_ascii=False).encode("utf-8"))
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO layout (hash, arquivo, dados, tamanho, acesso) VALUES (?, ?, ?, ?, ?)",
+                    (key, arquivo, blob, len(blob), time.time()),
+                )
+                self._evict(conn, keep=key)
+        finally:
+            conn.close()
+
+    def _evict(self, conn: sqlite3.Connection, keep: str) -> None:
+        """
+        Descarta as entradas gravadas há mais tempo (exceto a recém-gravada) até caber em
+        max_bytes. Ordem de gravação, não de uso: leituras são só leitura e não atualizam
+        a coluna `acesso` (mantida com esse nome por compatibilidade com stores existentes).
+        """
+        total = conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM layout").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        rows = conn.execute("SELECT hash, tamanho FROM layout WHERE hash != ? ORDER BY acesso ASC", (keep,))
+        for key, size in rows.fetchall():
+            if total <= self.max_bytes:
+                break
+            victims.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM layout WHERE hash = ?", victims)
+
+    def get_for_path(self, path: str) -> Dict[str, Any]:
+        if not self.exists():
+            return {}
+        key = content_hash(path)
+        return self.get(key) if key else {}
+
+    def put_for_path(self, path: str, extras: Dict[str, Any]) -> None:
+        key = content_hash(path)
+        if key:
+            self.put(key, extras, os.path.basename(path))
+
+    def __len__(self) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM layout").fetchone()[0]
+        finally:
+            conn.close()
+
+
+_STORE: Optional[LayoutStore] = None
+
+
+def get_store() -> LayoutStore:
+    """Instância padrão do processo (configurada por Settings)."""
+    global _STORE
+    if _STORE is None:
+        _STORE = LayoutStore()
+    return _STORE
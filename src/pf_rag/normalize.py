@@ -1,73 +1,176 @@
 from __future__ import annotations
 import re
-from typing import List, Tuple
-from .types import PDFPage
-from .io_pdf import get_layout_extras
+from bisect import bisect_right
+from typing import Dict, List, Set, Tuple
+from .types import PDFPage, OffsetMap
+from . import regexes as RX
+from src.config.settings import Settings
 
-HIFEN_LINHA = re.compile(r"(\w+)-\n(\w+)")
 ESPACOS = re.compile(r"[ \t]+")
+DIGITOS = re.compile(r"\d+")
+# Unifica quebras indevidas de parágrafo dentro do mesmo dispositivo (heurística leve)
+JUNTA_DISPOSITIVO = re.compile(r"(Art\.|§|[IVXLCDM]+|[a-z]\))\s*\n+(?=\S)")
+_FIM_HIFEN = re.compile(r"\w-\Z")
+_INICIO_PALAVRA = re.compile(r"\w")
 
+_PREFIXOS_ESTRUTURA = ("CAPÍTULO", "CAPITULO", "SEÇÃO", "SECAO", "TÍTULO", "TITULO")
+_RX_ESTRUTURA = (RX.ARTIGO, RX.PARAGRAFO, RX.PARAGRAFO_UNICO, RX.ANEXO, RX.PARTE_LIVRO)
+# Repetição mínima (páginas) para ruído: em documentos curtos, 2 páginas com a mesma
+# linha na borda costumam ser conteúdo (ex.: rubrica repetida), não cabeçalho
+_HF_MIN_PAGES = 3
 
-def _remove_headers_footers(pages: List[PDFPage]) -> List[PDFPage]:
-    """Remove headers/footers repetitivos por heurística simples."""
-    # Coleta as primeiras e últimas linhas de cada página, usando leitura já ordenada
-    # Heurística com sinais de layout: não remover cabeçalhos estruturais (Capítulo/Seção/Título)
-    heads = {}
-    foots = {}
-    for p in pages:
-        lines = [l.strip() for l in p.text.splitlines() if l.strip()]
-        if not lines:
-            continue
-        head = lines[0]
-        tail = lines[-1]
-        heads[head] = heads.get(head, 0) + 1
-        foots[tail] = foots.get(tail, 0) + 1
-
-    # Considera header/footer quando aparece em >= 50% das páginas e não parece rubrica de capítulo
-    def is_noise(line: str) -> bool:
-        if not line:
-            return False
-        upper = line.upper()
-        # Não tratar como ruído se parecer seção estruturante
-        if upper.startswith("CAPÍTULO") or upper.startswith("CAPITULO") or upper.startswith("SEÇÃO") or upper.startswith("SECAO") or upper.startswith("TÍTULO") or upper.startswith("TITULO"):
-            return False
+
+def _split_lines(text: str) -> List[str]:
+    """Divide a página uma única vez (mesma semântica de splitlines para a quebra final)."""
+    lines = text.split("\n")
+    if len(lines) > 1 and lines[-1] == "":
+        lines.pop()
+    return lines
+
+
+def _mask(line: str) -> str:
+    """Chave de comparação da linha: dígitos mascarados (numeração de página varia)."""
+    return DIGITOS.sub("#", " ".join(line.split())).casefold()
+
+
+def _is_structural(line: str) -> bool:
+    """Rubricas estruturantes (Capítulo/Seção/Título, Art., §) nunca são tratadas como ruído."""
+    if line.upper().startswith(_PREFIXOS_ESTRUTURA):
         return True
+    return any(rx.match(line) for rx in _RX_ESTRUTURA)
 
-    # Seja mais conservador com headers; mais permissivo com footers
-    head_threshold = max(3, int(0.7 * max(heads.values()) if heads else 0))
-    foot_threshold = max(2, int(0.5 * max(foots.values()) if foots else 0))
 
-    common_heads = {k for k, v in heads.items() if v >= head_threshold and is_noise(k)}
-    common_foots = {k for k, v in foots.items() if v >= foot_threshold and is_noise(k)}
+def _edge_indices(lines: List[str], n: int) -> List[int]:
+    """Índices das n primeiras e n últimas linhas não vazias da página."""
+    top: List[int] = []
+    for i, l in enumerate(lines):
+        if l.strip():
+            top.append(i)
+            if len(top) == n:
+                break
+    bottom: List[int] = []
+    for i in range(len(lines) - 1, (top[-1] if top else -1), -1):
+        if lines[i].strip():
+            bottom.append(i)
+            if len(bottom) == n:
+                break
+    return top + bottom[::-1]
 
-    cleaned: List[PDFPage] = []
-    for p in pages:
-        lines = p.text.splitlines()
-        if lines and lines[0].strip() in common_heads:
-            lines = lines[1:]
-        if lines and lines[-1].strip() in common_foots:
-            lines = lines[:-1]
-        cleaned.append(PDFPage(index=p.index, text="\n".join(lines)))
-    return cleaned
 
+def _detect_headers_footers(page_lines: List[List[str]], n: int) -> Set[str]:
+    """Chaves mascaradas que se repetem nas bordas de >= HF_MIN_RATIO das páginas (mínimo 3)."""
+    counts: Dict[str, int] = {}
+    for lines in page_lines:
+        for key in {_mask(lines[i]) for i in _edge_indices(lines, n)}:
+            counts[key] = counts.get(key, 0) + 1
+    threshold = max(_HF_MIN_PAGES, int(Settings.HF_MIN_RATIO * len(page_lines) + 0.5))
+    return {k for k, v in counts.items() if v >= threshold}
 
-def clean_text(raw_text: str, pages: List[PDFPage]) -> Tuple[str, List[PDFPage]]:
+
+def _noise_indices(lines: List[str], noise: Set[str], n: int) -> Set[int]:
+    if not noise:
+        return set()
+    return {
+        i for i in _edge_indices(lines, n)
+        if _mask(lines[i]) in noise and not _is_structural(lines[i].strip())
+    }
+
+
+def _join_dispositivos(full: str, seg_starts: List[int]) -> Tuple[str, List[int]]:
+    """Aplica JUNTA_DISPOSITIVO e reprojeta os inícios de segmento no texto resultante."""
+    out: List[str] = []
+    ws_starts: List[int] = []
+    ws_ends: List[int] = []
+    deltas: List[int] = []
+    last = 0
+    delta = 0
+    for m in JUNTA_DISPOSITIVO.finditer(full):
+        ws = m.end(1)
+        out.append(full[last:ws])
+        out.append(" ")
+        delta += (m.end() - ws) - 1
+        last = m.end()
+        ws_starts.append(ws)
+        ws_ends.append(m.end())
+        deltas.append(delta)
+    if not ws_ends:
+        return full, seg_starts
+    out.append(full[last:])
+
+    moved: List[int] = []
+    for s in seg_starts:
+        k = bisect_right(ws_ends, s) - 1
+        nxt = k + 1
+        if nxt < len(ws_ends) and ws_starts[nxt] <= s:
+            # segmento começa dentro de uma quebra consumida: cola no início da linha seguinte
+            moved.append(ws_ends[nxt] - deltas[nxt])
+        else:
+            moved.append(s - (deltas[k] if k >= 0 else 0))
+    return "".join(out), moved
+
+
+def clean_text_with_offsets(raw_text: str, pages: List[PDFPage]) -> Tuple[str, List[PDFPage], OffsetMap]:
     """
-    Normaliza texto: corrige hifenização, remove headers/footers repetidos, normaliza espaços.
-    Retorna texto limpo e páginas limpas.
+    Normalização em passada única por página: remove headers/footers, corrige hifenização
+    e normaliza espaços linha a linha. Retorna texto limpo, páginas limpas e o mapa de
+    offsets (texto limpo -> página/offset bruto em PDFPage.text).
     """
-    # Atualiza páginas
-    pages2 = _remove_headers_footers(pages)
+    n = max(1, Settings.HF_SCAN_LINES)
+    page_lines = [_split_lines(p.text) for p in pages]
+    noise = _detect_headers_footers(page_lines, n)
 
-    # Corrige hifenização em cada página
     fixed_pages: List[PDFPage] = []
-    for p in pages2:
-        t = HIFEN_LINHA.sub(r"\1\2", p.text)
-        t = ESPACOS.sub(" ", t)
-        fixed_pages.append(PDFPage(index=p.index, text=t))
+    seg_starts: List[int] = []
+    seg_pages: List[int] = []
+    seg_raw: List[int] = []
+    cursor = 0
+    for p, lines in zip(pages, page_lines):
+        drop = _noise_indices(lines, noise, n)
+        out_lines: List[str] = []
+        pos = 0
+        raw_off = 0
+        for i, line in enumerate(lines):
+            raw_start = raw_off
+            raw_off += len(line) + 1
+            if i in drop:
+                continue
+            t = line.rstrip("\r")
+            if "  " in t or "\t" in t:
+                t = ESPACOS.sub(" ", t)
+            if out_lines and _INICIO_PALAVRA.match(t) and _FIM_HIFEN.search(out_lines[-1]):
+                # hifenização de fim de linha: "dispo-\nsição" -> "disposição"
+                out_lines[-1] = out_lines[-1][:-1] + t
+                pos -= 1
+            else:
+                if out_lines:
+                    pos += 1
+                out_lines.append(t)
+            seg_starts.append(cursor + pos)
+            seg_pages.append(p.index)
+            seg_raw.append(raw_start)
+            pos += len(t)
+        page_text = "\n".join(out_lines)
+        fixed_pages.append(PDFPage(index=p.index, text=page_text))
+        cursor += len(page_text) + 1
 
     full = "\n".join(p.text for p in fixed_pages)
-    # Unifica quebras indevidas de parágrafo dentro do mesmo dispositivo (heurística leve)
-    full = re.sub(r"(Art\.|§|[IVXLCDM]+|[a-z]\))\s*\n+(?=\S)", r"\1 ", full)
+    full, seg_starts = _join_dispositivos(full, seg_starts)
+
+    offsets = OffsetMap()
+    for s, pg, r in zip(seg_starts, seg_pages, seg_raw):
+        if offsets.clean_starts and offsets.clean_starts[-1] == s:
+            # linha vazia ou absorvida: prevalece o segmento mais recente
+            offsets.pages[-1] = pg
+            offsets.raw_starts[-1] = r
+        else:
+            offsets.add(s, pg, r)
+    return full, fixed_pages, offsets
+
 
+def clean_text(raw_text: str, pages: List[PDFPage]) -> Tuple[str, List[PDFPage]]:
+    """
+    Normaliza texto: corrige hifenização, remove headers/footers repetidos, normaliza espaços.
+    Retorna texto limpo e páginas limpas.
+    """
+    full, fixed_pages, _ = clean_text_with_offsets(raw_text, pages)
     return full, fixed_pages
@@ -0,0 +1,66 @@
+from __future__ import annotations
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from src.config.settings import Settings
+from src.utils.telemetry import cache_result
+
+_ESPACOS = re.compile(r"\s+")
+
+# (id do chunk, score, documento)
+Resultado = Tuple[str, float, Any]
+
+
+def normalize_query(q: str) -> str:
+    """Caixa, espaços e pontuação final não mudam a busca."""
+    return _ESPACOS.sub(" ", q.lower()).strip().rstrip("?.!").strip()
+
+
+class RetrievalCache:
+    """
+    LRU em memória dos resultados da busca híbrida (denso + BM25).
+
+    Chave: (consulta normalizada, top_k, filtros, geração do índice); valor: ids dos
+    chunks candidatos com seus scores (e a referência ao documento já carregado no
+    docstore, sem cópia). Compartilhado entre a cadeia de resposta e a prévia de
+    trechos, a mesma consulta não é embedada nem buscada duas vezes.
+    """
+
+    def __init__(self, max_size: Optional[int] = None):
+        self.max_size = max(1, max_size or Settings.RETRIEVAL_CACHE_SIZE)
+        self._data: "OrderedDict[Hashable, List[Resultado]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(q: str, top_k: int, filters: Optional[Dict[str, Any]], generation: int) -> Hashable:
+        filtros = tuple(sorted((k, repr(v)) for k, v in (filters or {}).items()))
+        return normalize_query(q), int(top_k), filtros, int(generation)
+
+    def get(self, key: Hashable) -> Optional[List[Resultado]]:
+        with self._lock:
+            valor = self._data.get(key)
+            if valor is None:
+                self.misses += 1
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+        cache_result("retrieval", valor is not None)
+        return valor
+
+    def put(self, key: Hashable, resultados: List[Resultado]) -> None:
+        with self._lock:
+            self._data[key] = resultados
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -1,49 +1,278 @@
 from __future__ import annotations
-from typing import Any, Dict, Optional
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
 from src.config.settings import Settings
+from .chunk_store import adjacency, tokenize
+from .retrieval_cache import RetrievalCache
+from src.utils.telemetry import span
 
 try:
     from rank_bm25 import BM25Okapi  # type: ignore
 except Exception:
     BM25Okapi = None  # type: ignore
 
+# Constante da fusão por posição (Reciprocal Rank Fusion)
+_RRF_K = 60
+# Rótulos hierárquicos que, presentes na pergunta e no breadcrumb, sobem o trecho
+_ROTULOS = ("art.", "§", "capítulo", "seção", "inciso", "alínea")
+# Bônus máximo dos rótulos = metade do peso de um 1º lugar em uma das listas: reordena
+# vizinhos próximos, mas não passa à frente de quem as duas buscas concordam
+_BONUS_MAX = 0.5 / (_RRF_K + 1)
+# Dispositivos curtos que costumam depender dos vizinhos (enumerações)
+_NIVEIS_VIZINHOS = {"inciso", "alinea", "item"}
+
+
+def chunk_id(doc: Any) -> str:
+    """Identificador estável do chunk: anchor_id do pipeline PF ou hash do conteúdo."""
+    anchor = (doc.metadata or {}).get("anchor_id")
+    if anchor:
+        return str(anchor)
+    return hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()[:16]
+
+
+def _matches(doc: Any, filters: Optional[Dict[str, Any]]) -> bool:
+    if not filters:
+        return True
+    meta = doc.metadata or {}
+    return all(meta.get(k) == v for k, v in filters.items())
+
+
+def _top(scores: np.ndarray, idx: np.ndarray, m: int) -> np.ndarray:
+    """
+    Os m melhores de `idx` por score (mais os empatados no corte), por score decrescente
+    e posição crescente: o mesmo prefixo da ordenação completa, sem ordenar os N scores.
+    """
+    if m < len(idx):
+        corte = np.partition(scores[idx], len(idx) - m)[len(idx) - m]
+        idx = idx[scores[idx] >= corte]
+    return idx[np.lexsort((idx, -scores[idx]))]
+
+
+def _load_corpus(db: Any) -> List[Any]:
+    """Todos os chunks indexados: docstore do FAISS ou payloads do Qdrant (sem vetores)"""
+    if hasattr(db, "docstore"):
+        return list(db.docstore._dict.values())  # type: ignore[attr-defined]
+    client = getattr(db, "client", None)
+    if client is None or not hasattr(db, "collection_name"):
+        return []
+    from langchain_core.documents import Document
+
+    conteudo = getattr(db, "content_payload_key", "page_content")
+    metadados = getattr(db, "metadata_payload_key", "metadata")
+    docs: List[Any] = []
+    offset = None
+    while True:
+        pontos, offset = client.scroll(collection_name=db.collection_name, limit=512, offset=offset,
+                                       with_payload=True, with_vectors=False)
+        for p in pontos:
+            payload = p.payload or {}
+            docs.append(Document(page_content=payload.get(conteudo) or "", metadata=payload.get(metadados) or {}))
+        if offset is None:
+            return docs
+
+
+def _body(doc: Any) -> str:
+    """Texto do chunk sem o breadcrumb prefixado para o embedding"""
+    texto = doc.page_content
+    breadcrumb = (doc.metadata or {}).get("breadcrumb")
+    if breadcrumb and texto.startswith(breadcrumb):
+        texto = texto[len(breadcrumb):].lstrip("\n")
+    return texto
+
 
 class Searcher:
-    def __init__(self, db: Any):
+    def __init__(self, db: Any, cache: Optional[RetrievalCache] = None, generation: int = 0):
         self.db = db
-        # preparo BM25 (opcional) apenas quando possível extrair corpus localmente
+        self.cache = cache
+        # Geração do índice compõe a chave do cache: reindexação nunca serve resultado antigo
+        self.generation = generation
         self.bm25 = None
+        self._docs: List[Any] = []
+        self._by_anchor: Dict[str, Any] = {}
+        self._children: Dict[str, List[Any]] = {}
+        # Índice mapeado (servidor de consultas): chunks, adjacência e postings BM25 são
+        # lidos do chunk store em disco, sem cópia em objetos Python por processo
+        self._store = getattr(db, "chunk_store", None)
+        if self._store is not None:
+            if Settings.BM25_ENABLED:
+                self.bm25 = self._store.bm25()
+            return
+        try:
+            self._docs = _load_corpus(self.db)
+        except Exception:
+            self._docs = []
+        # Índice de adjacência montado na carga: anchor -> chunk e pai -> filhos (ordem do texto)
+        por_anchor, filhos = adjacency(self._docs)
+        self._by_anchor = {anchor: self._docs[i] for anchor, i in por_anchor.items()}
+        self._children = {pai: [self._docs[i] for i in lista] for pai, lista in filhos.items()}
+        # preparo BM25 (opcional) apenas quando possível extrair corpus localmente
         try:
-            if Settings.BM25_ENABLED and BM25Okapi is not None and hasattr(self.db, "docstore"):
-                texts = [d.page_content for d in self.db.docstore._dict.values()]  # type: ignore[attr-defined]
-                tokenized = [t.lower().split() for t in texts]
+            if Settings.BM25_ENABLED and BM25Okapi is not None and self._docs:
+                tokenized = [tokenize(d.page_content) for d in self._docs]
                 self.bm25 = BM25Okapi(tokenized)
         except Exception:
             self.bm25 = None
 
-    def query(self, q: str, top_k: int = 5, filters: Optional[Dict[str, Any]] = None, expand_context: bool = True):
-        # Dense
-        docs_dense = self.db.similarity_search(q, k=top_k * 3)
+    def reset_connections(self) -> None:
+        """Após fork: conexões do chunk store são abertas de novo no filho"""
+        if self._store is not None:
+            self._store.reset_connections()
+
+    def search(self, q: str, top_k: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Tuple[Any, float]]:
+        """Busca híbrida com scores; resultados servidos do cache quando a consulta se repete."""
+        cached = self.cached(q, top_k, filters)
+        if cached is not None:
+            return cached
+        results = self._search(q, top_k, filters)
+        self.remember(q, top_k, filters, results)
+        return results
+
+    def cached(self, q: str, top_k: int, filters: Optional[Dict[str, Any]] = None) -> Optional[List[Tuple[Any, float]]]:
+        if self.cache is None:
+            return None
+        cached = self.cache.get(RetrievalCache.make_key(q, top_k, filters, self.generation))
+        if cached is None:
+            return None
+        return [(doc, score) for _, score, doc in cached]
+
+    def remember(self, q: str, top_k: int, filters: Optional[Dict[str, Any]], results: List[Tuple[Any, float]]) -> None:
+        if self.cache is not None:
+            key = RetrievalCache.make_key(q, top_k, filters, self.generation)
+            self.cache.put(key, [(chunk_id(doc), score, doc) for doc, score in results])
+
+    def _search(self, q: str, top_k: int, filters: Optional[Dict[str, Any]]) -> List[Tuple[Any, float]]:
+        n = top_k * 3
+        return self.fuse(q, self.dense(q, n, filters), self.sparse(q, n, filters), top_k)
 
-        if self.bm25 is not None:
-            # Híbrida: combinar com BM25
-            texts = [d.page_content for d in self.db.docstore._dict.values()]  # type: ignore
-            scores = self.bm25.get_scores(q.lower().split())
-            scored = sorted(zip(texts, scores), key=lambda x: x[1], reverse=True)[: top_k * 3]
-            bm25_set = set(t for t, _ in scored)
-            docs_dense = [d for d in docs_dense if d.page_content in bm25_set] + docs_dense
+    def dense(self, q: str, n: int, filters: Optional[Dict[str, Any]] = None) -> List[Any]:
+        """Candidatos da busca vetorial (inclui o embedding da consulta)"""
+        with span("query.dense", k=n):
+            if filters:
+                return self.db.similarity_search(q, k=n, filter=filters)
+            return self.db.similarity_search(q, k=n)
+
+    def sparse(self, q: str, n: int, filters: Optional[Dict[str, Any]] = None) -> List[Any]:
+        """Candidatos BM25 em ordem de score (vazio sem BM25)"""
+        if self.bm25 is None:
+            return []
+        with span("query.sparse", k=n):
+            scores = np.asarray(self.bm25.get_scores(tokenize(q)))
+            positivos = np.flatnonzero(scores > 0)
+            out: List[Any] = []
+            lidos = 0
+            m = n
+            # Seleção parcial dos m melhores; com filtros que descartam candidatos, amplia m
+            while len(out) < n and lidos < len(positivos):
+                ranked = _top(scores, positivos, m)
+                for i in ranked[lidos:]:
+                    d = self._docs[i] if self._store is None else self._store.get(int(i))
+                    if _matches(d, filters):
+                        out.append(d)
+                        if len(out) >= n:
+                            break
+                lidos = len(ranked)
+                m *= 4
+        return out
+
+    def fuse(self, q: str, docs_dense: List[Any], docs_sparse: List[Any], top_k: int) -> List[Tuple[Any, float]]:
+        """
+        Fusão por posição (RRF): candidatos presentes nas duas listas sobem. Rótulos da
+        pergunta encontrados no breadcrumb somam um bônus na mesma escala do RRF.
+        """
+        fused: Dict[str, float] = {}
+        docs: Dict[str, Any] = {}
+        with span("query.fuse", candidatos=len(docs_dense) + len(docs_sparse)):
+            for lista in (docs_dense, docs_sparse):
+                for rank, d in enumerate(lista):
+                    cid = chunk_id(d)
+                    docs.setdefault(cid, d)
+                    fused[cid] = fused.get(cid, 0.0) + 1.0 / (_RRF_K + rank + 1)
 
         # Re-ranking simples sensível a hierarquia: boost por match exato de rótulos
+        ql = q.lower()
+        rotulos = [tok for tok in _ROTULOS if tok in ql]
+        bruto_max = 0.5 * len(rotulos) + 0.2
+
         def score_doc(d) -> float:
             meta = d.metadata or {}
             breadcrumb = meta.get("breadcrumb", "").lower()
-            s = 0.0
-            for tok in ["art.", "§", "capítulo", "seção", "inciso", "alínea"]:
-                if tok in q.lower() and tok in breadcrumb:
-                    s += 0.5
-            if any(part in breadcrumb for part in q.lower().split()):
+            s = 0.5 * sum(tok in breadcrumb for tok in rotulos)
+            if any(part in breadcrumb for part in ql.split()):
                 s += 0.2
-            return s
+            return _BONUS_MAX * s / bruto_max
+
+        with span("query.rerank", candidatos=len(fused)):
+            final = [(docs[cid], score_doc(docs[cid]) + rrf) for cid, rrf in fused.items()]
+            final.sort(key=lambda x: x[1], reverse=True)
+        return final[:top_k]
 
-        reranked = sorted(docs_dense, key=lambda d: score_doc(d), reverse=True)[:top_k]
-        return reranked
+    def lookup(self, anchor: str) -> Optional[Any]:
+        """Chunk pelo anchor_id, O(1)"""
+        if self._store is not None:
+            return self._store.lookup(anchor)
+        return self._by_anchor.get(anchor)
+
+    def _filhos(self, anchor: Optional[str]) -> List[Any]:
+        if self._store is not None:
+            return self._store.children(anchor) if anchor else []
+        return self._children.get(anchor, [])
+
+    def caput(self, parent: Any) -> Optional[Any]:
+        """
+        Só a cabeça do dispositivo pai (caput do artigo, texto antes do 1º filho), como
+        chunk derivado; None se o pai não tiver filhos indexados.
+        """
+        filhos = self._filhos((parent.metadata or {}).get("anchor_id"))
+        if not filhos:
+            return None
+        inicio = _body(filhos[0])[:60]
+        pos = parent.page_content.find(inicio) if inicio else -1
+        texto = parent.page_content[:pos].rstrip() if pos > 0 else ""
+        if not texto:
+            return None
+        meta = dict(parent.metadata or {})
+        # parte do pai: se o pai inteiro estiver no contexto, o caput é descartado
+        meta.update({"anchor_id": meta.get("anchor_id", "") + "#caput", "parent_id": meta.get("anchor_id"),
+                     "tokens_estimados": max(1, len(texto) // 4), "expansao": "caput"})
+        return type(parent)(page_content=texto, metadata=meta)
+
+    def expand(self, docs: List[Any], budget: Optional[int] = None) -> List[Any]:
+        """
+        Completa cada trecho com o caput do pai e os irmãos vizinhos (incisos, alíneas
+        adjacentes) pelos links parent_id/siblings_*_id, O(1) por salto e sem nova busca
+        vetorial. Os acréscimos vêm logo após o trecho que os originou e param no orçamento.
+        """
+        budget = Settings.CONTEXT_EXPAND_TOKENS if budget is None else budget
+        vistos = {chunk_id(d) for d in docs}
+        out: List[Any] = []
+        usado = 0
+
+        def acrescenta(d: Optional[Any]) -> None:
+            nonlocal usado
+            if d is None or chunk_id(d) in vistos:
+                return
+            custo = (d.metadata or {}).get("tokens_estimados") or max(1, len(d.page_content) // 4)
+            if usado + custo > budget:
+                return
+            vistos.add(chunk_id(d))
+            usado += custo
+            out.append(d)
+
+        for d in docs:
+            out.append(d)
+            meta = d.metadata or {}
+            pai = self.lookup(meta["parent_id"]) if meta.get("parent_id") else None
+            if pai is not None:
+                acrescenta(self.caput(pai))
+            if meta.get("nivel") in _NIVEIS_VIZINHOS:
+                for vizinho in (meta.get("siblings_prev_id"), meta.get("siblings_next_id")):
+                    if vizinho:
+                        acrescenta(self.lookup(vizinho))
+        return out
+
+    def query(self, q: str, top_k: int = 5, filters: Optional[Dict[str, Any]] = None, expand_context: bool = True):
+        docs = [doc for doc, _ in self.search(q, top_k=top_k, filters=filters)]
+        return self.expand(docs) if expand_context else docs
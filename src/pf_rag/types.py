@@ -1,4 +1,5 @@
 from __future__ import annotations
+from bisect import bisect_right
 from dataclasses import dataclass, field
 from typing import List, Optional, Dict, Any, Tuple
 
@@ -9,6 +10,42 @@ class PDFPage:
     text: str
 
 
+@dataclass
+class OffsetMap:
+    """Mapa do texto limpo para offsets brutos por página.
+
+    Cada segmento i começa em clean_starts[i] no texto limpo e corresponde a
+    raw_starts[i] dentro de PDFPage.text da página pages[i]. A granularidade é
+    de linha: dentro do segmento o deslocamento é aproximado (espaços colapsados).
+    """
+    clean_starts: List[int] = field(default_factory=list)
+    pages: List[int] = field(default_factory=list)
+    raw_starts: List[int] = field(default_factory=list)
+
+    def add(self, clean_start: int, page: int, raw_start: int) -> None:
+        self.clean_starts.append(clean_start)
+        self.pages.append(page)
+        self.raw_starts.append(raw_start)
+
+    def locate(self, offset: int) -> Tuple[int, int]:
+        """Retorna (página, offset bruto na página) para um offset do texto limpo."""
+        if not self.clean_starts:
+            return 0, offset
+        i = max(0, bisect_right(self.clean_starts, offset) - 1)
+        return self.pages[i], self.raw_starts[i] + max(0, offset - self.clean_starts[i])
+
+    def page_of(self, offset: int) -> int:
+        return self.locate(offset)[0]
+
+    def pages_between(self, start: int, end: int) -> List[int]:
+        """Páginas (ordenadas, sem repetição) cobertas pelo intervalo [start, end)."""
+        if not self.clean_starts:
+            return []
+        i = max(0, bisect_right(self.clean_starts, start) - 1)
+        j = max(i, bisect_right(self.clean_starts, max(start, end - 1)) - 1)
+        return sorted(set(self.pages[i:j + 1]))
+
+
 @dataclass
 class HeadingBlock:
     ementa: Optional[str] = None
@@ -5,24 +5,15 @@ Refatorado para usar pipeline PF RAG (PDF -> normalização -> parsing -> chunki
 import os
 import sys
 from typing import List, Optional
-from langchain_community.document_loaders import PyPDFLoader, DirectoryLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_ollama import OllamaEmbeddings
 
 from ..config.settings import Settings
 from ..utils.file_utils import FileUtils
+from ..utils.telemetry import metrics, print_stage_summary, span
 from .ollama_service import OllamaService
 
-# PF pipeline
-from src.pf_rag.io_pdf import extract_text as pf_extract_text
-from src.pf_rag.normalize import clean_text as pf_clean_text
-from src.pf_rag.parse_norma import detect_structure as pf_detect
-from src.pf_rag.metadata_pf import extract as pf_meta_extract
-from src.pf_rag.chunker import build_chunks as pf_build_chunks
-from src.pf_rag.embed_index import Indexer as PFIndexer, SbertEmbeddings
-from src.vector_backends.qdrant_backend import QdrantIndexer
-from src.pf_rag.export_jsonl import export_chunks_jsonl
+# Consulta precisa só dos embeddings e da carga do índice; extração de PDF, parsing,
+# chunking, Qdrant e loaders legados são importados no método que os usa
+from src.pf_rag.embed_index import Indexer as PFIndexer, make_embeddings
 
 
 class DocumentService:
@@ -31,10 +22,7 @@ class DocumentService:
     def __init__(self):
         self.database: Optional[object] = None
         # Embeddings serão escolhidos conforme backend configurado
-        if Settings.EMBEDDING_BACKEND == "sbert":
-            self.embeddings = SbertEmbeddings()
-        else:
-            self.embeddings = OllamaEmbeddings(model=Settings.EMBEDDING_MODEL)
+        self.embeddings = make_embeddings()
 
     def load_or_create_database(self, progress_callback=None) -> Optional[object]:
         """Carrega base existente ou cria nova se necessário"""
@@ -66,14 +54,14 @@ class DocumentService:
         """Carrega base de dados existente"""
         try:
             if Settings.VECTOR_DB_BACKEND == "qdrant":
+                from src.vector_backends.qdrant_backend import QdrantIndexer
                 q = QdrantIndexer(backend=Settings.EMBEDDING_BACKEND)
                 return q.load_qdrant()
             # Default: FAISS
-            return FAISS.load_local(
-                Settings.FAISS_DB_PATH,
-                self.embeddings,
-                allow_dangerous_deserialization=True
-            )
+            database = PFIndexer.load_faiss(Settings.FAISS_DB_PATH, self.embeddings, mmap=Settings.FAISS_MMAP)
+            if database is None:
+                raise RuntimeError("índice FAISS ausente ou ilegível")
+            return database
         except Exception:
             print("⚠️ Erro ao carregar base de dados. Recriando...")
             return None
@@ -81,6 +69,13 @@ class DocumentService:
     def _create_pf_rag_database(self, progress_callback=None) -> Optional[object]:
         """Cria nova base FAISS usando pipeline PF (hierárquico)."""
         print("📄 Processando documentos da pasta SGP com pipeline PF RAG...")
+        from src.pf_rag.io_pdf import iter_extract_text as pf_iter_extract_text
+        from src.pf_rag.normalize import clean_text_with_offsets as pf_clean_text_offsets
+        from src.pf_rag.parse_norma import detect_structure as pf_detect
+        from src.pf_rag.metadata_pf import extract as pf_meta_extract
+        from src.pf_rag.chunker import build_chunks as pf_build_chunks
+        from src.pf_rag.export_jsonl import export_chunks_jsonl
+        from ..utils.cache_utils import invalidate_for_reindex
         try:
             arquivos_pdf = FileUtils.get_pdf_files()
             if not arquivos_pdf:
@@ -88,23 +83,27 @@ class DocumentService:
                 print("📁 Adicione arquivos PDF válidos na pasta SGP/ e reinicie o programa")
                 sys.exit(1)
 
-            import time
             all_chunks = []
             total_files = len(arquivos_pdf)
 
-            for idx, pdf in enumerate(arquivos_pdf):
+            # Extração em lote: o conversor Docling é carregado uma vez e reaproveitado entre arquivos
+            for idx, (pdf, (raw, pages, ocr)) in enumerate(pf_iter_extract_text(arquivos_pdf)):
                 if progress_callback:
                     file_progress = idx / total_files * 0.6  # 60% para processamento PDFs
                     progress_callback(file_progress, f"Processando {os.path.basename(pdf)} ({idx+1}/{total_files})")
 
-                t0 = time.time()
-                raw, pages, ocr = pf_extract_text(pdf)
-                text, pages2 = pf_clean_text(raw, pages)
-                nodes, heading = pf_detect(text)
-                meta = pf_meta_extract(text, heading, os.path.basename(pdf))
-                chunks = pf_build_chunks(nodes, text, meta, pdf, [p.index for p in pages2])
+                nome = os.path.basename(pdf)
+                with span("ingest.normalize", arquivo=nome):
+                    text, pages2, offsets = pf_clean_text_offsets(raw, pages)
+                with span("ingest.parse", arquivo=nome):
+                    nodes, heading = pf_detect(text)
+                    meta = pf_meta_extract(text, heading, nome)
+                with span("ingest.chunk", arquivo=nome) as etapa:
+                    chunks = pf_build_chunks(nodes, text, meta, pdf, [p.index for p in pages2], offsets)
+                    etapa.set(chunks=len(chunks))
+                metrics.inc("pf_rag_chunks_total", len(chunks), stage="chunked")
                 all_chunks.extend(chunks)
-                print(f"📦 {os.path.basename(pdf)} -> {len(chunks)} chunks em {time.time()-t0:.2f}s (OCR={ocr})")
+                print(f"📦 {nome} -> {len(chunks)} chunks (OCR={ocr})")
 
             # Verifica conexão com Ollama somente se backend de embeddings for Ollama
             if Settings.EMBEDDING_BACKEND == "ollama":
@@ -119,6 +118,7 @@ class DocumentService:
                     progress_callback(0.65, f"Preparando indexação Qdrant ({len(all_chunks)} chunks)...")
 
                 print(f"🧠 Criando embeddings e base Qdrant (chunks={len(all_chunks)})...")
+                from src.vector_backends.qdrant_backend import QdrantIndexer
                 qindex = QdrantIndexer(backend=Settings.EMBEDDING_BACKEND)
 
                 # Clear any existing storage to avoid conflicts (with retries)
@@ -154,8 +154,6 @@ class DocumentService:
                     if progress_callback:
                         progress_callback(val, f"Qdrant: {msg}")
 
-                t0 = time.time()
-
                 # Build with retry logic for instance conflicts
                 max_build_attempts = 2
                 db = None
@@ -175,7 +173,6 @@ class DocumentService:
                 if db is None:
                     raise RuntimeError("Falha ao criar base Qdrant após múltiplas tentativas")
 
-                print(f"⏱️ Tempo embeddings+index: {time.time()-t0:.2f}s")
                 # Qdrant embutido persiste via path automaticamente
             else:
                 if progress_callback:
@@ -190,12 +187,16 @@ class DocumentService:
                     if progress_callback:
                         progress_callback(val, f"FAISS: {msg}")
 
-                t0 = time.time()
-                db = indexer.build_faiss(all_chunks, progress_callback=faiss_callback)
-                print(f"⏱️ Tempo embeddings+index: {time.time()-t0:.2f}s")
+                db = indexer.build_faiss(all_chunks, progress_cb=faiss_callback)
                 print("💾 Salvando base de dados...")
                 indexer.save_faiss(db, Settings.FAISS_DB_PATH)
 
+            # Nova geração do índice: invalida no cache só respostas de chunks alterados
+            try:
+                invalidate_for_reindex(all_chunks, full=True)
+            except Exception as e:
+                print(f"⚠️ Falha ao invalidar cache de respostas: {e}")
+
             # Export JSONL para auditoria
             if Settings.EXPORT_CHUNKS_JSONL:
                 if progress_callback:
@@ -209,6 +210,7 @@ class DocumentService:
             if progress_callback:
                 progress_callback(1.0, "✅ Base de dados criada com sucesso!")
             print("✅ Base de dados criada (PF RAG)!")
+            print_stage_summary("ingest.")
             return db
         except Exception as e:
             print(f"❌ Erro ao criar base PF RAG: {str(e)[:150]}...")
@@ -222,6 +224,7 @@ class DocumentService:
             print(f"📁 Encontrados {len(arquivos_pdf)} arquivos PDF: {[os.path.basename(f) for f in arquivos_pdf]}")
 
             # Carrega documentos (cada página vira um documento)
+            from langchain_community.document_loaders import PyPDFLoader, DirectoryLoader
             loader = DirectoryLoader(f"{Settings.PDF_FOLDER}/", glob="*.pdf", loader_cls=PyPDFLoader)
             docs = loader.load()
 
@@ -248,6 +251,7 @@ class DocumentService:
 
     def _split_documents(self, docs: List) -> List:
         """Divide documentos em chunks"""
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=Settings.CHUNK_SIZE,
             chunk_overlap=Settings.CHUNK_OVERLAP,
@@ -260,8 +264,9 @@ class DocumentService:
 
         return documents
 
-    def _create_faiss_database(self, documents: List) -> Optional[FAISS]:
+    def _create_faiss_database(self, documents: List) -> Optional[object]:
         """Cria base FAISS com embeddings"""
+        from langchain_community.vectorstores import FAISS
         print("🧠 Criando embeddings e base de dados...")
         print("⚠️ Este processo pode demorar alguns minutos...")
 
@@ -277,7 +282,7 @@ class DocumentService:
             database = FAISS.from_documents(documents, self.embeddings)
 
             print("💾 Salvando base de dados...")
-            database.save_local(Settings.FAISS_DB_PATH)
+            PFIndexer.save_faiss(database, Settings.FAISS_DB_PATH)
             print("✅ Base de dados criada e hash salvo!")
 
             return database
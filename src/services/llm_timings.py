@@ -0,0 +1,57 @@
+"""
+Tempos por requisição reportados pelo Ollama: avaliação do prompt x geração
+"""
+from typing import Any, Dict
+
+from ..utils.telemetry import metrics
+
+try:
+    from langchain_core.callbacks import BaseCallbackHandler
+except Exception:  # pragma: no cover
+    BaseCallbackHandler = object  # type: ignore
+
+_NS = 1e9
+
+
+def llm_timings(info: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Converte os campos finais do /api/generate (durações em ns) em segundos.
+    prompt_eval_s cai quando o prefixo do prompt é reaproveitado do cache KV.
+    """
+    if not info:
+        return {}
+    stats: Dict[str, float] = {}
+    for campo, nome in (("load_duration", "load_s"), ("prompt_eval_duration", "prompt_eval_s"),
+                        ("eval_duration", "eval_s")):
+        if info.get(campo) is not None:
+            stats[nome] = info[campo] / _NS
+    for campo, nome in (("prompt_eval_count", "prompt_tokens"), ("eval_count", "eval_tokens")):
+        if info.get(campo) is not None:
+            stats[nome] = info[campo]
+    if stats.get("eval_s") and stats.get("eval_tokens"):
+        stats["eval_tok_s"] = stats["eval_tokens"] / stats["eval_s"]
+    return stats
+
+
+def format_timings(stats: Dict[str, float]) -> str:
+    return (f"⏱️ Prompt: {stats.get('prompt_tokens', 0):.0f} tokens em {stats.get('prompt_eval_s', 0):.2f}s"
+            f" • geração: {stats.get('eval_tokens', 0):.0f} tokens em {stats.get('eval_s', 0):.2f}s"
+            f" • carga do modelo: {stats.get('load_s', 0):.2f}s")
+
+
+class LLMTimings(BaseCallbackHandler):
+    """Callback por requisição: guarda em `stats` os tempos da resposta final do Ollama"""
+
+    def __init__(self):
+        super().__init__()
+        self.stats: Dict[str, float] = {}
+
+    def on_llm_end(self, response: Any, **kwargs: Any) -> None:
+        try:
+            info = response.generations[0][0].generation_info or {}
+        except (AttributeError, IndexError):
+            return
+        self.stats = llm_timings(info)
+        for nome in ("prompt_tokens", "eval_tokens"):
+            if self.stats.get(nome):
+                metrics.inc("pf_rag_tokens_total", self.stats[nome], kind=nome.split("_")[0])
@@ -0,0 +1,142 @@
+"""
+Transporte HTTP compartilhado com o Ollama: pool de conexões keep-alive,
+concorrência limitada, retentativas com backoff e embeddings em lote (/api/embed)
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ..config.settings import Settings
+
+# Respostas transitórias do servidor que merecem nova tentativa
+_RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class OllamaTransport:
+    """
+    Sessão HTTP única para o Ollama.
+
+    Todas as chamadas reutilizam as conexões do pool (keep-alive) e passam por um
+    semáforo de max_concurrency vagas; falhas de conexão, timeouts e respostas
+    5xx/429 são repetidas com backoff exponencial antes de propagar o erro.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, max_concurrency: Optional[int] = None,
+                 retries: Optional[int] = None, backoff: Optional[float] = None,
+                 timeout: Optional[float] = None):
+        self.base_url = (base_url or Settings.OLLAMA_URL).rstrip("/")
+        self.max_concurrency = max(1, max_concurrency or Settings.OLLAMA_MAX_CONCURRENCY)
+        self.retries = max(0, retries if retries is not None else Settings.OLLAMA_RETRIES)
+        self.backoff = backoff if backoff is not None else Settings.OLLAMA_BACKOFF
+        self.timeout = timeout or Settings.OLLAMA_REQUEST_TIMEOUT
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency, pool_block=True)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def request(self, method: str, endpoint: str, payload: Optional[Dict[str, Any]] = None,
+                timeout: Optional[float] = None, retries: Optional[int] = None) -> requests.Response:
+        """Chamada à API /api/<endpoint> com retentativa; erros 4xx propagam na hora"""
+        url = f"{self.base_url}/api/{endpoint}"
+        tentativas = self.retries if retries is None else max(0, retries)
+        erro: Exception = RuntimeError("nenhuma tentativa realizada")
+        for tentativa in range(tentativas + 1):
+            try:
+                with self._slots:
+                    resp = self._session.request(method, url, json=payload, timeout=timeout or self.timeout)
+                if resp.status_code not in _RETRY_STATUS:
+                    resp.raise_for_status()
+                    return resp
+                erro = requests.exceptions.HTTPError(
+                    f"{resp.status_code} Server Error: {resp.text[:120]}", response=resp
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                erro = e
+            if tentativa < tentativas:
+                time.sleep(self.backoff * (2 ** tentativa))
+        raise erro
+
+    def tags(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Lista modelos locais (usado como sonda de saúde, sem retentativa)"""
+        return self.request("GET", "tags", timeout=timeout, retries=0).json()
+
+    def warm(self, model: str, prompt: str = "", options: Optional[Dict[str, Any]] = None,
+             keep_alive: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Carrega o modelo (e avalia `prompt`, deixando o prefixo no cache KV do Ollama)
+        sem gerar texto útil; as mesmas options das consultas evitam recarga do modelo.
+        """
+        payload: Dict[str, Any] = {"model": model, "prompt": prompt, "stream": False,
+                                   "options": dict(options or {}, num_predict=1)}
+        if keep_alive:
+            payload["keep_alive"] = keep_alive
+        return self.request("POST", "generate", payload).json()
+
+    def embed(self, texts: List[str], model: Optional[str] = None,
+              batch_size: Optional[int] = None) -> List[List[float]]:
+        """
+        Embeddings via /api/embed com lista de entradas: cada requisição leva até
+        batch_size textos e até max_concurrency requisições seguem em paralelo.
+        A ordem do resultado acompanha a dos textos.
+        """
+        if not texts:
+            return []
+        model = model or Settings.EMBEDDING_MODEL
+        bs = max(1, batch_size or Settings.EMBED_BATCH_SIZE)
+        lotes = [texts[i:i + bs] for i in range(0, len(texts), bs)]
+        if len(lotes) == 1 or self.max_concurrency == 1:
+            partes = [self._embed_batch(lote, model) for lote in lotes]
+        else:
+            partes = list(self._pool().map(lambda lote: self._embed_batch(lote, model), lotes))
+        return [vetor for parte in partes for vetor in parte]
+
+    def _embed_batch(self, batch: List[str], model: str) -> List[List[float]]:
+        data = self.request("POST", "embed", {"model": model, "input": batch}).json()
+        vetores = data.get("embeddings") or []
+        if len(vetores) != len(batch):
+            raise RuntimeError(f"Ollama retornou {len(vetores)} embeddings para {len(batch)} textos")
+        return vetores
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                    thread_name_prefix="ollama-http")
+            return self._executor
+
+    def close(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+        self._session.close()
+
+
+_TRANSPORT: Optional[OllamaTransport] = None
+_TRANSPORT_LOCK = threading.Lock()
+
+
+def get_transport() -> OllamaTransport:
+    """Transporte único por processo (pool compartilhado entre ingestão, consulta e saúde)"""
+    global _TRANSPORT
+    with _TRANSPORT_LOCK:
+        if _TRANSPORT is None:
+            _TRANSPORT = OllamaTransport()
+        return _TRANSPORT
+
+
+def reset_transport() -> None:
+    """
+    Descarta o transporte herdado após fork (workers do servidor de consultas): as
+    conexões do pool pertencem ao processo pai; o filho abre as suas no próximo uso.
+    """
+    global _TRANSPORT, _TRANSPORT_LOCK
+    _TRANSPORT = None
+    _TRANSPORT_LOCK = threading.Lock()
@@ -3,8 +3,14 @@ Serviço para verificação e comunicação com Ollama
 """
 import requests
 import sys
-from typing import Tuple
+import threading
+import time
+from typing import Callable, Optional, Tuple
 from ..config.settings import Settings
+from .ollama_client import get_transport
+
+# Códigos que indicam Ollama inacessível (abrem o circuito); demais erros não contam
+CONNECTION_ERRORS = ("CONNECTION_REFUSED", "TIMEOUT", "PROXY_ERROR")
 
 
 class OllamaService:
@@ -17,18 +23,15 @@ class OllamaService:
         Returns: (conectado, codigo_erro)
         """
         try:
-            response = requests.get(
-                Settings.get_ollama_api_url("tags"),
-                timeout=Settings.OLLAMA_TIMEOUT
-            )
+            get_transport().tags(timeout=Settings.OLLAMA_TIMEOUT)
             return True, "OK"
 
+        except requests.exceptions.ProxyError:
+            return False, "PROXY_ERROR"
         except requests.exceptions.ConnectionError:
             return False, "CONNECTION_REFUSED"
         except requests.exceptions.Timeout:
             return False, "TIMEOUT"
-        except requests.exceptions.ProxyError:
-            return False, "PROXY_ERROR"
         except KeyboardInterrupt:
             sys.exit(130)
         except Exception as e:
@@ -55,6 +58,26 @@ class OllamaService:
     print("4. Inicie: ollama serve")
     print("\n⚡ O sistema continuará rodando e tentará reconectar automaticamente...")
 
+    @staticmethod
+    def classify_error(error: Exception) -> str:
+        """Mapeia a exceção de uma chamada real (LLM/embeddings) para os códigos de check_connection"""
+        if isinstance(error, requests.exceptions.ProxyError):
+            return "PROXY_ERROR"
+        if isinstance(error, (requests.exceptions.Timeout, TimeoutError)):
+            return "TIMEOUT"
+        if isinstance(error, (requests.exceptions.ConnectionError, ConnectionError)):
+            return "CONNECTION_REFUSED"
+        # Clientes httpx/ollama chegam aqui com tipos próprios: classifica pela mensagem
+        error_str = str(error)
+        if "proxy" in error_str.lower():
+            return "PROXY_ERROR"
+        if "timed out" in error_str.lower() or "timeout" in type(error).__name__.lower():
+            return "TIMEOUT"
+        if ("Connection refused" in error_str or "503" in error_str
+                or "Failed to connect to Ollama" in error_str or "ConnectError" in type(error).__name__):
+            return "CONNECTION_REFUSED"
+        return f"UNKNOWN_ERROR: {error_str}"
+
     @staticmethod
     def print_processing_error(error_str: str) -> None:
         """Imprime mensagens de erro durante processamento"""
@@ -70,3 +93,138 @@ class OllamaService:
         else:
             print(f"❌ Erro inesperado: {error_str[:80]}...")
             print("🔧 Tente reiniciar o Ollama e refaça a pergunta")
+
+
+class CircuitBreaker:
+    """
+    Disjuntor para chamadas ao Ollama: após max_failures falhas de conectividade
+    consecutivas abre e recusa chamadas por cooldown segundos; depois libera uma
+    única tentativa (meio-aberto) que fecha o circuito se tiver sucesso.
+    """
+
+    def __init__(self, max_failures: Optional[int] = None, cooldown: Optional[float] = None):
+        self.max_failures = max(1, max_failures if max_failures is not None else Settings.OLLAMA_BREAKER_FAILURES)
+        self.cooldown = cooldown if cooldown is not None else Settings.OLLAMA_BREAKER_COOLDOWN
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                return "half_open"
+            return "open"
+
+    def allow(self) -> bool:
+        """True se a chamada pode seguir; no meio-aberto apenas uma por vez"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.cooldown and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._opened_at is not None or self._failures >= self.max_failures:
+                # Falha no meio-aberto reinicia a contagem do cooldown
+                self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Devolve a tentativa do meio-aberto sem veredito (a chamada não chegou ao Ollama)"""
+        with self._lock:
+            self._probing = False
+
+
+class OllamaHealthMonitor:
+    """
+    Estado do Ollama em cache, atualizado em segundo plano e pelas próprias chamadas.
+
+    A thread de fundo só consulta /api/tags quando nenhum resultado (sondagem ou
+    chamada real) foi registrado no último intervalo: com tráfego saudável não há
+    requisições extras. O status expira após o TTL e passa a "STALE".
+    """
+
+    def __init__(self, interval: Optional[float] = None, ttl: Optional[float] = None,
+                 checker: Optional[Callable[[], Tuple[bool, str]]] = None):
+        self.interval = interval if interval is not None else Settings.OLLAMA_HEALTH_INTERVAL
+        self.ttl = ttl if ttl is not None else Settings.OLLAMA_HEALTH_TTL
+        self._checker = checker or OllamaService.check_connection
+        self._status: Tuple[bool, str] = (False, "NOT_CHECKED")
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> Tuple[bool, str]:
+        """Sonda o Ollama agora e atualiza o cache"""
+        status = self._checker()
+        self.report(*status)
+        return status
+
+    def report(self, ok: bool, code: str = "OK") -> None:
+        """Registra o resultado de uma chamada real (sucesso ou erro classificado)"""
+        with self._lock:
+            self._status = (ok, code)
+            self._checked_at = time.monotonic()
+
+    def status(self) -> Tuple[bool, str]:
+        """Último estado conhecido, sem rede; expirado o TTL retorna (False, "STALE")"""
+        with self._lock:
+            if self._checked_at is None:
+                return self._status
+            if time.monotonic() - self._checked_at > self.ttl:
+                return False, "STALE"
+            return self._status
+
+    def is_healthy(self) -> bool:
+        return self.status()[0]
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ollama-health", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                recente = self._checked_at is not None and time.monotonic() - self._checked_at < self.interval
+            if not recente:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    self.report(False, f"UNKNOWN_ERROR: {e}")
+
+
+_MONITOR: Optional[OllamaHealthMonitor] = None
+_MONITOR_LOCK = threading.Lock()
+
+
+def get_health_monitor() -> OllamaHealthMonitor:
+    """Monitor único por processo (a thread de fundo é iniciada por quem o usa)"""
+    global _MONITOR
+    with _MONITOR_LOCK:
+        if _MONITOR is None:
+            _MONITOR = OllamaHealthMonitor()
+        return _MONITOR
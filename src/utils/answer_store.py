@@ -0,0 +1,183 @@
+"""
+Armazenamento persistente do cache de respostas.
+
+SQLite em modo WAL: cada resposta é gravada individualmente (sem reescrever o cache
+inteiro), vários processos (sessões Streamlit, CLI) leem e escrevem com segurança, e a
+inicialização não carrega o conteúdo. Entradas expiram por TTL e, acima de max_entries,
+saem as menos acessadas (LRU).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ..config.settings import Settings
+
+# Descarte (TTL/LRU) amortizado: uma varredura a cada N gravações
+_EVICT_EVERY = 64
+
+
+class AnswerStore:
+    """Respostas por pergunta normalizada, persistidas em SQLite."""
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None,
+                 ttl_seconds: Optional[float] = None):
+        self.path = path or Settings.ANSWER_CACHE_PATH
+        self.max_entries = max(1, max_entries or Settings.CACHE_MAX_ENTRIES)
+        self.ttl = ttl_seconds if ttl_seconds is not None else Settings.CACHE_TTL_HOURS * 3600
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        """Uma conexão por thread (sqlite3 não compartilha conexões entre threads)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS respostas ("
+                " chave TEXT PRIMARY KEY, dados TEXT NOT NULL, vetor BLOB,"
+                " criado REAL NOT NULL, acesso REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS respostas_acesso ON respostas (acesso)")
+            # expiração por TTL (evict) percorre só as entradas vencidas
+            conn.execute("CREATE INDEX IF NOT EXISTS respostas_criado ON respostas (criado)")
+            # Chunks (anchor_id) usados em cada resposta, para invalidação seletiva na reindexação
+            conn.execute("CREATE TABLE IF NOT EXISTS fontes (chave TEXT NOT NULL, fonte TEXT NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS fontes_fonte ON fontes (fonte)")
+            conn.execute("CREATE INDEX IF NOT EXISTS fontes_chave ON fontes (chave)")
+            self._local.conn = conn
+        return conn
+
+    def reset_connections(self) -> None:
+        """Esquece as conexões herdadas após fork; cada thread do filho abre a sua"""
+        self._local = threading.local()
+        self._writes_lock = threading.Lock()
+
+    def _expired(self, criado: float) -> bool:
+        return self.ttl > 0 and time.time() - criado > self.ttl
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        conn = self._conn()
+        row = conn.execute("SELECT dados, criado FROM respostas WHERE chave = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with conn:
+            if self._expired(row[1]):
+                conn.execute("DELETE FROM respostas WHERE chave = ?", (key,))
+                conn.execute("DELETE FROM fontes WHERE chave = ?", (key,))
+                return None
+            conn.execute("UPDATE respostas SET acesso = ? WHERE chave = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, entry: Dict[str, Any], fontes: Iterable[str] = ()) -> None:
+        """
+        Grava (ou substitui) uma entrada; o vetor da pergunta vai em coluna binária e os
+        anchor_ids das fontes na tabela de fontes.
+        """
+        dados = dict(entry)
+        vetor = dados.pop("vetor_pergunta", None)
+        blob = array("f", vetor).tobytes() if vetor else None
+        agora = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO respostas (chave, dados, vetor, criado, acesso) VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(dados, ensure_ascii=False), blob, dados.get("timestamp", agora), agora),
+            )
+            conn.execute("DELETE FROM fontes WHERE chave = ?", (key,))
+            conn.executemany("INSERT INTO fontes (chave, fonte) VALUES (?, ?)", [(key, f) for f in set(fontes)])
+        with self._writes_lock:
+            self._writes += 1
+            evict = self._writes % _EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """Remove expiradas e, acima de max_entries, as menos acessadas. Retorna quantas saíram"""
+        conn = self._conn()
+        with conn:
+            removidas = 0
+            if self.ttl > 0:
+                removidas += conn.execute(
+                    "DELETE FROM respostas WHERE criado < ?", (time.time() - self.ttl,)
+                ).rowcount
+            excesso = len(self) - self.max_entries
+            if excesso > 0:
+                removidas += conn.execute(
+                    "DELETE FROM respostas WHERE chave IN"
+                    " (SELECT chave FROM respostas ORDER BY acesso ASC LIMIT ?)", (excesso,)
+                ).rowcount
+            if removidas:
+                conn.execute("DELETE FROM fontes WHERE chave NOT IN (SELECT chave FROM respostas)")
+        return removidas
+
+    def invalidate(self, fontes: Iterable[str]) -> List[str]:
+        """
+        Remove as respostas produzidas a partir das fontes alteradas e as sem fontes
+        registradas (origem desconhecida). Retorna as chaves removidas.
+        """
+        fontes = list(set(fontes))
+        conn = self._conn()
+        with conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS alteradas (fonte TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM alteradas")
+            conn.executemany("INSERT OR IGNORE INTO alteradas (fonte) VALUES (?)", [(f,) for f in fontes])
+            chaves = [r[0] for r in conn.execute(
+                "SELECT DISTINCT chave FROM fontes WHERE fonte IN (SELECT fonte FROM alteradas)"
+                " UNION SELECT chave FROM respostas WHERE chave NOT IN (SELECT chave FROM fontes)"
+            ).fetchall()]
+            conn.executemany("DELETE FROM respostas WHERE chave = ?", [(k,) for k in chaves])
+            conn.executemany("DELETE FROM fontes WHERE chave = ?", [(k,) for k in chaves])
+            conn.execute("DELETE FROM alteradas")
+        return chaves
+
+    def fontes(self, key: str) -> List[str]:
+        """anchor_ids registrados como fontes da resposta"""
+        return [r[0] for r in self._conn().execute("SELECT fonte FROM fontes WHERE chave = ?", (key,))]
+
+    def delete(self, key: str) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM respostas WHERE chave = ?", (key,))
+            conn.execute("DELETE FROM fontes WHERE chave = ?", (key,))
+
+    def clear(self) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM respostas")
+            conn.execute("DELETE FROM fontes")
+
+    def iter_vectors(self, limit: int) -> Iterator[Tuple[str, str, List[float]]]:
+        """(chave, pergunta original, vetor) das entradas mais acessadas que têm vetor"""
+        rows = self._conn().execute(
+            "SELECT chave, dados, vetor FROM respostas WHERE vetor IS NOT NULL ORDER BY acesso DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        for chave, dados, blob in rows:
+            vetor = array("f")
+            vetor.frombytes(blob)
+            yield chave, json.loads(dados).get("pergunta_original") or chave, vetor.tolist()
+
+    def import_json(self, path: str) -> int:
+        """Migra o cache legado (JSON inteiro) para o store; retorna quantas entradas vieram"""
+        with open(path, "r", encoding="utf-8") as f:
+            legado = json.load(f)
+        total = 0
+        for chave, entrada in legado.items():
+            if not isinstance(entrada, dict):
+                entrada = {"resposta": entrada, "timestamp": time.time(), "pergunta_original": chave}
+            self.put(chave, entrada)
+            total += 1
+        return total
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM respostas").fetchone()[0]
@@ -2,18 +2,28 @@
 Utilitários para cache de respostas
 """
 import os
-import json
 import time
-from typing import Optional, Dict, Any
-from functools import lru_cache
+from typing import Optional, Dict, Any, Iterable, List, Tuple
 from ..config.settings import Settings
+from .answer_store import AnswerStore
+from .index_generation import IndexGeneration
+from .semantic_cache import SemanticAnswerCache
+from .telemetry import cache_result
 
 
 class CacheUtils:
     """Utilitários para gerenciamento de cache"""
 
-    def __init__(self):
-        self.cache_respostas: Dict[str, Any] = {}
+    def __init__(self, embeddings=None, store: Optional[AnswerStore] = None,
+                 generation: Optional[IndexGeneration] = None):
+        # Respostas persistidas em SQLite (WAL): gravação por entrada, sem carga total na inicialização
+        self.store = store if store is not None else AnswerStore()
+        # Geração do índice: carimbo das respostas e conferência na leitura
+        self.generation = generation if generation is not None else IndexGeneration()
+        # Camada semântica opcional: perguntas equivalentes (mesmas citações) reaproveitam a resposta
+        self.semantic: Optional[SemanticAnswerCache] = None
+        if embeddings is not None and Settings.SEMANTIC_CACHE_ENABLED:
+            self.semantic = SemanticAnswerCache(embeddings)
         self.load_cache()
 
     def normalize_question(self, pergunta: str) -> str:
@@ -21,54 +31,138 @@ class CacheUtils:
         return pergunta.lower().strip().replace("?", "").replace(".", "")
 
     def load_cache(self) -> None:
-        """Carrega cache de respostas do disco"""
+        """
+        Prepara o cache: migra o JSON legado (uma vez) e indexa as perguntas com vetor.
+        O descarte (TTL/LRU) fica nas gravações (AnswerStore.put, amortizado): a
+        inicialização não varre o store, seja qual for o tamanho do cache.
+        """
         try:
             if os.path.exists(Settings.CACHE_FILE):
-                with open(Settings.CACHE_FILE, "r", encoding="utf-8") as f:
-                    self.cache_respostas = json.load(f)
-                print(f"📋 Cache carregado: {len(self.cache_respostas)} respostas em memória")
+                total = self.store.import_json(Settings.CACHE_FILE)
+                os.replace(Settings.CACHE_FILE, Settings.CACHE_FILE + ".migrado")
+                print(f"📋 Cache JSON migrado: {total} respostas")
+            self._load_semantic()
         except Exception as e:
             print(f"⚠️ Erro ao carregar cache: {e}")
-            self.cache_respostas = {}
 
     def save_cache(self) -> None:
-        """Salva cache de respostas no disco"""
-        try:
-            os.makedirs(Settings.FAISS_DB_PATH, exist_ok=True)
-            with open(Settings.CACHE_FILE, "w", encoding="utf-8") as f:
-                json.dump(self.cache_respostas, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"⚠️ Erro ao salvar cache: {e}")
+        """Mantido por compatibilidade: cada resposta já é gravada em save_response"""
+        return
+
+    def _load_semantic(self) -> None:
+        """Reindexa as perguntas persistidas com vetor (sem novas chamadas de embeddings)"""
+        if self.semantic is None:
+            return
+        for chave, pergunta, vetor in self.store.iter_vectors(self.semantic.max_entries):
+            self.semantic.add(chave, pergunta, vetor)
 
     def get_cached_response(self, pergunta: str) -> Optional[Dict[str, Any]]:
-        """Busca resposta no cache"""
+        """Busca resposta no cache: chave exata e, em seguida, perguntas semanticamente equivalentes"""
         pergunta_norm = self.normalize_question(pergunta)
-        return self.cache_respostas.get(pergunta_norm)
+        resposta = self._fresh(pergunta_norm, self.store.get(pergunta_norm))
+        if resposta is not None or self.semantic is None:
+            cache_result("answer", resposta is not None)
+            return resposta
+        try:
+            achado = self.semantic.lookup(pergunta_norm, pergunta)
+        except Exception as e:
+            print(f"⚠️ Cache semântico indisponível: {e}")
+            cache_result("answer", False)
+            return None
+        if achado is None:
+            cache_result("answer", False)
+            return None
+        chave, score = achado
+        resposta = self._fresh(chave, self.store.get(chave))
+        if resposta is None:
+            # expirada ou descartada (talvez por outro processo)
+            self.semantic.remove(chave)
+            cache_result("answer", False)
+            return None
+        cache_result("answer_semantic", True)
+        if Settings.VERBOSE:
+            print(f"🧭 Cache semântico: '{chave}' (similaridade {score:.3f})")
+        return resposta
 
-    def save_response(self, pergunta: str, resposta: str) -> None:
-        """Salva resposta no cache"""
+    def _fresh(self, chave: str, resposta: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Descarta a resposta gravada em geração anterior cujas fontes mudaram depois dela
+        (invalidação da reindexação falhou ou correu junto com a gravação)
+        """
+        if resposta is None:
+            return None
+        try:
+            if not self.generation.stale(self.store.fontes(chave), int(resposta.get("geracao") or 0)):
+                return resposta
+        except Exception as e:
+            print(f"⚠️ Falha ao conferir a geração da resposta: {e}")
+            return resposta
+        self.store.delete(chave)
+        if self.semantic is not None:
+            self.semantic.remove(chave)
+        return None
+
+    def save_response(self, pergunta: str, resposta: str, fontes: Iterable[str] = (),
+                      geracao: Optional[int] = None) -> None:
+        """
+        Salva resposta no cache. `fontes` são os anchor_ids dos chunks usados como
+        contexto: a resposta só é invalidada quando algum deles muda na reindexação.
+        `geracao` é a do índice que produziu os trechos (padrão: a atual).
+        """
         pergunta_norm = self.normalize_question(pergunta)
-        self.cache_respostas[pergunta_norm] = {
+        fontes = list(fontes)
+        entrada = {
             "resposta": resposta,
             "timestamp": time.time(),
-            "pergunta_original": pergunta
+            "pergunta_original": pergunta,
+            "geracao": self.generation.current() if geracao is None else geracao,
+            # ordem do contexto: fontes exibidas em acertos do cache, sem nova busca
+            "fontes": fontes,
         }
+        if self.semantic is not None:
+            try:
+                entrada["vetor_pergunta"] = self.semantic.add(pergunta_norm, pergunta)
+            except Exception as e:
+                print(f"⚠️ Cache semântico indisponível: {e}")
+        try:
+            # Trecho derivado ("art-8#caput") depende do chunk do pai: é ele que a
+            # reindexação marca como alterado
+            self.store.put(pergunta_norm, entrada, {f.split("#", 1)[0] for f in fontes})
+        except Exception as e:
+            print(f"⚠️ Erro ao salvar cache: {e}")
 
     def get_cache_size(self) -> int:
         """Retorna tamanho do cache"""
-        return len(self.cache_respostas)
+        return len(self.store)
+
+    def invalidate_for_reindex(self, chunks: Iterable, full: bool = True) -> Tuple[int, int]:
+        """Avança a geração do índice e remove só as respostas cujas fontes mudaram"""
+        geracao, removidas = invalidate_for_reindex(chunks, full, self.store, self.generation)
+        if self.semantic is not None:
+            for chave in removidas:
+                self.semantic.remove(chave)
+        return geracao, len(removidas)
 
     def clear_all(self) -> None:
         """Limpa completamente o cache em memória e no disco."""
-        self.cache_respostas = {}
+        if self.semantic is not None:
+            self.semantic.clear()
         try:
-            if os.path.exists(Settings.CACHE_FILE):
-                os.remove(Settings.CACHE_FILE)
+            self.store.clear()
         except Exception:
             pass
 
-    @lru_cache(maxsize=Settings.CACHE_LRU_SIZE)
-    def semantic_search_cache(self, pergunta_hash: str, k: int = Settings.RETRIEVAL_K):
-        """Cache LRU para buscas semânticas"""
-        # Esta função será usada pelo serviço de RAG
-        return None
+
+def invalidate_for_reindex(chunks: Iterable, full: bool = True, store: Optional[AnswerStore] = None,
+                           generation: Optional[IndexGeneration] = None) -> Tuple[int, List[str]]:
+    """
+    Registra a nova geração do índice a partir dos chunks indexados e invalida no cache
+    persistente as respostas que usaram anchors alterados/removidos (ou sem fontes).
+    Retorna (geração, chaves removidas).
+    """
+    geracao, alterados = (generation or IndexGeneration()).advance(chunks, full=full)
+    removidas = (store or AnswerStore()).invalidate(alterados)
+    if Settings.VERBOSE:
+        print(f"🔁 Geração do índice {geracao}: {len(alterados)} chunks alterados, "
+              f"{len(removidas)} respostas invalidadas no cache")
+    return geracao, removidas
@@ -0,0 +1,119 @@
+"""
+Geração do índice vetorial e impressão digital dos chunks indexados.
+
+Cada reindexação avança a geração e compara anchor_id -> hash_conteudo com a geração
+anterior; só os anchors alterados ou removidos invalidam o que foi cacheado a partir deles.
+Cada anchor guarda também a geração em que mudou pela última vez: uma resposta gravada
+numa geração anterior é conferida na leitura (stale), mesmo que a invalidação da
+reindexação tenha falhado ou corrido junto com a gravação.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from ..config.settings import Settings
+
+
+class IndexGeneration:
+    """Contador de gerações e anchors (com hash de conteúdo) da geração atual, em SQLite."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or Settings.INDEX_GENERATION_PATH
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Uma conexão por thread, criada (com o esquema) no primeiro uso"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor INTEGER NOT NULL)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (anchor_id TEXT PRIMARY KEY, doc_id TEXT, hash TEXT NOT NULL,"
+            " geracao INTEGER NOT NULL DEFAULT 0)"
+        )
+        colunas = {r[1] for r in conn.execute("PRAGMA table_info(chunks)")}
+        if "geracao" not in colunas:
+            conn.execute("ALTER TABLE chunks ADD COLUMN geracao INTEGER NOT NULL DEFAULT 0")
+        self._local.conn = conn
+        return conn
+
+    def reset_connections(self) -> None:
+        """Esquece as conexões herdadas após fork; cada thread do filho abre a sua"""
+        self._local = threading.local()
+
+    def current(self) -> int:
+        row = self._connect().execute("SELECT valor FROM meta WHERE chave = 'geracao'").fetchone()
+        return int(row[0]) if row else 0
+
+    def stale(self, fontes: Iterable[str], geracao: int) -> bool:
+        """
+        Resposta gravada na geração `geracao` com as fontes dadas está desatualizada?
+        Sim se alguma fonte mudou ou saiu do índice depois dela, ou se não há fontes
+        registradas (origem desconhecida) e o índice já avançou.
+        """
+        if geracao >= self.current():
+            return False
+        fontes = list(set(fontes))
+        if not fontes:
+            return True
+        conn = self._connect()
+        atuais: Dict[str, int] = {}
+        for i in range(0, len(fontes), 500):
+            lote = fontes[i:i + 500]
+            atuais.update(conn.execute(
+                f"SELECT anchor_id, geracao FROM chunks WHERE anchor_id IN ({','.join('?' * len(lote))})", lote
+            ).fetchall())
+        return any(f not in atuais or atuais[f] > geracao for f in fontes)
+
+    @staticmethod
+    def _fingerprints(chunks: Iterable) -> Dict[str, Tuple[str, str]]:
+        """
+        anchor_id -> (doc_id, hash). anchor_id é único no documento; se ainda assim se
+        repetir (ex.: dois PDFs com o mesmo doc_id), o hash cobre todos os chunks do
+        anchor e a edição de qualquer um deles é percebida.
+        """
+        grupos: Dict[str, List[Tuple[str, str]]] = {}
+        for ch in chunks:
+            grupos.setdefault(ch.anchor_id, []).append((ch.doc_id, ch.hash_conteudo))
+        out: Dict[str, Tuple[str, str]] = {}
+        for anchor, itens in grupos.items():
+            if len(itens) == 1:
+                out[anchor] = itens[0]
+            else:
+                hashes = "\n".join(sorted(h for _, h in itens))
+                out[anchor] = (itens[0][0], hashlib.sha256(hashes.encode("utf-8")).hexdigest())
+        return out
+
+    def advance(self, chunks: Iterable, full: bool = True) -> Tuple[int, Set[str]]:
+        """
+        Registra a nova geração a partir dos chunks indexados.
+        full=True: os chunks substituem o índice inteiro (anchors ausentes foram removidos).
+        full=False: chunks adicionados ao índice existente.
+        Retorna (nova geração, anchor_ids alterados ou removidos).
+        """
+        novos = self._fingerprints(chunks)
+        conn = self._connect()
+        with conn:
+            row = conn.execute("SELECT valor FROM meta WHERE chave = 'geracao'").fetchone()
+            geracao = (int(row[0]) if row else 0) + 1
+            antigos = {a: (h, g) for a, h, g in conn.execute("SELECT anchor_id, hash, geracao FROM chunks")}
+            if full:
+                alterados = {a for a, (h, _) in antigos.items() if a not in novos or novos[a][1] != h}
+                conn.execute("DELETE FROM chunks")
+            else:
+                alterados = {a for a, (_, h) in novos.items() if a in antigos and antigos[a][0] != h}
+            # anchors sem mudança mantêm a geração em que mudaram pela última vez
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunks (anchor_id, doc_id, hash, geracao) VALUES (?, ?, ?, ?)",
+                [(a, d, h, antigos[a][1] if a in antigos and antigos[a][0] == h else geracao)
+                 for a, (d, h) in novos.items()],
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (chave, valor) VALUES ('geracao', ?)", (geracao,))
+        return geracao, alterados
@@ -0,0 +1,163 @@
+"""
+Camada semântica do cache de respostas: perguntas parecidas reaproveitam a mesma resposta
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import FrozenSet, List, Optional, Tuple
+
+try:
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover
+    np = None  # type: ignore
+
+from ..config.settings import Settings
+
+# Citações normativas: número precedido (opcionalmente) do dispositivo/espécie que ele numera
+_NUMERO_CITADO = re.compile(
+    r"(?i)(?:\b(art(?:igo)?s?|par[aá]grafos?|item|itens|lei|decreto|portaria|resolu[çc][ãa]o|instru[çc][ãa]o normativa|in)\b\.?\s*"
+    r"|(§+)\s*)?(?:n[ºo°]\.?\s*)?(\d+(?:[\.\/]\d+)*)"
+)
+_ROMANO_CITADO = re.compile(
+    r"(?i)\b(inc(?:iso)?s?|cap[ií]tulos?|t[ií]tulos?|se[çc](?:[ãa]o|[õo]es)|anexos?|partes?|livros?)\.?\s+([ivxlcdm]+)\b"
+)
+_ALINEA_CITADA = re.compile(r"(?i)\bal[ií]neas?\s+[\"'“]?([a-z])\b")
+_PARAGRAFO_UNICO = re.compile(r"(?i)\bpar[aá]grafo\s+[úu]nico\b")
+
+
+def citation_signature(pergunta: str) -> FrozenSet[str]:
+    """
+    Conjunto das citações da pergunta (art. 5, § 2º, inciso IV, Portaria 123/2020...).
+    Perguntas só compartilham resposta semântica com assinaturas idênticas, de modo
+    que "prazo do art. 5" nunca responde "prazo do art. 6".
+    """
+    citacoes = set()
+    for m in _NUMERO_CITADO.finditer(pergunta):
+        rotulo = (m.group(1) or m.group(2) or "n").lower()
+        rotulo = "par" if rotulo.startswith("§") else rotulo[:3]
+        citacoes.add(f"{rotulo}:{m.group(3).replace('.', '')}")
+    for m in _ROMANO_CITADO.finditer(pergunta):
+        citacoes.add(f"{m.group(1).lower()[:3]}:{m.group(2).upper()}")
+    for m in _ALINEA_CITADA.finditer(pergunta):
+        citacoes.add(f"ali:{m.group(1).lower()}")
+    if _PARAGRAFO_UNICO.search(pergunta):
+        citacoes.add("par:unico")
+    return frozenset(citacoes)
+
+
+def _normalize(vetor: List[float]) -> List[float]:
+    norma = sum(v * v for v in vetor) ** 0.5 or 1.0
+    return [v / norma for v in vetor]
+
+
+class SemanticAnswerCache:
+    """
+    Índice vetorial em memória das perguntas já respondidas.
+
+    Guarda o vetor normalizado de cada pergunta (chave = pergunta normalizada do cache
+    exato) e busca por produto interno; com poucas milhares de entradas a busca exata
+    em uma matriz numpy custa menos que manter um índice aproximado. Uma resposta só é
+    reaproveitada acima de `threshold` e com a mesma assinatura de citações.
+    """
+
+    def __init__(self, embeddings, threshold: Optional[float] = None, max_entries: Optional[int] = None):
+        self.embeddings = embeddings
+        self.threshold = threshold if threshold is not None else Settings.SEMANTIC_CACHE_THRESHOLD
+        self.max_entries = max(1, max_entries or Settings.SEMANTIC_CACHE_MAX)
+        self._keys: "OrderedDict[str, int]" = OrderedDict()
+        self._rows: List[Optional[str]] = []
+        self._vectors: List[List[float]] = []
+        self._signatures: List[FrozenSet[str]] = []
+        self._matrix = None
+        # Vetores de perguntas recentes: o save_response após um miss não re-embeda
+        self._recent: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def embed(self, key: str, pergunta: str) -> List[float]:
+        with self._lock:
+            vetor = self._recent.get(key)
+        if vetor is None:
+            vetor = _normalize(list(self.embeddings.embed_query(pergunta)))
+            with self._lock:
+                self._recent[key] = vetor
+                while len(self._recent) > 64:
+                    self._recent.popitem(last=False)
+        return vetor
+
+    def lookup(self, key: str, pergunta: str) -> Optional[Tuple[str, float]]:
+        """Chave da pergunta semelhante já respondida e a similaridade, ou None"""
+        if not self._keys:
+            return None
+        vetor = self.embed(key, pergunta)
+        assinatura = citation_signature(pergunta)
+        with self._lock:
+            for linha, score in self._ranked(vetor):
+                if score < self.threshold:
+                    break
+                candidata = self._rows[linha]
+                if candidata is not None and self._signatures[linha] == assinatura:
+                    return candidata, score
+        return None
+
+    def _ranked(self, vetor: List[float]):
+        if np is not None:
+            if self._matrix is None or self._matrix.shape[0] != len(self._vectors):
+                self._matrix = np.asarray(self._vectors, dtype="float32")
+            scores = self._matrix @ np.asarray(vetor, dtype="float32")
+            for linha in np.argsort(-scores)[:16]:
+                yield int(linha), float(scores[linha])
+            return
+        scores = [sum(a * b for a, b in zip(v, vetor)) for v in self._vectors]
+        for linha in sorted(range(len(scores)), key=lambda i: -scores[i])[:16]:
+            yield linha, scores[linha]
+
+    def add(self, key: str, pergunta: str, vetor: Optional[List[float]] = None) -> List[float]:
+        """Indexa a pergunta; retorna o vetor normalizado (para persistir junto da resposta)"""
+        vetor = _normalize(list(vetor)) if vetor is not None else self.embed(key, pergunta)
+        with self._lock:
+            if self._vectors and len(vetor) != len(self._vectors[0]):
+                # modelo de embeddings mudou: vetores antigos não são comparáveis
+                self._keys.clear()
+                self._rows, self._vectors, self._signatures = [], [], []
+            if key in self._keys:
+                self._remove_locked(key)
+            self._keys[key] = len(self._rows)
+            self._rows.append(key)
+            self._vectors.append(vetor)
+            self._signatures.append(citation_signature(pergunta))
+            self._matrix = None
+            while len(self._keys) > self.max_entries:
+                self._remove_locked(next(iter(self._keys)))
+            if len(self._rows) > 2 * max(len(self._keys), 16):
+                self._compact_locked()
+        return vetor
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            if key in self._keys:
+                self._remove_locked(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys.clear()
+            self._rows, self._vectors, self._signatures = [], [], []
+            self._matrix = None
+
+    def _remove_locked(self, key: str) -> None:
+        linha = self._keys.pop(key)
+        self._rows[linha] = None
+        # vetor nulo nunca passa do limiar
+        self._vectors[linha] = [0.0] * len(self._vectors[linha])
+        self._matrix = None
+
+    def _compact_locked(self) -> None:
+        vivas = [i for i, k in enumerate(self._rows) if k is not None]
+        self._rows = [self._rows[i] for i in vivas]
+        self._vectors = [self._vectors[i] for i in vivas]
+        self._signatures = [self._signatures[i] for i in vivas]
+        self._keys = OrderedDict((k, i) for i, k in enumerate(self._rows))
+        self._matrix = None
+
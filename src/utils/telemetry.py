@@ -0,0 +1,356 @@
+"""
+Rastreamento e métricas por etapa (ingestão e consulta)
+
+- span("query.dense"): mede a etapa, alimenta o histograma pf_rag_stage_seconds{stage=...}
+  e, com PF_RAG_TRACE_LOG definido, grava uma linha JSON por span (trace_id/parent_id
+  ligam as etapas de uma mesma consulta ou ingestão, inclusive entre threads do asyncio).
+- metrics.inc(...): contadores (acertos de cache, chunks, tokens).
+- exposition(): formato texto do Prometheus, servido em GET /metrics pelo servidor de
+  consultas. Com --workers N (modo multiprocesso) cada worker grava periodicamente um
+  snapshot do seu registro numa pasta comum e a coleta soma os snapshots de todos: o
+  total independe de qual worker respondeu.
+
+Só biblioteca padrão: importar este módulo não pesa nos caminhos de consulta.
+"""
+import contextvars
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ..config.settings import Settings
+
+# Limites (s) do histograma: de uma consulta ao BM25 até a indexação de um lote grande
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_TIPOS = {
+    "pf_rag_stage_seconds": ("histogram", "Duração das etapas de ingestão e consulta"),
+    "pf_rag_cache_hits_total": ("counter", "Acertos de cache (embed, busca, resposta)"),
+    "pf_rag_cache_misses_total": ("counter", "Faltas de cache (embed, busca, resposta)"),
+    "pf_rag_chunks_total": ("counter", "Chunks produzidos e indexados"),
+    "pf_rag_tokens_total": ("counter", "Tokens do LLM (prompt, geração)"),
+    "pf_rag_requests_total": ("counter", "Requisições ao servidor de consultas"),
+}
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "n")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, valor: float) -> None:
+        for i, limite in enumerate(BUCKETS):
+            if valor <= limite:
+                self.counts[i] += 1
+                break
+        self.total += valor
+        self.n += 1
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels: Labels, extra: Labels = ()) -> str:
+    pares = labels + extra
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pares) + "}"
+
+
+class Metrics:
+    """Registro em memória de contadores e histogramas, seguro entre threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        if not Settings.METRICS_ENABLED:
+            return
+        key = _labels(labels)
+        with self._lock:
+            serie = self._counters.setdefault(name, {})
+            serie[key] = serie.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        if not Settings.METRICS_ENABLED:
+            return
+        key = _labels(labels)
+        with self._lock:
+            serie = self._histograms.setdefault(name, {})
+            hist = serie.get(key)
+            if hist is None:
+                hist = serie[key] = _Histogram()
+            hist.observe(value)
+
+    def counter(self, name: str, **labels: Any) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_labels(labels), 0)
+
+    def stages(self, prefix: str = "") -> List[Tuple[str, int, float]]:
+        """(etapa, execuções, tempo total) do histograma de etapas, do mais demorado ao menos"""
+        with self._lock:
+            serie = self._histograms.get("pf_rag_stage_seconds", {})
+            linhas = [(dict(k).get("stage", ""), h.n, h.total) for k, h in serie.items()]
+        return sorted((l for l in linhas if l[0].startswith(prefix)), key=lambda l: -l[2])
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado serializável (JSON) do registro"""
+        with self._lock:
+            return {
+                "counters": [[name, list(map(list, labels)), valor]
+                             for name, serie in self._counters.items() for labels, valor in serie.items()],
+                "histograms": [[name, list(map(list, labels)), h.counts, h.total, h.n]
+                               for name, serie in self._histograms.items() for labels, h in serie.items()],
+            }
+
+    def merge(self, snapshot: Dict[str, Any]) -> None:
+        """Soma um snapshot (de outro processo) a este registro"""
+        with self._lock:
+            for name, labels, valor in snapshot.get("counters", []):
+                serie = self._counters.setdefault(name, {})
+                key = tuple(map(tuple, labels))
+                serie[key] = serie.get(key, 0) + valor
+            for name, labels, counts, total, n in snapshot.get("histograms", []):
+                serie = self._histograms.setdefault(name, {})
+                key = tuple(map(tuple, labels))
+                hist = serie.get(key)
+                if hist is None:
+                    hist = serie[key] = _Histogram()
+                hist.counts = [a + b for a, b in zip(hist.counts, counts)]
+                hist.total += total
+                hist.n += n
+
+    def dump(self, folder: str) -> None:
+        """Grava o snapshot deste processo em folder/metrics-<pid>.json (troca atômica)"""
+        destino = os.path.join(folder, f"metrics-{os.getpid()}.json")
+        tmp = f"{destino}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, destino)
+
+    def prometheus(self, pids: Optional[List[int]] = None) -> str:
+        """Formato de exposição em texto do Prometheus (0.0.4)"""
+        linhas = ["# HELP pf_rag_process_info Processos somados nesta coleta",
+                  "# TYPE pf_rag_process_info gauge"]
+        linhas += [f'pf_rag_process_info{{pid="{pid}"}} 1' for pid in (pids or [os.getpid()])]
+        with self._lock:
+            for name in sorted(self._counters):
+                tipo, ajuda = _TIPOS.get(name, ("counter", name))
+                linhas += [f"# HELP {name} {ajuda}", f"# TYPE {name} {tipo}"]
+                for labels, valor in sorted(self._counters[name].items()):
+                    linhas.append(f"{name}{_fmt_labels(labels)} {valor:g}")
+            for name in sorted(self._histograms):
+                _, ajuda = _TIPOS.get(name, ("histogram", name))
+                linhas += [f"# HELP {name} {ajuda}", f"# TYPE {name} histogram"]
+                for labels, hist in sorted(self._histograms[name].items()):
+                    acumulado = 0
+                    for limite, n in zip(BUCKETS, hist.counts):
+                        acumulado += n
+                        linhas.append(f"{name}_bucket{_fmt_labels(labels, (('le', f'{limite:g}'),))} {acumulado}")
+                    linhas.append(f"{name}_bucket{_fmt_labels(labels, (('le', '+Inf'),))} {hist.n}")
+                    linhas.append(f"{name}_sum{_fmt_labels(labels)} {hist.total:.6f}")
+                    linhas.append(f"{name}_count{_fmt_labels(labels)} {hist.n}")
+        return "\n".join(linhas) + "\n"
+
+
+metrics = Metrics()
+
+# Pasta dos snapshots por processo (modo multiprocesso do servidor com workers)
+_multiprocess_dir: Optional[str] = None
+
+
+def enable_multiprocess(folder: Optional[str] = None) -> str:
+    """
+    Liga o modo multiprocesso (no pai, antes do fork): snapshots em `folder` (padrão
+    PF_RAG_METRICS_DIR ou uma pasta temporária), esvaziada de execuções anteriores. O pai
+    grava o seu (etapas da carga) uma vez; cada worker zera a cópia herdada (reset_after_fork).
+    """
+    global _multiprocess_dir
+    folder = folder or Settings.METRICS_DIR or tempfile.mkdtemp(prefix="pf-rag-metrics-")
+    os.makedirs(folder, exist_ok=True)
+    for antigo in glob.glob(os.path.join(folder, "metrics-*.json*")):
+        os.remove(antigo)
+    _multiprocess_dir = folder
+    metrics.dump(folder)
+    return folder
+
+
+def multiprocess_dir() -> Optional[str]:
+    return _multiprocess_dir
+
+
+def reset_after_fork() -> None:
+    """No worker: o registro herdado já está no snapshot do pai"""
+    metrics.reset()
+
+
+def flush_periodically(stop: threading.Event, interval: Optional[float] = None) -> None:
+    """Laço da thread do worker que mantém o seu snapshot atualizado até `stop`"""
+    interval = interval or Settings.METRICS_FLUSH_INTERVAL
+    while _multiprocess_dir and not stop.wait(interval):
+        try:
+            metrics.dump(_multiprocess_dir)
+        except OSError as e:
+            print(f"⚠️ Falha ao gravar métricas do worker: {e}")
+
+
+def exposition() -> str:
+    """
+    Texto do GET /metrics. Em modo multiprocesso soma os snapshots de todos os processos
+    (o deste, atualizado agora); os de workers encerrados continuam somados, para que os
+    contadores nunca diminuam
+    """
+    if not _multiprocess_dir:
+        return metrics.prometheus()
+    metrics.dump(_multiprocess_dir)
+    total = Metrics()
+    pids = []
+    for caminho in sorted(glob.glob(os.path.join(_multiprocess_dir, "metrics-*.json"))):
+        try:
+            with open(caminho, encoding="utf-8") as f:
+                total.merge(json.load(f))
+        except (OSError, ValueError):
+            continue
+        pids.append(int(os.path.basename(caminho)[len("metrics-"):-len(".json")]))
+    return total.prometheus(pids)
+
+# (trace_id, span_id) do span corrente; propagado para asyncio.to_thread e tarefas
+_CORRENTE: "contextvars.ContextVar[Optional[Tuple[str, str]]]" = contextvars.ContextVar("pf_rag_span", default=None)
+
+_logger = logging.getLogger("pf_rag.trace")
+_logger.propagate = False
+_logger_lock = threading.Lock()
+_logger_destino: Optional[str] = None
+
+
+def _trace_logger() -> Optional[logging.Logger]:
+    """Logger JSON conforme PF_RAG_TRACE_LOG ("-" = stderr); None quando desativado"""
+    global _logger_destino
+    destino = Settings.TRACE_LOG
+    if not destino:
+        return None
+    if destino != _logger_destino:
+        with _logger_lock:
+            if destino != _logger_destino:
+                for h in list(_logger.handlers):
+                    _logger.removeHandler(h)
+                    h.close()
+                if destino == "-":
+                    handler: logging.Handler = logging.StreamHandler()
+                else:
+                    pasta = os.path.dirname(destino)
+                    if pasta:
+                        os.makedirs(pasta, exist_ok=True)
+                    handler = logging.FileHandler(destino, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                _logger.addHandler(handler)
+                _logger.setLevel(logging.INFO)
+                _logger_destino = destino
+    return _logger
+
+
+class Span:
+    """Etapa em andamento; `set` acrescenta atributos (chunks, tokens...) ao registro"""
+
+    __slots__ = ("name", "attrs", "trace_id", "span_id", "parent_id", "inicio", "duracao")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+        pai = _CORRENTE.get()
+        self.trace_id = pai[0] if pai else uuid.uuid4().hex[:16]
+        self.parent_id = pai[1] if pai else None
+        self.span_id = uuid.uuid4().hex[:8]
+        self.inicio = time.perf_counter()
+        self.duracao = 0.0
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.inicio
+
+
+def _finish(atual: Span, erro: Optional[BaseException] = None, verbose: bool = False) -> None:
+    metrics.observe("pf_rag_stage_seconds", atual.duracao, stage=atual.name)
+    logger = _trace_logger()
+    if logger is not None:
+        registro = {"ts": round(time.time(), 3), "span": atual.name, "trace_id": atual.trace_id,
+                    "span_id": atual.span_id, "parent_id": atual.parent_id,
+                    "dur_s": round(atual.duracao, 6), "pid": os.getpid()}
+        if atual.attrs:
+            registro["attrs"] = atual.attrs
+        if erro is not None:
+            registro["erro"] = type(erro).__name__
+        logger.info(json.dumps(registro, ensure_ascii=False, default=str))
+    if verbose and Settings.VERBOSE:
+        extras = " ".join(f"{k}={v}" for k, v in atual.attrs.items())
+        print(f"⏱️ {atual.name}: {atual.duracao:.2f}s" + (f" ({extras})" if extras else ""))
+
+
+@contextmanager
+def span(name: str, verbose: bool = False, **attrs: Any) -> Iterator[Span]:
+    """
+    Mede a etapa `name` (ex.: "ingest.embed", "query.dense"). verbose=True imprime a
+    duração com PF_RAG_VERBOSE (etapas longas da ingestão; as de consulta ficam nas métricas).
+    """
+    atual = Span(name, attrs)
+    token = _CORRENTE.set((atual.trace_id, atual.span_id))
+    erro: Optional[BaseException] = None
+    try:
+        yield atual
+    except BaseException as e:
+        erro = e
+        raise
+    finally:
+        _CORRENTE.reset(token)
+        atual.duracao = atual.elapsed
+        _finish(atual, erro, verbose)
+
+
+def record(name: str, seconds: float, **attrs: Any) -> None:
+    """
+    Etapa já medida, filha do span corrente. Para geradores (streaming), onde um `with`
+    atravessaria os yields e cada retomada pode rodar em outro contexto.
+    """
+    atual = Span(name, attrs)
+    atual.duracao = seconds
+    _finish(atual)
+
+
+def cache_result(cache: str, hit: bool) -> None:
+    metrics.inc("pf_rag_cache_hits_total" if hit else "pf_rag_cache_misses_total", cache=cache)
+
+
+def print_stage_summary(prefix: str = "") -> None:
+    """Resumo (VERBOSE) do tempo por etapa acumulado neste processo"""
+    etapas = metrics.stages(prefix)
+    if not etapas or not Settings.VERBOSE:
+        return
+    print("📊 Tempo por etapa:")
+    for nome, n, total in etapas:
+        print(f"   {nome:<20} {total:8.2f}s  ({n}x, média {total / max(1, n):.3f}s)")
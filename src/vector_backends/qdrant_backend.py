@@ -6,7 +6,6 @@ import glob
 from typing import List, Dict, Any, Optional
 
 from langchain.embeddings.base import Embeddings
-from langchain_ollama import OllamaEmbeddings
 
 # Prefer the new package, fallback to community for compatibility
 try:  # LangChain >= 0.0.37 moved Qdrant into a separate package
@@ -19,18 +18,17 @@ except Exception:  # pragma: no cover
     QdrantClient = None  # type: ignore
 
 from src.config.settings import Settings
-from src.pf_rag.embed_index import SbertEmbeddings
+from src.pf_rag.embed_index import make_embeddings, scheduler_for
+from src.pf_rag.embed_scheduler import PrecomputedEmbeddings
 from src.pf_rag.types import Chunk
+from src.utils.telemetry import metrics, span
 
 
 class QdrantIndexer:
     """Qdrant indexer for local embedded usage with upsert/delete capabilities."""
 
     def __init__(self, backend: str = Settings.EMBEDDING_BACKEND):
-        if backend == "ollama":
-            self.embeddings: Embeddings = OllamaEmbeddings(model=Settings.EMBEDDING_MODEL)
-        else:
-            self.embeddings = SbertEmbeddings()
+        self.embeddings: Embeddings = make_embeddings(backend)
         # Don't create client here - let LangChain manage it to avoid conflicts
         if QdrantClient is None:
             raise RuntimeError("qdrant-client não instalado. Instale qdrant-client para usar backend Qdrant.")
@@ -123,10 +121,11 @@ class QdrantIndexer:
     def to_texts_and_metadatas(self, chunks: List[Chunk]) -> tuple[List[str], List[Dict[str, Any]]]:
         texts: List[str] = []
         metas: List[Dict[str, Any]] = []
-        for ch in chunks:
+        for ordem, ch in enumerate(chunks):
             texts.append(ch.texto)
             md = {k: v for k, v in ch.__dict__.items() if k != "texto"}
             md.setdefault("file_path", ch.origem_pdf.get("arquivo"))
+            md["ordem"] = ordem
             metas.append(md)
         return texts, metas
 
@@ -136,23 +135,37 @@ class QdrantIndexer:
         if progress_callback:
             progress_callback(0.1, f"🧠 Criando embeddings e base Qdrant (chunks={len(texts)})...")
 
+        # Embeddings em lotes concorrentes antes do upsert; retentativas reaproveitam os vetores
+        def embed_cb(frac: float, msg: str):
+            if progress_callback:
+                progress_callback(0.1 + 0.6 * frac, f"🧠 {msg}")
+
+        with span("ingest.embed", verbose=True, chunks=len(texts)):
+            vectors = scheduler_for(self.embeddings).embed_array(
+                texts, tokens=[ch.tokens_estimados for ch in chunks], progress_cb=embed_cb
+            )
+        embedding = PrecomputedEmbeddings(self.embeddings, texts, vectors)
+
         # Clear any existing locks/instances before creating new
         max_retries = 3
         for attempt in range(max_retries):
             try:
                 if progress_callback:
-                    progress_callback(0.3, f"🔗 Conectando ao Qdrant...")
+                    progress_callback(0.75, f"🔗 Conectando ao Qdrant...")
 
                 # Use from_texts for both langchain_qdrant and community versions
-                vs = LCQdrant.from_texts(
-                    texts=texts,
-                    embedding=self.embeddings,
-                    metadatas=metas,
-                    url=None,  # Use path instead
-                    path=Settings.QDRANT_PATH,
-                    collection_name=self.collection,
-                )
-
+                with span("ingest.upsert", verbose=True, chunks=len(texts), backend="qdrant"):
+                    vs = LCQdrant.from_texts(
+                        texts=texts,
+                        embedding=embedding,
+                        metadatas=metas,
+                        url=None,  # Use path instead
+                        path=Settings.QDRANT_PATH,
+                        collection_name=self.collection,
+                    )
+
+                embedding.release()
+                metrics.inc("pf_rag_chunks_total", len(texts), stage="indexed")
                 if progress_callback:
                     progress_callback(1.0, f"✅ Base Qdrant criada com {len(texts)} chunks")
 
@@ -0,0 +1,75 @@
+import json
+import threading
+import time
+
+from src.utils.answer_store import AnswerStore
+from src.utils.index_generation import IndexGeneration
+
+
+def _entry(resposta, **extra):
+    return {"resposta": resposta, "timestamp": time.time(), "pergunta_original": resposta, **extra}
+
+
+def test_roundtrip_keeps_vector_out_of_answer(tmp_path):
+    store = AnswerStore(str(tmp_path / "c.sqlite"), max_entries=10, ttl_seconds=0)
+    store.put("q", _entry("r", vetor_pergunta=[0.5, 0.25]))
+    assert store.get("q")["resposta"] == "r"
+    assert "vetor_pergunta" not in store.get("q")
+    assert list(store.iter_vectors(10)) == [("q", "r", [0.5, 0.25])]
+    assert store.get("outra") is None
+
+
+def test_lru_and_ttl_eviction(tmp_path):
+    store = AnswerStore(str(tmp_path / "c.sqlite"), max_entries=2, ttl_seconds=0)
+    for k in ("a", "b", "c"):
+        store.put(k, _entry(k))
+        time.sleep(0.01)
+    store.get("a")  # "b" passa a ser a menos acessada
+    assert store.evict() == 1
+    assert store.get("b") is None and store.get("a") and store.get("c")
+
+    expira = AnswerStore(str(tmp_path / "t.sqlite"), ttl_seconds=60)
+    expira.put("velha", {"resposta": "x", "timestamp": time.time() - 120})
+    assert expira.get("velha") is None
+
+
+def test_concurrent_writers_and_legacy_import(tmp_path):
+    path = str(tmp_path / "c.sqlite")
+
+    def writer(n):
+        store = AnswerStore(path, ttl_seconds=0)
+        for i in range(50):
+            store.put(f"{n}-{i}", _entry(str(i)))
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(AnswerStore(path)) == 200
+
+    legado = tmp_path / "cache.json"
+    legado.write_text(json.dumps({"antiga": {"resposta": "sim", "timestamp": time.time()}}), encoding="utf-8")
+    store = AnswerStore(path, ttl_seconds=0)
+    assert store.import_json(str(legado)) == 1
+    assert store.get("antiga")["resposta"] == "sim"
+
+
+def test_startup_does_not_scan_store_and_ttl_uses_index(tmp_path, monkeypatch):
+    from src.utils.cache_utils import CacheUtils
+
+    store = AnswerStore(str(tmp_path / "c.sqlite"), ttl_seconds=60)
+    store.put("q", _entry("r"))
+
+    def evict():
+        raise AssertionError("descarte na inicialização")
+
+    monkeypatch.setattr(store, "evict", evict)
+    monkeypatch.setattr("src.utils.cache_utils.Settings.CACHE_FILE", str(tmp_path / "legado.json"))
+    cache = CacheUtils(store=store, generation=IndexGeneration(str(tmp_path / "g.sqlite")))
+    assert cache.get_cached_response("q")["resposta"] == "r"
+
+    plano = store._conn().execute(
+        "EXPLAIN QUERY PLAN DELETE FROM respostas WHERE criado < ?", (time.time(),)
+    ).fetchall()
+    assert any("respostas_criado" in linha[-1] for linha in plano)
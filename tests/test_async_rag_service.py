@@ -0,0 +1,175 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.core.async_rag_service import AsyncRAGService
+from src.pf_rag.retrieval_cache import RetrievalCache
+from src.pf_rag.search import Searcher
+
+
+class _FakeDB:
+    def similarity_search(self, q, k=4, filter=None):
+        return [SimpleNamespace(page_content="prazo de posse", metadata={"anchor_id": "a1"})]
+
+
+class _FakeLLM:
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+
+    async def ainvoke(self, prompt, config=None):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        # resposta final do Ollama (durações em ns) chega ao callback de tempos
+        info = {"prompt_eval_count": 900, "prompt_eval_duration": 300_000_000,
+                "eval_count": 50, "eval_duration": 1_000_000_000}
+        for cb in (config or {}).get("callbacks", []):
+            cb.on_llm_end(SimpleNamespace(generations=[[SimpleNamespace(generation_info=info)]]))
+        return "resposta"
+
+    async def astream(self, prompt, config=None):
+        for parte in ("res", "posta"):
+            await asyncio.sleep(self.delay)
+            yield parte
+
+
+class _FakeService:
+    def __init__(self, llm):
+        self.llm = llm
+        self.searcher = Searcher(_FakeDB(), cache=RetrievalCache(max_size=8))
+        self.saved = []
+        self.cache = SimpleNamespace(save_response=lambda p, r, f, g=None: self.saved.append((p, r, f)))
+
+    def _cached_answer(self, pergunta):
+        return None
+
+    def _circuit_allows(self):
+        return True
+
+    def _record_success(self):
+        pass
+
+    def _record_error(self, e):
+        raise AssertionError(e)
+
+    def _record_timeout(self):
+        pass
+
+    def _release_probe(self):
+        pass
+
+    def _build_prompt(self, pergunta, docs):
+        return pergunta
+
+    @staticmethod
+    def _fontes(docs):
+        return [d.metadata["anchor_id"] for d in docs]
+
+
+def test_concurrent_answers_respect_llm_limit():
+    llm = _FakeLLM()
+    service = _FakeService(llm)
+    rag = AsyncRAGService(service, timeout=5, llm_concurrency=2)
+
+    async def run():
+        return await asyncio.gather(*(rag.answer(f"pergunta {i}") for i in range(6)))
+
+    results = asyncio.run(run())
+    assert all(r["result"] == "resposta" for r in results)
+    assert results[0]["stats"] == {"prompt_eval_s": 0.3, "eval_s": 1.0, "prompt_tokens": 900,
+                                   "eval_tokens": 50, "eval_tok_s": 50.0}
+    assert llm.peak == 2
+    assert len(service.saved) == 6 and service.saved[0][2] == ["a1"]
+
+
+def test_timeout_and_stream():
+    rag = AsyncRAGService(_FakeService(_FakeLLM(delay=0.5)), timeout=0.1)
+    assert asyncio.run(rag.answer("lenta"))["result"] is None
+
+    rag = AsyncRAGService(_FakeService(_FakeLLM(delay=0.01)), timeout=5)
+    sources, stats = [], {}
+
+    async def consume():
+        return [t async for t in rag.stream("pergunta", sources=sources, stats=stats)]
+
+    assert "".join(asyncio.run(consume())) == "resposta"
+    assert sources[0].metadata["anchor_id"] == "a1" and stats["chunks"] == 2 and "error" not in stats
+
+    # prazo já esgotado: busca vazia; stream vazio marcado com o erro
+    assert asyncio.run(rag.search("pergunta", timeout=0)) == []
+    stats = {}
+
+    async def sem_prazo():
+        return [t async for t in rag.stream("pergunta", stats=stats, timeout=0)]
+
+    assert asyncio.run(sem_prazo()) == [] and stats["error"] == "TIMEOUT"
+
+
+class _BreakerService(_FakeService):
+    """Disjuntor real, já no meio-aberto: cada chamada liberada é a tentativa única"""
+
+    def __init__(self, llm):
+        super().__init__(llm)
+        from src.services.ollama_service import CircuitBreaker
+
+        self.breaker = CircuitBreaker(max_failures=1, cooldown=0)
+        self.breaker.record_failure()
+
+    def _circuit_allows(self):
+        return self.breaker.allow()
+
+    def _record_success(self):
+        self.breaker.record_success()
+
+    def _record_timeout(self):
+        self.breaker.record_failure()
+
+    def _release_probe(self):
+        self.breaker.release()
+
+
+def test_half_open_probe_is_released_on_every_exit():
+    pytest.importorskip("requests")
+
+    # tempo limite na geração: falha, e a próxima tentativa é liberada
+    service = _BreakerService(_FakeLLM(delay=0.5))
+    rag = AsyncRAGService(service, timeout=0.1)
+    assert asyncio.run(rag.answer("lenta"))["result"] is None
+    assert service.breaker.state == "half_open" and service.breaker.allow()
+
+    async def consume(rag, n=None):
+        agen = rag.stream("pergunta")
+        partes = []
+        async for t in agen:
+            partes.append(t)
+            if len(partes) == n:
+                break
+        await agen.aclose()
+        return partes
+
+    service = _BreakerService(_FakeLLM(delay=0.5))
+    assert asyncio.run(consume(AsyncRAGService(service, timeout=0.1))) == []
+    assert service.breaker.allow()
+
+    # consumidor abandona o stream: o Ollama respondeu, o circuito fecha
+    service = _BreakerService(_FakeLLM(delay=0.01))
+    assert asyncio.run(consume(AsyncRAGService(service, timeout=5), n=1)) == ["res"]
+    assert service.breaker.state == "closed"
+
+    # sem vaga no LLM até o prazo: nenhuma chamada, a tentativa volta sem veredito
+    for chamada in ("answer", "stream"):
+        service = _BreakerService(_FakeLLM())
+        rag = AsyncRAGService(service, timeout=0.1, llm_concurrency=1)
+
+        async def sem_vaga():
+            await rag._slots().acquire()
+            if chamada == "answer":
+                return (await rag.answer("pergunta"))["result"]
+            return await consume(rag)
+
+        assert asyncio.run(sem_vaga()) in (None, [])
+        assert not service.breaker._probing and service.breaker._failures == 1
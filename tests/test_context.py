@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+
+from src.pf_rag.context import pack_context
+
+
+def _doc(anchor, tokens, parent=None, ordem=0, doc_id="d1"):
+    meta = {"anchor_id": anchor, "parent_id": parent, "tokens_estimados": tokens, "ordem": ordem, "doc_id": doc_id}
+    return SimpleNamespace(page_content="x" * tokens * 4, metadata=meta)
+
+
+def _ids(docs):
+    return [d.metadata["anchor_id"] for d in docs]
+
+
+def test_parent_absorbs_children_and_order_follows_text():
+    art = _doc("art-5", 300, ordem=10)
+    par1 = _doc("art-5-par-1", 80, parent="art-5", ordem=11)
+    inc = _doc("art-5-par-1-inc-i", 20, parent="art-5-par-1", ordem=12)
+    art2 = _doc("art-2", 100, ordem=3)
+    # filho mais relevante que o pai: o pai entra depois e o substitui
+    packed = pack_context([inc, art2, art, par1], budget=1000)
+    assert _ids(packed) == ["art-2", "art-5"]
+
+
+def test_budget_skips_large_chunks_but_keeps_smaller_ones():
+    grande = _doc("a", 900, ordem=1)
+    medio = _doc("b", 500, ordem=2)
+    pequeno = _doc("c", 50, ordem=0, doc_id="d2")
+    packed = pack_context([grande, medio, pequeno], budget=1000)
+    # documentos na ordem do mais relevante; "b" não cabe depois de "a"
+    assert _ids(packed) == ["a", "c"]
+    assert _ids(pack_context([_doc("z", 5000)], budget=100)) == ["z"]
+
+
+def test_expand_pulls_caput_and_adjacent_incisos():
+    from src.pf_rag.search import Searcher
+
+    def chunk(anchor, texto, nivel, parent=None, prev=None, nxt=None, ordem=0):
+        meta = {"anchor_id": anchor, "parent_id": parent, "nivel": nivel, "ordem": ordem,
+                "siblings_prev_id": prev, "siblings_next_id": nxt, "tokens_estimados": len(texto) // 4}
+        return SimpleNamespace(page_content=texto, metadata=meta)
+
+    incisos = ["I - servidores ativos;", "II - aposentados;", "III - pensionistas."]
+    art = chunk("art-8", "Art. 8º Fazem jus ao auxílio: " + " ".join(incisos), "artigo", ordem=0)
+    inc = [
+        chunk("art-8-inc-i", incisos[0], "inciso", "art-8", None, "art-8-inc-ii", 1),
+        chunk("art-8-inc-ii", incisos[1], "inciso", "art-8", "art-8-inc-i", "art-8-inc-iii", 2),
+        chunk("art-8-inc-iii", incisos[2], "inciso", "art-8", "art-8-inc-ii", None, 3),
+    ]
+    db = SimpleNamespace(docstore=SimpleNamespace(_dict={d.metadata["anchor_id"]: d for d in [art] + inc}))
+    searcher = Searcher(db)
+
+    expanded = searcher.expand([inc[1]], budget=1000)
+    assert _ids(expanded) == ["art-8-inc-ii", "art-8#caput", "art-8-inc-i", "art-8-inc-iii"]
+    assert expanded[1].page_content == "Art. 8º Fazem jus ao auxílio:"
+    # sem orçamento, só o próprio trecho
+    assert _ids(searcher.expand([inc[1]], budget=0)) == ["art-8-inc-ii"]
+    # caput entra no contexto e o pacote segue a ordem do texto
+    packed = pack_context(expanded, budget=1000, lookup=searcher.lookup)
+    assert _ids(packed)[0] == "art-8#caput"
+
+
+def _real_chunks(texto):
+    from src.pf_rag.chunker import build_chunks
+    from src.pf_rag.metadata_pf import extract
+    from src.pf_rag.parse_norma import detect_structure
+
+    nodes, heading = detect_structure(texto)
+    chunks = build_chunks(nodes, texto, extract(texto, heading, "p.pdf"), "p.pdf", [1])
+    docs = []
+    for ordem, ch in enumerate(chunks):
+        meta = {k: v for k, v in ch.__dict__.items() if k != "texto"}
+        meta["ordem"] = ordem
+        docs.append(SimpleNamespace(page_content=ch.texto, metadata=meta))
+    return docs
+
+
+DOIS_ARTIGOS = """PORTARIA Nº 1, DE 2 DE JANEIRO DE 2020
+
+Art. 1º São deveres do servidor:
+I - ser assíduo;
+II - zelar pela economia.
+Art. 2º O servidor deve:
+I - manter sigilo;
+II - cumprir as ordens.
+"""
+
+
+def test_expand_stays_within_the_same_article():
+    from src.pf_rag.search import Searcher
+
+    docs = _real_chunks(DOIS_ARTIGOS)
+    assert len({d.metadata["anchor_id"] for d in docs}) == len(docs)
+    db = SimpleNamespace(docstore=SimpleNamespace(_dict={str(i): d for i, d in enumerate(docs)}))
+    searcher = Searcher(db)
+    art1_i = next(d for d in docs if d.page_content == "I - ser assíduo;")
+
+    textos = [d.page_content for d in searcher.expand([art1_i], budget=1000)]
+    assert textos == ["I - ser assíduo;", "Art. 1º São deveres do servidor:", "II - zelar pela economia."]
+
+    # índice antigo (anchor sem o artigo): anchors repetidos não são expandidos
+    for d in docs:
+        for campo in ("anchor_id", "siblings_prev_id", "siblings_next_id"):
+            if d.metadata.get(campo):
+                d.metadata[campo] = d.metadata[campo].replace("artigo-1-", "").replace("artigo-2-", "")
+    textos = [d.page_content for d in Searcher(db).expand([art1_i], budget=1000)]
+    assert "II - cumprir as ordens." not in textos
+
+
+def test_pack_keeps_same_numbered_devices_of_different_articles():
+    docs = _real_chunks(DOIS_ARTIGOS + "§ 1º Aplica-se:\nI - aos efetivos;\nII - aos comissionados.\n")
+    por_texto = {d.page_content.split("\n")[0]: d for d in docs}
+    art1_i, art2_i = por_texto["I - ser assíduo;"], por_texto["I - manter sigilo;"]
+    par1_i = por_texto["I - aos efetivos;"]
+    art1 = por_texto["Art. 1º São deveres do servidor:"]
+
+    assert pack_context([art1_i, art2_i], budget=1000) == [art1_i, art2_i]
+    # o "§ 1º" é do Art. 2º: o Art. 1º não absorve o inciso dele
+    assert pack_context([art1, par1_i], budget=1000) == [art1, par1_i]
+
+    # índice antigo: anchors repetidos continuam sendo trechos distintos
+    for d in (art1_i, art2_i):
+        d.metadata["anchor_id"] = "documento-pf-inciso-i"
+    assert pack_context([art1_i, art2_i], budget=1000) == [art1_i, art2_i]
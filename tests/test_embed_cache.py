@@ -0,0 +1,50 @@
+import pytest
+
+pytest.importorskip("langchain")
+
+from src.pf_rag.embed_cache import CachedEmbeddings
+
+
+class _FakeEmbeddings:
+    model = "nomic-embed-text"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_query(self, text):
+        self.calls.append(text)
+        return [float(len(text)), 1.0]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+
+def test_hits_misses_and_lru():
+    base = _FakeEmbeddings()
+    cache = CachedEmbeddings(base, max_size=2, ttl=0)
+    assert cache.embed_query("prazo de posse") == cache.embed_query("  prazo   de posse ")
+    assert base.calls == ["prazo de posse"]
+    assert cache.model == "nomic-embed-text"
+
+    cache.embed_query("férias")
+    cache.embed_query("licença")  # expulsa "prazo de posse"
+    cache.embed_query("prazo de posse")
+    assert cache.stats() == {"hits": 1, "misses": 4, "size": 2}
+
+    cache.embed_documents(["a", "b"])
+    assert cache.stats()["size"] == 2
+
+
+def test_ttl_expires(monkeypatch):
+    import src.pf_rag.embed_cache as mod
+
+    agora = [100.0]
+    monkeypatch.setattr(mod.time, "monotonic", lambda: agora[0])
+    base = _FakeEmbeddings()
+    cache = CachedEmbeddings(base, max_size=8, ttl=10)
+    cache.embed_query("prazo")
+    agora[0] += 5
+    cache.embed_query("prazo")
+    agora[0] += 20
+    cache.embed_query("prazo")
+    assert len(base.calls) == 2 and cache.hits == 1
@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("langchain_community")
+
+from src.pf_rag.embed_onnx import OnnxEmbeddings, _mean_pool
+
+
+class _FakeTokenizer:
+    def __call__(self, texts, truncation=True, max_length=128):
+        ids = [[1] * len(t.split()) for t in texts]
+        return {"input_ids": ids, "attention_mask": [[1] * len(i) for i in ids]}
+
+    def pad(self, encoded, padding=True, return_tensors="np"):
+        largura = max(len(i) for i in encoded["input_ids"])
+        return {k: np.array([v + [0] * (largura - len(v)) for v in vs]) for k, vs in encoded.items()}
+
+
+class _FakeSession:
+    def __init__(self):
+        self.shapes = []
+
+    def run(self, outputs, feed):
+        ids = feed["input_ids"]
+        self.shapes.append(ids.shape)
+        # vetor do token = (posição + 1, 1): a média depende só do nº de tokens reais
+        pos = np.arange(1, ids.shape[1] + 1, dtype=np.float32)
+        return [np.stack([np.broadcast_to(pos, ids.shape), np.ones(ids.shape, np.float32)], axis=-1)]
+
+
+def test_length_buckets_and_mean_pooling():
+    emb = OnnxEmbeddings.__new__(OnnxEmbeddings)
+    emb.tokenizer, emb.session = _FakeTokenizer(), _FakeSession()
+    emb.batch_size, emb.max_length = 2, 128
+    emb._inputs = ["input_ids", "attention_mask", "token_type_ids"]
+
+    texts = ["a b c d e f", "a", "a b c d e", "a b"]
+    vetores = emb.embed_array(texts)
+    # lotes por tamanho: (1, 2 tokens) e (5, 6 tokens), sem padding até o maior do corpus
+    assert emb.session.shapes == [(2, 2), (2, 6)]
+    esperado = _mean_pool(np.array([[[n, 1]] * 1 for n in (3.5, 1, 3, 1.5)], np.float32), np.ones((4, 1)))
+    assert np.allclose(vetores, esperado, atol=1e-6)
+    assert np.allclose(np.linalg.norm(vetores, axis=1), 1.0)
+    assert emb.embed_query("a b") == pytest.approx(vetores[3].tolist())
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("langchain")
+
+from src.pf_rag.embed_scheduler import EmbeddingScheduler, PrecomputedEmbeddings
+
+
+class _FakeEmbeddings:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.batches.append(list(texts))
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return [[float(len(t))] for t in texts]
+
+    def embed_query(self, text):
+        return [-1.0]
+
+
+def test_vectors_keep_original_order_with_batches_in_flight():
+    emb = _FakeEmbeddings(delay=0.01)
+    texts = ["x" * (i % 17 + 1) for i in range(100)]
+    sched = EmbeddingScheduler(emb, in_flight=3, batch_size=8, min_batch=2, max_batch=32, target_latency=10)
+    got = sched.embed(texts, progress_cb=lambda frac, msg: None)
+    assert got == [[float(len(t))] for t in texts]
+    assert emb.peak >= 2
+
+
+def test_batches_group_similar_lengths_and_respect_token_cap():
+    emb = _FakeEmbeddings()
+    texts = ["a" * n for n in (400, 4, 404, 8, 396, 12)]
+    tokens = [len(t) // 4 for t in texts]
+    sched = EmbeddingScheduler(emb, in_flight=1, batch_size=3, min_batch=1, max_batch=3,
+                               max_tokens=250, target_latency=10)
+    sched.embed(texts, tokens=tokens)
+    assert [sorted(len(t) for t in b) for b in emb.batches] == [[4, 8, 12], [396, 400], [404]]
+
+
+def test_batch_size_adapts_to_latency():
+    sched = EmbeddingScheduler(_FakeEmbeddings(), batch_size=16, min_batch=4, max_batch=64, target_latency=1.0)
+    sched._adapt(16, 0.1)
+    assert sched.batch_size > 16
+    grown = sched.batch_size
+    sched._adapt(grown, 5.0)
+    assert sched.batch_size == max(4, grown // 2)
+
+
+def test_precomputed_embeddings_fall_back_to_base():
+    base = _FakeEmbeddings()
+    pre = PrecomputedEmbeddings(base, ["a", "bb"], [[9.0], [8.0]])
+    assert pre.embed_documents(["bb", "ccc"]) == [[8.0], [3.0]]
+    assert base.batches == [["ccc"]]
+    assert pre.embed_query("q") == [-1.0]
+
+
+def test_embed_array_fills_float32_matrix_in_order():
+    np = pytest.importorskip("numpy")
+
+    class _ArrayEmbeddings(_FakeEmbeddings):
+        def embed_array(self, texts):
+            self.batches.append(list(texts))
+            return np.array([[len(t), 1] for t in texts], dtype=np.float64)
+
+    emb = _ArrayEmbeddings()
+    texts = ["x" * (i % 7 + 1) for i in range(40)]
+    sched = EmbeddingScheduler(emb, in_flight=2, batch_size=8, min_batch=2, max_batch=16, target_latency=10)
+    matrix = sched.embed_array(texts)
+    assert matrix.dtype == np.float32 and matrix.shape == (40, 2)
+    assert matrix[:, 0].tolist() == [float(len(t)) for t in texts]
+
+    pre = PrecomputedEmbeddings(emb, texts[:3], matrix[:3])
+    assert isinstance(pre.embed_documents(texts[1:3]), np.ndarray)
+    assert pre.embed_documents([texts[0], "novo"]) == [[1.0, 1.0], [4.0]]
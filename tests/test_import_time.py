@@ -0,0 +1,59 @@
+"""
+Guarda de regressão do tempo de importação (python -X importtime)
+
+Os caminhos de consulta e a CLI não podem voltar a carregar a pilha de ingestão
+(pdfminer, Docling, OCR), torch/sentence-transformers ou o Qdrant ao serem importados.
+"""
+import os
+import re
+import subprocess
+import sys
+import warnings
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+INGESTAO = {"pdfminer", "docling", "pytesseract", "pdf2image", "qdrant_client", "langchain_qdrant",
+            "torch", "sentence_transformers", "transformers", "onnxruntime",
+            "langchain_community.document_loaders"}
+# langchain_text_splitters fica fora: o próprio langchain_core (messages.utils) o importa
+# quando instalado, e langchain_core é permitido no caminho de consulta
+
+
+def _importtime(modulo, proibidos):
+    """{módulo: tempo cumulativo em µs} de tudo que `import modulo` carrega"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+                          cwd=ROOT, capture_output=True, text=True, timeout=120)
+    if proc.returncode != 0:
+        ausente = re.search(r"ModuleNotFoundError: No module named '([\w.]+)'", proc.stderr)
+        if not ausente:
+            raise AssertionError(proc.stderr[-2000:])
+        nome = ausente.group(1)
+        # Faltar um módulo proibido significa que a importação chegou até ele
+        assert nome not in proibidos and nome.split(".")[0] not in proibidos, \
+            f"{modulo} tentou importar {nome}"
+        # Aviso aparece no resumo do pytest mesmo sem -rs: a guarda não rodou neste ambiente
+        warnings.warn(f"guarda de importação não verificada para {modulo}: instale {nome}")
+        pytest.skip(f"{nome} não instalado; {modulo} não pôde ser importado")
+    tempos = {}
+    for linha in proc.stderr.splitlines():
+        if not linha.startswith("import time:") or "|" not in linha:
+            continue
+        _, cumulativo, nome = linha.split("|", 2)
+        if cumulativo.strip().isdigit():
+            tempos[nome.strip()] = int(cumulativo)
+    return tempos
+
+
+@pytest.mark.parametrize("modulo,proibidos", [
+    # cliente fino (main.py, CLI e UI com o servidor no ar): só biblioteca padrão
+    ("src.core.query_client", INGESTAO | {"langchain", "langchain_core", "numpy"}),
+    ("src.pf_rag.cli", INGESTAO | {"langchain", "langchain_community", "numpy"}),
+    ("src.pf_rag.io_pdf", INGESTAO),
+    ("src.services.document_service", INGESTAO),
+])
+def test_import_does_not_load_ingestion_stack(modulo, proibidos):
+    tempos = _importtime(modulo, proibidos)
+    carregados = sorted(m for m in tempos if m in proibidos or m.split(".")[0] in proibidos)
+    assert not carregados, f"{modulo} importou {carregados} ({tempos[modulo] / 1000:.0f} ms)"
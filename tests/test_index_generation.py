@@ -0,0 +1,142 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.utils.answer_store import AnswerStore
+from src.utils.index_generation import IndexGeneration
+
+
+def _ch(anchor, texto, doc="doc-1"):
+    return SimpleNamespace(anchor_id=anchor, doc_id=doc, hash_conteudo=f"h:{texto}")
+
+
+def test_generation_reports_only_changed_and_removed_anchors(tmp_path):
+    gen = IndexGeneration(str(tmp_path / "g.sqlite"))
+    assert gen.current() == 0
+    g1, changed = gen.advance([_ch("a1", "x"), _ch("a2", "y"), _ch("a3", "z")])
+    assert (g1, changed) == (1, set())
+    g2, changed = gen.advance([_ch("a1", "x"), _ch("a2", "y2")])
+    assert g2 == 2 and changed == {"a2", "a3"}
+    # incremental: novos anchors não invalidam nada
+    g3, changed = gen.advance([_ch("b1", "w", doc="doc-2")], full=False)
+    assert g3 == 3 and changed == set() and gen.current() == 3
+
+
+def test_store_invalidates_only_answers_using_changed_sources(tmp_path):
+    store = AnswerStore(str(tmp_path / "c.sqlite"), ttl_seconds=0)
+    store.put("q1", {"resposta": "1", "timestamp": 1e12}, fontes=["a1", "a2"])
+    store.put("q2", {"resposta": "2", "timestamp": 1e12}, fontes=["a3"])
+    store.put("legado", {"resposta": "3", "timestamp": 1e12})
+    removed = store.invalidate({"a2"})
+    assert sorted(removed) == ["legado", "q1"]
+    assert store.get("q1") is None and store.get("q2")["resposta"] == "2"
+
+
+def _chunks_reais(texto):
+    from src.pf_rag.chunker import build_chunks
+    from src.pf_rag.metadata_pf import extract
+    from src.pf_rag.parse_norma import detect_structure
+
+    nodes, heading = detect_structure(texto)
+    return build_chunks(nodes, texto, extract(texto, heading, "p.pdf"), "p.pdf", [1])
+
+
+NORMA = """PORTARIA Nº 1, DE 2 DE JANEIRO DE 2020
+
+Art. 1º São deveres do servidor:
+I - ser assíduo;
+II - zelar pela economia.
+Art. 2º O servidor deve:
+I - manter sigilo;
+II - cumprir as ordens.
+"""
+
+
+def test_edit_of_same_numbered_device_in_first_article_is_detected(tmp_path):
+    gen = IndexGeneration(str(tmp_path / "g.sqlite"))
+    gen.advance(_chunks_reais(NORMA))
+    editada = _chunks_reais(NORMA.replace("ser assíduo", "ser pontual"))
+    _, changed = gen.advance(editada)
+    assert changed == {ch.anchor_id for ch in editada if "pontual" in ch.texto}
+    assert any(a.endswith("artigo-1-inciso-i") for a in changed)
+    assert not any("artigo-2" in a for a in changed)
+
+    # anchors repetidos (mesmo doc_id em PDFs diferentes): a edição de qualquer um aparece
+    gen.advance([_ch("x", "1"), _ch("x", "2")])
+    _, changed = gen.advance([_ch("x", "1b"), _ch("x", "2")])
+    assert changed == {"x"}
+
+
+def test_stale_answers_are_dropped_on_read(tmp_path, monkeypatch):
+    from src.config.settings import Settings
+    from src.utils.cache_utils import CacheUtils
+
+    monkeypatch.setattr(Settings, "CACHE_FILE", str(tmp_path / "legado.json"))
+    gen = IndexGeneration(str(tmp_path / "g.sqlite"))
+    assert gen._connect() is gen._connect()
+    gen.advance([_ch("a1", "x"), _ch("a2", "y")])
+    cache = CacheUtils(store=AnswerStore(str(tmp_path / "c.sqlite"), ttl_seconds=0), generation=gen)
+    cache.save_response("Pergunta 1?", "r1", ["a1"], geracao=1)
+    cache.save_response("Pergunta 2?", "r2", ["a2"], geracao=1)
+    cache.save_response("Pergunta 3?", "r3")
+
+    # reindexação cuja invalidação não chegou ao cache (ex.: corrida com a gravação)
+    gen.advance([_ch("a1", "x"), _ch("a2", "y2")])
+    assert not gen.stale(["a1"], 1) and gen.stale(["a2"], 1) and gen.stale([], 1)
+    assert cache.get_cached_response("Pergunta 1?")["resposta"] == "r1"
+    assert cache.get_cached_response("Pergunta 2?") is None
+    assert cache.get_cached_response("Pergunta 3?") is None
+    assert cache.store.get("pergunta 2") is None
+
+
+def test_cached_answer_returns_recorded_sources_without_search(tmp_path, monkeypatch):
+    pytest.importorskip("langchain")
+    pytest.importorskip("langchain_ollama")
+    from src.config.settings import Settings
+    from src.core.rag_service import RAGService
+    from src.pf_rag.search import Searcher
+    from src.utils.cache_utils import CacheUtils
+
+    monkeypatch.setattr(Settings, "CACHE_FILE", str(tmp_path / "legado.json"))
+    art = SimpleNamespace(page_content="Art. 8º Fazem jus: I - ativos; II - aposentados.",
+                          metadata={"anchor_id": "art-8", "nivel": "artigo", "ordem": 0})
+    inc = [SimpleNamespace(page_content=texto, metadata={"anchor_id": anchor, "parent_id": "art-8",
+                                                        "nivel": "inciso", "ordem": ordem})
+           for anchor, texto, ordem in (("art-8-inc-i", "I - ativos;", 1), ("art-8-inc-ii", "II - aposentados.", 2))]
+    db = SimpleNamespace(docstore=SimpleNamespace(_dict={d.metadata["anchor_id"]: d for d in [art] + inc}))
+
+    service = object.__new__(RAGService)
+    service.cache = CacheUtils(store=AnswerStore(str(tmp_path / "c.sqlite"), ttl_seconds=0),
+                               generation=IndexGeneration(str(tmp_path / "g.sqlite")))
+    service.searcher = Searcher(db)
+
+    def busca(*args, **kwargs):
+        raise AssertionError("acerto do cache não deve buscar de novo")
+
+    service.retrieve = busca
+    service.cache.save_response("Quem faz jus?", "Ativos e aposentados.", ["art-8-inc-ii", "art-8#caput"])
+    saida = service.answer_question("Quem faz jus?", return_source_documents=True)
+    assert saida["result"] == "Ativos e aposentados."
+    assert [d.metadata["anchor_id"] for d in saida["source_documents"]] == ["art-8-inc-ii", "art-8#caput"]
+    assert saida["source_documents"][1].page_content == "Art. 8º Fazem jus:"
+
+    sources = []
+    assert list(service.stream_answer("Quem faz jus?", sources=sources)) == ["Ativos e aposentados."]
+    assert len(sources) == 2
+
+
+def test_derived_caput_source_tracks_its_parent(tmp_path, monkeypatch):
+    from src.config.settings import Settings
+    from src.utils.cache_utils import CacheUtils
+
+    monkeypatch.setattr(Settings, "CACHE_FILE", str(tmp_path / "legado.json"))
+    gen = IndexGeneration(str(tmp_path / "g.sqlite"))
+    gen.advance([_ch("art-8", "x"), _ch("art-9", "y")])
+    cache = CacheUtils(store=AnswerStore(str(tmp_path / "c.sqlite"), ttl_seconds=0), generation=gen)
+    cache.save_response("Pergunta?", "r", ["art-8#caput"], geracao=1)
+
+    # outro artigo mudou: a resposta continua válida
+    gen.advance([_ch("art-8", "x"), _ch("art-9", "y2")])
+    assert cache.get_cached_response("Pergunta?")["fontes"] == ["art-8#caput"]
+    # o pai mudou: a resposta que usou o caput dele sai na invalidação
+    assert cache.store.invalidate(["art-8"]) == ["pergunta"]
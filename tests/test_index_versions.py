@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+pytest.importorskip("langchain")
+pytest.importorskip("faiss")
+pytest.importorskip("langchain_community.vectorstores")
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+from src.config.settings import Settings
+from src.pf_rag.embed_index import Indexer, current_index_dir
+from src.pf_rag.search import Searcher
+
+
+class _FakeEmbeddings(Embeddings):
+    def embed_query(self, text):
+        return [float(len(text)), float(text.count("a")), 1.0]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+
+def _db(textos):
+    return FAISS.from_texts(textos, _FakeEmbeddings(), metadatas=[{"anchor_id": f"a{i}"} for i in range(len(textos))])
+
+
+def test_save_publishes_whole_version_behind_pointer(tmp_path):
+    path = str(tmp_path / "faissDB")
+    # índice legado na raiz: carregado até a primeira versão publicada
+    _db(["antigo"]).save_local(path)
+    assert current_index_dir(path) == path
+    assert Indexer.load_faiss(path, _FakeEmbeddings()).similarity_search("x", k=1)[0].page_content == "antigo"
+
+    for rodada in range(3):
+        Indexer.save_faiss(_db([f"versão {rodada}", "prazo de posse"]), path)
+        pasta = current_index_dir(path)
+        assert {"index.faiss", "index.pkl", "chunks.sqlite", "bm25_docs.npy"} <= set(os.listdir(pasta))
+        db = Indexer.load_faiss(path, _FakeEmbeddings())
+        assert {d.page_content for d in db.docstore._dict.values()} == {f"versão {rodada}", "prazo de posse"}
+
+    # atual + anterior; par legado da raiz removido
+    assert len(os.listdir(os.path.join(path, "versions"))) == 2
+    assert not os.path.exists(os.path.join(path, "index.faiss"))
+
+
+NORMA = """PORTARIA Nº 1, DE 2 DE JANEIRO DE 2020
+
+Art. 1º São deveres do servidor:
+I - ser assíduo e pontual ao serviço;
+II - zelar pela economia do material.
+Art. 2º O servidor deve guardar sigilo:
+I - manter sigilo sobre assunto da repartição;
+II - cumprir as ordens superiores, exceto quando ilegais.
+Art. 3º O prazo para a posse será de trinta dias.
+"""
+
+
+def _db_real():
+    from src.pf_rag.chunker import build_chunks
+    from src.pf_rag.metadata_pf import extract
+    from src.pf_rag.parse_norma import detect_structure
+
+    nodes, heading = detect_structure(NORMA)
+    chunks = build_chunks(nodes, NORMA, extract(NORMA, heading, "p.pdf"), "p.pdf", [1])
+    metas = []
+    for ordem, ch in enumerate(chunks):
+        meta = {k: v for k, v in ch.__dict__.items() if k != "texto"}
+        meta["ordem"] = ordem
+        metas.append(meta)
+    return FAISS.from_texts([ch.texto for ch in chunks], _FakeEmbeddings(), metadatas=metas)
+
+
+def test_mmap_searcher_reads_chunks_and_bm25_from_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(Settings, "BM25_ENABLED", True)
+    path = str(tmp_path / "faissDB")
+    Indexer.save_faiss(_db_real(), path)
+    memoria = Indexer.load_faiss(path, _FakeEmbeddings())
+    mapeado = Indexer.load_faiss(path, _FakeEmbeddings(), mmap=True)
+    assert mapeado.chunk_store is not None and not hasattr(mapeado.docstore, "_dict")
+    with pytest.raises(ValueError):
+        mapeado.add_texts(["novo"])
+
+    a, b = Searcher(memoria), Searcher(mapeado)
+    assert b._docs == [] and b._by_anchor == {} and b._children == {}
+    assert [d.page_content for d in a.db.similarity_search("sigilo", k=3)] == \
+        [d.page_content for d in b.db.similarity_search("sigilo", k=3)]
+    for q in ("sigilo", "prazo posse", "servidor deve", "inexistente"):
+        assert [d.page_content for d in a.sparse(q, 5)] == [d.page_content for d in b.sparse(q, 5)]
+    assert [d.page_content for d in b.sparse("servidor", 5, {"nivel": "artigo"})] == \
+        [d.page_content for d in a.sparse("servidor", 5, {"nivel": "artigo"})]
+    inciso = next(d for d in a._docs if d.page_content.startswith("I - manter sigilo"))
+    assert [d.page_content for d in a.expand([inciso], budget=1000)] == \
+        [d.page_content for d in b.expand([inciso], budget=1000)]
+
+    if a.bm25 is not None:
+        tokens = "o servidor deve guardar sigilo sigilo".split()
+        assert (a.bm25.get_scores(tokens) == b.bm25.get_scores(tokens)).all()
@@ -0,0 +1,185 @@
+import pytest
+
+from src.pf_rag import io_pdf
+
+
+def test_split_pages_drops_trailing_form_feed():
+    assert io_pdf._split_pages("a\fb\fc\f") == ["a", "b", "c"]
+    assert io_pdf._split_pages("") == [""]
+
+
+def test_needs_ocr_detects_empty_and_garbage_pages():
+    texto = "Art. 1º Esta Portaria dispõe sobre procedimentos de teste da Polícia Federal."
+    assert not io_pdf._needs_ocr(texto)
+    assert io_pdf._needs_ocr("")
+    assert io_pdf._needs_ocr("  \n 12 \n")
+    assert io_pdf._needs_ocr("(cid:12)(cid:40)(cid:77) " * 20)
+    assert io_pdf._needs_ocr("Art. 1\ufffd \ufffd\ufffd\ufffd \ufffd\ufffd\ufffd\ufffd disp\ufffd\ufffd sobre")
+    # sumário com pontilhado e tabela numérica têm camada de texto legítima
+    assert not io_pdf._needs_ocr("SUMÁRIO\nCAPÍTULO I ........................ 3\nCAPÍTULO II ....................... 7")
+    assert not io_pdf._needs_ocr("2019 2020 2021\n1.234 5.678 9.012\n- - -\n% % %\n10,5 11,2 12,9")
+
+
+def test_ocr_replaces_text_only_when_clearly_better():
+    assert io_pdf._ocr_is_better("", "Anexo digitalizado")
+    assert io_pdf._ocr_is_better("(cid:12)(cid:40) " * 20, "Art. 1º Texto reconhecido")
+    # capa curta: OCR que só repete o título não substitui o pdfminer
+    assert not io_pdf._ocr_is_better("ANEXO I", "ANEX0 I")
+    assert io_pdf._ocr_is_better("12", "Art. 1º Texto da página digitalizada com carimbo 12")
+    assert not io_pdf._ocr_is_better("12", "   ")
+
+
+def test_extract_text_ocr_only_scanned_pages(monkeypatch, tmp_path):
+    pdf = tmp_path / "misto.pdf"
+    pdf.write_bytes(b"%PDF-1.4")
+    corpo = "Art. 1º Texto normativo suficientemente longo para a camada de texto."
+    monkeypatch.setattr(io_pdf.Settings, "DOCLING_ENABLED", False)
+    monkeypatch.setattr(io_pdf.Settings, "OCR_ENABLED", True)
+    monkeypatch.setattr(io_pdf, "pdf2image", object())
+    monkeypatch.setattr(io_pdf, "pytesseract", object())
+    monkeypatch.setattr(io_pdf, "_safe_pdfminer_extract", lambda path: f"{corpo}\f\f{corpo}\f")
+    pedidas = []
+
+    def fake_ocr(path, page_numbers):
+        pedidas.extend(page_numbers)
+        return {n: f"Anexo digitalizado {n}" for n in page_numbers}
+
+    monkeypatch.setattr(io_pdf, "_ocr_pages", fake_ocr)
+    text, pages, ocr = io_pdf.extract_text(str(pdf))
+    assert pedidas == [2]
+    assert ocr and [p.index for p in pages] == [1, 2, 3]
+    assert pages[1].text == "Anexo digitalizado 2"
+
+
+def test_docling_converter_reused_and_timeout_falls_back(monkeypatch, tmp_path):
+    import time
+
+    paths = []
+    for name in ("a.pdf", "lento.pdf", "c.pdf"):
+        f = tmp_path / name
+        f.write_bytes(b"%PDF-1.4")
+        paths.append(str(f))
+    created = []
+
+    class FakeConverter:
+        def __init__(self, cfg):
+            created.append(self)
+
+        def convert(self, path):
+            if path.endswith("lento.pdf"):
+                time.sleep(0.5)
+            return path
+
+    monkeypatch.setattr(io_pdf, "_CONVERTER", None)
+    monkeypatch.setattr(io_pdf, "DocumentConverter", FakeConverter)
+    monkeypatch.setattr(io_pdf, "ConverterConfig", lambda: None)
+    monkeypatch.setattr(io_pdf, "_page_count", lambda path: 1)
+    monkeypatch.setattr(io_pdf.Settings, "DOCLING_PAGE_TIMEOUT", 0.1)
+    out = list(io_pdf._docling_convert(paths))
+    assert [p for p, _ in out] == paths
+    assert [d for _, d in out] == [paths[0], None, paths[2]]
+    # um conversor para o lote; o preso no timeout é descartado e recriado uma vez
+    assert len(created) == 2
+
+
+def test_docling_timeout_counts_from_conversion_start(monkeypatch, tmp_path):
+    import time
+
+    paths = []
+    for name in ("a.pdf", "lento.pdf", "c.pdf", "d.pdf"):
+        f = tmp_path / name
+        f.write_bytes(b"%PDF-1.4")
+        paths.append(str(f))
+    iniciados = []
+
+    class FakeConverter:
+        def __init__(self, cfg):
+            pass
+
+        def convert(self, path):
+            iniciados.append(path)
+            time.sleep(0.5 if path.endswith("lento.pdf") else 0.01)
+            return path
+
+    monkeypatch.setattr(io_pdf, "_CONVERTER", None)
+    monkeypatch.setattr(io_pdf, "DocumentConverter", FakeConverter)
+    monkeypatch.setattr(io_pdf, "ConverterConfig", lambda: None)
+    monkeypatch.setattr(io_pdf, "_page_count", lambda path: 1)
+    monkeypatch.setattr(io_pdf.Settings, "DOCLING_PAGE_TIMEOUT", 0.3)
+    out = []
+    rapidos = [paths[0], paths[2], paths[3]]
+    for path, doc in io_pdf._docling_convert(rapidos):
+        out.append(doc)
+        # no máximo um documento convertido à frente do consumidor
+        assert len(iniciados) <= len(out) + 1
+        time.sleep(0.1)
+    assert out == rapidos
+
+    # consumidor lento: o documento lento começou enquanto o anterior era processado
+    iniciados.clear()
+    out = []
+    for path, doc in io_pdf._docling_convert(paths[:2]):
+        out.append(doc)
+        time.sleep(0.4)
+    assert out == [paths[0], None]
+
+
+def _fake_pdfminer(path, page_numbers=None):
+    pages = page_numbers if page_numbers is not None else range(40)
+    return "".join(f"Página {i + 1}\nArt. {i}º texto.\f" for i in pages)
+
+
+def test_parallel_pdfminer_matches_sequential(monkeypatch):
+    monkeypatch.setattr(io_pdf, "pdfminer_extract_text", _fake_pdfminer)
+    monkeypatch.setattr(io_pdf, "_pdfminer_page_count", lambda path: 40)
+    monkeypatch.setattr(io_pdf.Settings, "PDFMINER_WORKERS", 3)
+    monkeypatch.setattr(io_pdf.Settings, "PDFMINER_PARALLEL_MIN_PAGES", 0)
+    sequencial = io_pdf._safe_pdfminer_extract("manual.pdf")
+    monkeypatch.setattr(io_pdf.Settings, "PDFMINER_PARALLEL_MIN_PAGES", 10)
+    assert io_pdf._pdfminer_parallel("manual.pdf", 40) == sequencial
+    assert io_pdf._safe_pdfminer_extract("manual.pdf") == sequencial
+
+
+def _write_pdf(path, paginas):
+    """PDF mínimo válido (Helvetica, uma página por texto), sem dependências"""
+    objetos = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for linhas in paginas:
+        fluxo = "BT /F1 11 Tf 72 760 Td 14 TL " + " ".join(
+            "(" + l.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") '" for l in linhas
+        ) + " ET"
+        conteudo = fluxo.encode("cp1252")
+        objetos.append(b"<< /Length %d >>\nstream\n" % len(conteudo) + conteudo + b"\nendstream")
+        objetos.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objetos)} 0 R >>")
+        kids.append(f"{len(objetos)} 0 R")
+    objetos[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    saida = bytearray(b"%PDF-1.4\n")
+    posicoes = []
+    for i, obj in enumerate(objetos, start=1):
+        posicoes.append(len(saida))
+        corpo = obj if isinstance(obj, bytes) else obj.encode("latin-1")
+        saida += b"%d 0 obj\n" % i + corpo + b"\nendobj\n"
+    xref = len(saida)
+    saida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    saida += b"".join(b"%010d 00000 n \n" % p for p in posicoes)
+    saida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, xref)
+    path.write_bytes(bytes(saida))
+
+
+def test_parallel_pdfminer_is_byte_identical_on_real_pdf(monkeypatch, tmp_path):
+    pytest.importorskip("pdfminer")
+    pdf = tmp_path / "manual.pdf"
+    _write_pdf(pdf, [[f"Art. {i}º Compete à unidade gestora registrar o ato nº {i}.",
+                      "Parágrafo único. O disposto neste artigo aplica-se às férias.",
+                      f"Página {i} de 40"] for i in range(1, 41)])
+    monkeypatch.setattr(io_pdf.Settings, "PDFMINER_WORKERS", 3)
+    monkeypatch.setattr(io_pdf.Settings, "PDFMINER_PARALLEL_MIN_PAGES", 0)
+    sequencial = io_pdf._safe_pdfminer_extract(str(pdf))
+    assert "Art. 40º Compete à unidade gestora" in sequencial and sequencial.count("\f") == 40
+
+    monkeypatch.setattr(io_pdf.Settings, "PDFMINER_PARALLEL_MIN_PAGES", 10)
+    assert io_pdf._pdfminer_page_count(str(pdf)) == 40
+    assert io_pdf._pdfminer_parallel(str(pdf), 40) == sequencial
+    assert io_pdf._safe_pdfminer_extract(str(pdf)) == sequencial
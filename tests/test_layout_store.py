@@ -0,0 +1,80 @@
+import shutil
+
+from src.pf_rag.layout_store import LayoutStore, content_hash
+
+
+def _extras(n_blocks=1):
+    blocks = [{"type": "table", "text": "a\tb", "bbox": [0.0, 0.0, 1.0, 1.0], "page_no": 1, "start": 0, "end": 3}] * n_blocks
+    return {"layout_blocks": {1: blocks, 2: []}}
+
+
+def test_roundtrip_keeps_int_page_keys(tmp_path):
+    store = LayoutStore(str(tmp_path / "layout.sqlite"))
+    store.put("abc", _extras())
+    got = store.get("abc")
+    assert set(got["layout_blocks"].keys()) == {1, 2}
+    assert got["layout_blocks"][1][0]["type"] == "table"
+    assert store.get("inexistente") == {}
+
+
+def test_lookup_by_content_not_by_path(tmp_path):
+    pdf = tmp_path / "SGP" / "portaria.pdf"
+    pdf.parent.mkdir()
+    pdf.write_bytes(b"%PDF-1.4 conteudo")
+    copia = tmp_path / "portaria-copia.pdf"
+    shutil.copy(pdf, copia)
+    assert content_hash(str(pdf)) == content_hash(str(copia))
+
+    store = LayoutStore(str(tmp_path / "layout.sqlite"))
+    store.put_for_path(str(pdf), _extras())
+    assert store.get_for_path(str(copia))["layout_blocks"][1]
+    # outra instância (ex.: outro processo) enxerga o mesmo conteúdo
+    assert LayoutStore(str(tmp_path / "layout.sqlite")).get_for_path(str(pdf))
+
+
+def test_size_bound_evicts_oldest_written(tmp_path):
+    store = LayoutStore(str(tmp_path / "layout.sqlite"), max_bytes=1)
+    store.put("velho", _extras(50))
+    store.put("novo", _extras(50))
+    assert len(store) == 1
+    assert store.get("novo") and store.get("velho") == {}
+
+
+def test_hash_memo_is_bounded(tmp_path, monkeypatch):
+    from src.pf_rag import layout_store
+
+    monkeypatch.setattr(layout_store, "_HASH_MEMO", {})
+    monkeypatch.setattr(layout_store, "_HASH_MEMO_MAX", 3)
+    for i in range(5):
+        pdf = tmp_path / f"{i}.pdf"
+        pdf.write_bytes(b"%PDF-1.4 " + bytes([i]))
+        content_hash(str(pdf))
+    assert list(layout_store._HASH_MEMO) == [str(tmp_path / f"{i}.pdf") for i in (2, 3, 4)]
+
+
+def test_reads_are_read_only_and_skipped_without_docling(tmp_path, monkeypatch):
+    from src.pf_rag import io_pdf, layout_store
+
+    db = tmp_path / "layout.sqlite"
+    store = LayoutStore(str(db))
+    assert store.get("abc") == {} and not db.exists()
+    store.put("abc", _extras())
+    antes = db.stat().st_mtime_ns
+    assert store.get("abc")["layout_blocks"][1]
+    assert db.stat().st_mtime_ns == antes
+
+    # pasta própria da CLI: o chunker recebe o caminho real, não só o nome do arquivo
+    pdf = tmp_path / "outra" / "portaria.pdf"
+    pdf.parent.mkdir()
+    pdf.write_bytes(b"%PDF-1.4 conteudo")
+    store.put_for_path(str(pdf), _extras())
+    monkeypatch.setattr(layout_store, "_STORE", store)
+    monkeypatch.setattr(io_pdf.Settings, "DOCLING_ENABLED", True)
+    assert io_pdf.get_layout_extras(str(pdf))["layout_blocks"][1]
+
+    def sem_hash(path):
+        raise AssertionError(f"PDF lido sem Docling: {path}")
+
+    monkeypatch.setattr(io_pdf.Settings, "DOCLING_ENABLED", False)
+    monkeypatch.setattr(layout_store, "content_hash", sem_hash)
+    assert io_pdf.get_layout_extras(str(pdf)) == {}
@@ -0,0 +1,52 @@
+from src.pf_rag.types import PDFPage
+from src.pf_rag.normalize import clean_text, clean_text_with_offsets
+
+
+def _pages():
+    corpo = [
+        "Art. 1º Esta Portaria dispõe sobre a dispo-\nsição de bens.",
+        "Art. 2º Compete à unidade   gestora\tregistrar.",
+        "Art. 3º Revogam-se as disposições em contrário.",
+    ]
+    pages = []
+    for i, txt in enumerate(corpo, start=1):
+        pages.append(PDFPage(index=i, text=f"MINISTÉRIO DA JUSTIÇA\nBoletim de Serviço nº {100 + i}\n{txt}\nPágina {i} de 3\n"))
+    return pages
+
+
+def test_remove_headers_footers_with_varying_numbers():
+    text, pages2 = clean_text("", _pages())
+    assert "MINISTÉRIO DA JUSTIÇA" not in text
+    assert "Boletim de Serviço" not in text
+    assert "Página" not in text
+    assert "Art. 2º" in text and len(pages2) == 3
+
+
+def test_hyphenation_and_spaces():
+    text, _ = clean_text("", _pages())
+    assert "disposição de bens" in text
+    assert "unidade gestora registrar" in text
+
+
+def test_structural_lines_are_kept():
+    pages = [PDFPage(index=i, text=f"CAPÍTULO I\nArt. {i}º Texto do artigo {i}.") for i in range(1, 5)]
+    text, _ = clean_text("", pages)
+    assert text.count("CAPÍTULO I") == 4
+
+
+def test_short_documents_keep_lines_repeated_on_two_pages():
+    pages = [PDFPage(index=i, text=f"DAS DISPOSIÇÕES GERAIS\nArt. {i}º Texto do artigo {i}.") for i in (1, 2)]
+    text, _ = clean_text("", pages)
+    assert text.count("DAS DISPOSIÇÕES GERAIS") == 2
+
+
+def test_offset_map_points_back_to_raw_pages():
+    pages = _pages()
+    text, _, offsets = clean_text_with_offsets("", pages)
+    for needle in ("Art. 1º", "Art. 2º", "Art. 3º"):
+        pos = text.index(needle)
+        page, raw = offsets.locate(pos)
+        raw_text = pages[page - 1].text
+        assert raw_text[raw:raw + len(needle)] == needle
+    art3 = text.index("Art. 3º")
+    assert offsets.pages_between(0, art3 + 1) == [1, 2, 3]
@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+from src.services.ollama_client import OllamaTransport
+
+
+class _StubOllama(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        self._send(200, {"models": []})
+
+    def do_POST(self):
+        self.server.connections.add(self.client_address)
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.batches.append(payload["input"])
+        if self.server.fail_next > 0:
+            self.server.fail_next -= 1
+            self._send(503, {"error": "loading model"})
+            return
+        self._send(200, {"embeddings": [[float(len(t)), 1.0] for t in payload["input"]]})
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubOllama)
+    server.connections, server.batches, server.fail_next = set(), [], 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _transport(server, **kw):
+    return OllamaTransport(base_url=f"http://127.0.0.1:{server.server_port}", backoff=0.01, **kw)
+
+
+def test_embed_batches_inputs_and_keeps_order(stub):
+    transport = _transport(stub, max_concurrency=1)
+    texts = ["x" * i for i in range(1, 11)]
+    vectors = transport.embed(texts, model="m", batch_size=4)
+    assert [v[0] for v in vectors] == [float(i) for i in range(1, 11)]
+    assert [len(b) for b in stub.batches] == [4, 4, 2]
+    # keep-alive: todas as requisições na mesma conexão
+    assert len(stub.connections) == 1
+
+
+def test_concurrent_batches_preserve_order(stub):
+    transport = _transport(stub, max_concurrency=4)
+    texts = ["y" * i for i in range(1, 33)]
+    vectors = transport.embed(texts, model="m", batch_size=3)
+    assert [v[0] for v in vectors] == [float(i) for i in range(1, 33)]
+    assert len(stub.connections) <= 4
+
+
+def test_retries_transient_errors(stub):
+    stub.fail_next = 2
+    transport = _transport(stub, max_concurrency=1, retries=3)
+    assert transport.embed(["abc"], model="m") == [[3.0, 1.0]]
+    assert len(stub.batches) == 3
+    stub.fail_next = 5
+    with pytest.raises(Exception, match="503"):
+        _transport(stub, max_concurrency=1, retries=1).embed(["abc"], model="m")
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requer os.fork")
+def test_forked_worker_gets_its_own_session():
+    pytest.importorskip("langchain")
+    from src.pf_rag.embed_index import OllamaPooledEmbeddings
+    from src.services.ollama_client import get_transport, reset_transport
+
+    emb = OllamaPooledEmbeddings()
+    pai = emb.transport._session
+    assert get_transport()._session is pai
+    leitura, escrita = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            reset_transport()
+            os.write(escrita, str(emb.transport._session is not pai).encode())
+        finally:
+            os._exit(0)
+    os.close(escrita)
+    resposta = os.read(leitura, 16).decode()
+    os.close(leitura)
+    os.waitpid(pid, 0)
+    assert resposta == "True"
+    assert emb.transport._session is pai
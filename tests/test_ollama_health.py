@@ -0,0 +1,43 @@
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+
+from src.services.ollama_service import CONNECTION_ERRORS, CircuitBreaker, OllamaHealthMonitor, OllamaService
+
+
+def test_breaker_opens_after_failures_and_recovers():
+    breaker = CircuitBreaker(max_failures=2, cooldown=0.05)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    time.sleep(0.06)
+    # meio-aberto: uma única tentativa por vez
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_non_connection_errors_do_not_open():
+    assert OllamaService.classify_error(ConnectionError("[Errno 111] Connection refused")) in CONNECTION_ERRORS
+    assert OllamaService.classify_error(ValueError("prompt inválido")) not in CONNECTION_ERRORS
+
+
+def test_monitor_serves_cached_status_without_probing():
+    calls = []
+
+    def checker():
+        calls.append(1)
+        return True, "OK"
+
+    monitor = OllamaHealthMonitor(interval=60, ttl=0.05, checker=checker)
+    assert monitor.refresh() == (True, "OK")
+    for _ in range(10):
+        assert monitor.is_healthy()
+    assert len(calls) == 1
+    monitor.report(False, "CONNECTION_REFUSED")
+    assert monitor.status() == (False, "CONNECTION_REFUSED")
+    time.sleep(0.06)
+    assert monitor.status() == (False, "STALE")
@@ -0,0 +1,213 @@
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import urllib.error
+import urllib.request
+from types import SimpleNamespace
+
+import pytest
+
+from src.config.settings import Settings
+from src.core.async_rag_service import AsyncRAGService
+from src.core.query_client import QueryClient
+from src.core.query_server import QueryServer, serve
+from src.pf_rag.search import Searcher
+from src.utils.index_generation import IndexGeneration
+
+
+class _FakeDB:
+    def similarity_search(self, q, k=4, filter=None):
+        return [SimpleNamespace(page_content="prazo de posse", metadata={"anchor_id": "a1", "nivel": "artigo"})]
+
+
+class _FakeLLM:
+    async def ainvoke(self, prompt, config=None):
+        return "resposta"
+
+    async def astream(self, prompt, config=None):
+        for parte in ("res", "posta"):
+            await asyncio.sleep(0)
+            yield parte
+
+
+class _FakeService:
+    def __init__(self):
+        self.llm = _FakeLLM()
+        self.searcher = Searcher(_FakeDB())
+        self.cache = SimpleNamespace(save_response=lambda *a, **k: None)
+        self.health = SimpleNamespace(status=lambda: (True, "OK"))
+        self.reloads = 0
+
+    def reload_database(self, generation=0):
+        self.reloads += 1
+        self.searcher = Searcher(_FakeDB(), generation=generation)
+        return True
+
+    def _cached_answer(self, pergunta):
+        return None
+
+    def _circuit_allows(self):
+        return True
+
+    def _record_success(self):
+        pass
+
+    def _record_error(self, e):
+        raise AssertionError(e)
+
+    def _record_timeout(self):
+        pass
+
+    def _release_probe(self):
+        pass
+
+    def _build_prompt(self, pergunta, docs):
+        return pergunta
+
+    @staticmethod
+    def _fontes(docs):
+        return []
+
+
+def test_client_round_trip(tmp_path):
+    service = _FakeService()
+    server = QueryServer(AsyncRAGService(service, timeout=5), "127.0.0.1", 0,
+                         generation=IndexGeneration(str(tmp_path / "g.sqlite")))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = QueryClient(f"http://127.0.0.1:{server.server_address[1]}", timeout=5)
+        assert client.health()["geracao"] == 0
+
+        (doc, score), = client.search("prazo", top_k=1)
+        assert doc.metadata["anchor_id"] == "a1" and score > 0
+
+        assert client.answer_question("prazo") == "resposta"
+
+        sources, stats = [], {}
+        assert "".join(client.stream_answer("prazo", sources=sources, stats=stats)) == "resposta"
+        assert sources[0].page_content == "prazo de posse"
+        assert stats["chunks"] == 2 and stats["total_s"] >= stats["ttft_s"]
+
+        assert client.reload()["reloaded"] and service.reloads == 1
+
+        (doc, _), = client.search("prazo", top_k="1")
+        for corpo in ({"q": "prazo", "top_k": "abc"}, {"q": "prazo", "top_k": 0},
+                      {"q": "prazo", "top_k": 1.5}, {"q": "prazo", "timeout": -1}, {"q": "prazo", "filters": []}):
+            pedido = urllib.request.Request(f"{client.url}/search", data=json.dumps(corpo).encode("utf-8"),
+                                            headers={"Content-Type": "application/json"})
+            with pytest.raises(urllib.error.HTTPError) as erro:
+                urllib.request.urlopen(pedido, timeout=5)
+            assert erro.value.code == 400
+
+        with urllib.request.urlopen(f"{client.url}/metrics", timeout=5) as resp:
+            texto = resp.read().decode("utf-8")
+        assert resp.headers["Content-Type"].startswith("text/plain")
+        assert 'pf_rag_requests_total{endpoint="/answer"}' in texto
+        assert 'pf_rag_stage_seconds_count{stage="query.dense"}' in texto
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class _FailingLLM(_FakeLLM):
+    async def astream(self, prompt, config=None):
+        yield "res"
+        raise ConnectionError("Connection refused")
+
+
+def test_stream_error_reaches_client(tmp_path):
+    service = _FakeService()
+    service.llm = _FailingLLM()
+    service._record_error = lambda e: "CONNECTION_REFUSED"
+    server = QueryServer(AsyncRAGService(service, timeout=5), "127.0.0.1", 0,
+                         generation=IndexGeneration(str(tmp_path / "g.sqlite")))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = QueryClient(f"http://127.0.0.1:{server.server_address[1]}", timeout=5)
+        stats = {}
+        # resposta truncada chega marcada, não como se estivesse completa
+        assert "".join(client.stream_answer("prazo", stats=stats)) == "res"
+        assert stats["error"] == "CONNECTION_REFUSED"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_generation_switch_reloads(tmp_path):
+    generation = IndexGeneration(str(tmp_path / "g.sqlite"))
+    service = _FakeService()
+    service.reload_database = lambda: _FakeService.reload_database(service, generation.current())
+    server = QueryServer(AsyncRAGService(service), "127.0.0.1", 0, generation=generation)
+    try:
+        assert not server.check_generation()
+        generation.advance([SimpleNamespace(anchor_id="a1", doc_id="d", hash_conteudo="h")])
+        assert server.check_generation() and service.searcher.generation == 1
+        assert not server.check_generation() and service.reloads == 1
+    finally:
+        server.server_close()
+
+
+def test_unavailable_server():
+    assert not QueryClient("http://127.0.0.1:9").available()
+    assert not QueryClient("").available()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requer os.fork")
+def test_prefork_parent_starts_no_background_threads(tmp_path, monkeypatch):
+    criados = []
+
+    class _Servico(_FakeService):
+        def __init__(self, prefork=False):
+            super().__init__()
+            criados.append(prefork)
+
+    monkeypatch.setitem(sys.modules, "src.core.rag_service", SimpleNamespace(RAGService=_Servico))
+    monkeypatch.setattr(Settings, "INDEX_GENERATION_PATH", str(tmp_path / "g.sqlite"))
+    monkeypatch.setattr(Settings, "VECTOR_DB_BACKEND", "faiss")
+    monkeypatch.setattr("src.core.query_server._serve_prefork", lambda server, workers: server.server_close())
+    monkeypatch.setattr(QueryServer, "serve_forever", lambda self, *a: None)
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        porta = s.getsockname()[1]
+
+    serve("127.0.0.1", porta, workers=2)
+    serve("127.0.0.1", porta, workers=1)
+    # workers: aquecimento síncrono e monitor de saúde só após o fork
+    assert criados == [True, False]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requer os.fork")
+def test_sigterm_on_parent_stops_workers(tmp_path, monkeypatch):
+    import signal
+    import time
+
+    from src.core.query_server import _serve_prefork
+
+    monkeypatch.setattr(Settings, "METRICS_DIR", str(tmp_path / "metricas"))
+
+    def _atende(*a):
+        (tmp_path / f"w{os.getpid()}").touch()
+        time.sleep(60)
+
+    servidor = SimpleNamespace(rag=SimpleNamespace(service=SimpleNamespace(after_fork=lambda: None)),
+                               generation=SimpleNamespace(reset_connections=lambda: None),
+                               serve_forever=_atende, server_close=lambda: None)
+    pai = os.fork()
+    if pai == 0:
+        try:
+            _serve_prefork(servidor, 2)
+        finally:
+            os._exit(0)
+    prazo = time.time() + 10
+    while len(list(tmp_path.glob("w*"))) < 2 and time.time() < prazo:
+        time.sleep(0.05)
+    workers = [int(p.name[1:]) for p in tmp_path.glob("w*")]
+    assert len(workers) == 2
+    os.kill(pai, signal.SIGTERM)
+    os.waitpid(pai, 0)
+    for pid in workers:
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
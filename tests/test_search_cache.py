@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+from src.pf_rag.retrieval_cache import RetrievalCache
+from src.pf_rag.search import Searcher
+
+
+class _FakeDB:
+    def __init__(self, docs):
+        self.docs = docs
+        self.calls = []
+
+    def similarity_search(self, q, k=4, filter=None):
+        self.calls.append((q, k, filter))
+        out = [d for d in self.docs if not filter or all(d.metadata.get(a) == b for a, b in filter.items())]
+        return out[:k]
+
+
+def _doc(anchor, texto, doc_id="d1", breadcrumb=""):
+    return SimpleNamespace(page_content=texto, metadata={"anchor_id": anchor, "doc_id": doc_id, "breadcrumb": breadcrumb})
+
+
+def test_repeated_query_is_served_from_cache():
+    db = _FakeDB([_doc("a1", "prazo de posse"), _doc("a2", "férias", breadcrumb="art. 5")])
+    cache = RetrievalCache(max_size=8)
+    searcher = Searcher(db, cache=cache, generation=3)
+    first = searcher.search("Qual o prazo do Art. 5?", top_k=2)
+    again = Searcher(db, cache=cache, generation=3).query("qual o prazo do art. 5", top_k=2)
+    assert len(db.calls) == 1 and cache.hits == 1
+    assert [d.metadata["anchor_id"] for d in again] == [d.metadata["anchor_id"] for d, _ in first]
+    # breadcrumb com "art." casa com a pergunta: sobe no ranking
+    assert again[0].metadata["anchor_id"] == "a2"
+
+
+def test_key_includes_top_k_filters_and_generation():
+    db = _FakeDB([_doc("a1", "x"), _doc("b1", "y", doc_id="d2")])
+    cache = RetrievalCache()
+    Searcher(db, cache=cache, generation=1).search("x", top_k=2)
+    Searcher(db, cache=cache, generation=1).search("x", top_k=1)
+    Searcher(db, cache=cache, generation=2).search("x", top_k=2)
+    res = Searcher(db, cache=cache, generation=2).search("x", top_k=2, filters={"doc_id": "d2"})
+    assert len(db.calls) == 4 and cache.hits == 0
+    assert [d.metadata["anchor_id"] for d, _ in res] == ["b1"]
+
+
+def test_label_bonus_stays_within_rrf_range():
+    both = _doc("a1", "prazo de posse")
+    rotulado = _doc("a2", "férias", breadcrumb="art. 5 § 1º")
+    searcher = Searcher(_FakeDB([]))
+    # a1 lidera as duas listas; a2 só aparece em 1º na densa, mas casa "art." e "§"
+    resultado = searcher.fuse("art. 5 § 1º prazo", [rotulado, both], [both], top_k=2)
+    assert [d.metadata["anchor_id"] for d, _ in resultado] == ["a1", "a2"]
+    assert all(score < 3.0 / 61 for _, score in resultado)
+
+
+def test_sparse_partial_selection_matches_full_sort():
+    import random
+
+    rng = random.Random(7)
+    docs = [_doc(f"a{i}", "x", doc_id=f"d{i % 3}") for i in range(200)]
+    # scores com empates e zeros
+    scores = [float(rng.choice([0, 0, 1, 2, 2, 3, 5])) for _ in docs]
+    searcher = Searcher(_FakeDB([]))
+    searcher._docs = docs
+    searcher.bm25 = SimpleNamespace(get_scores=lambda tokens: scores)
+
+    def completo(n, filters=None):
+        ordem = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        out = [docs[i] for i in ordem if scores[i] > 0 and (not filters or docs[i].metadata["doc_id"] == filters["doc_id"])]
+        return out[:n]
+
+    for n in (1, 5, 17, 500):
+        assert searcher.sparse("q", n) == completo(n)
+        assert searcher.sparse("q", n, {"doc_id": "d2"}) == completo(n, {"doc_id": "d2"})
+    assert searcher.sparse("q", 5, {"doc_id": "nenhum"}) == []
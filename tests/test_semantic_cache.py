@@ -0,0 +1,48 @@
+import re
+
+from src.utils.semantic_cache import SemanticAnswerCache, citation_signature
+
+_STOP = {"o", "a", "é", "do", "da", "no", "na", "de", "previsto", "qual"}
+
+
+class _BagOfWords:
+    """Embeddings de brinquedo: vocabulário fixo, contagem de termos."""
+    vocab = ["prazo", "art", "recurso", "férias", "5", "6", "servidor", "posse"]
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        toks = [t for t in re.findall(r"\w+", text.lower()) if t not in _STOP]
+        return [float(toks.count(v)) + 0.01 for v in self.vocab]
+
+
+def test_signature_distinguishes_citations():
+    assert citation_signature("Qual o prazo do art. 5?") == citation_signature("qual é o prazo previsto no artigo 5")
+    assert citation_signature("prazo do art. 5") != citation_signature("prazo do art. 6")
+    assert citation_signature("art. 5, § 2º") != citation_signature("art. 2, § 5º")
+    assert "inc:IV" in citation_signature("o que diz o inciso IV")
+
+
+def test_paraphrase_hits_but_other_article_does_not():
+    emb = _BagOfWords()
+    cache = SemanticAnswerCache(emb, threshold=0.9)
+    cache.add("qual o prazo do art 5", "Qual o prazo do art. 5?")
+    assert cache.lookup("k1", "qual é o prazo previsto no art. 5")[0] == "qual o prazo do art 5"
+    # vetor próximo, mas citação diferente
+    assert cache.lookup("k2", "qual o prazo do art. 6") is None
+    assert cache.lookup("k3", "férias do servidor") is None
+
+
+def test_eviction_and_reuse_of_recent_vectors():
+    emb = _BagOfWords()
+    cache = SemanticAnswerCache(emb, threshold=0.9, max_entries=2)
+    cache.lookup("p", "prazo do recurso")  # índice vazio: nada a embedar
+    for i, q in enumerate(["prazo do recurso", "posse do servidor", "férias do servidor"]):
+        cache.add(f"q{i}", q)
+    assert len(cache) == 2
+    calls = emb.calls
+    cache.add("q2", "férias do servidor")
+    assert emb.calls == calls
+    assert cache.lookup("x", "prazo do recurso") is None
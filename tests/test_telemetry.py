@@ -0,0 +1,94 @@
+import json
+import os
+
+import pytest
+
+from src.config.settings import Settings
+from src.utils import telemetry
+from src.utils.telemetry import (Metrics, cache_result, enable_multiprocess, exposition, metrics, multiprocess_dir,
+                                 record, reset_after_fork, span)
+
+
+@pytest.fixture(autouse=True)
+def _trace_log_fechado():
+    # o handler do log de spans aponta para o tmp_path do teste: fecha e esquece o destino
+    yield
+    for h in list(telemetry._logger.handlers):
+        telemetry._logger.removeHandler(h)
+        h.close()
+    telemetry._logger_destino = None
+
+
+def test_spans_nest_and_log_json(tmp_path, monkeypatch):
+    log = tmp_path / "trace" / "spans.jsonl"
+    monkeypatch.setattr(Settings, "TRACE_LOG", str(log))
+    metrics.reset()
+
+    with span("ingest", arquivos=1):
+        with span("ingest.chunk", arquivo="in.pdf") as etapa:
+            etapa.set(chunks=3)
+        record("ingest.embed", 0.2, chunks=3)
+    with pytest.raises(ValueError):
+        with span("ingest.upsert"):
+            raise ValueError("falha")
+
+    chunk, embed, raiz, upsert = [json.loads(l) for l in log.read_text(encoding="utf-8").splitlines()]
+    assert raiz["span"] == "ingest" and raiz["parent_id"] is None
+    assert chunk["parent_id"] == embed["parent_id"] == raiz["span_id"]
+    assert chunk["trace_id"] == embed["trace_id"] == raiz["trace_id"] != upsert["trace_id"]
+    assert chunk["attrs"] == {"arquivo": "in.pdf", "chunks": 3} and embed["dur_s"] == 0.2
+    assert upsert["erro"] == "ValueError"
+    assert {nome for nome, _, _ in metrics.stages("ingest.")} == {"ingest.chunk", "ingest.embed", "ingest.upsert"}
+
+
+def test_prometheus_text_format(monkeypatch):
+    registro = Metrics()
+    monkeypatch.setattr("src.utils.telemetry.metrics", registro)
+    cache_result("embed", True)
+    cache_result("embed", True)
+    registro.inc("pf_rag_tokens_total", 900, kind="prompt")
+    for s in (0.003, 0.2, 1000.0):
+        registro.observe("pf_rag_stage_seconds", s, stage='query."dense"')
+
+    texto = registro.prometheus()
+    assert "# TYPE pf_rag_cache_hits_total counter" in texto
+    assert 'pf_rag_cache_hits_total{cache="embed"} 2' in texto
+    assert 'pf_rag_tokens_total{kind="prompt"} 900' in texto
+    assert "# TYPE pf_rag_stage_seconds histogram" in texto
+    assert 'pf_rag_stage_seconds_bucket{stage="query.\\"dense\\"",le="0.005"} 1' in texto
+    assert 'pf_rag_stage_seconds_bucket{stage="query.\\"dense\\"",le="300"} 2' in texto
+    assert 'pf_rag_stage_seconds_bucket{stage="query.\\"dense\\"",le="+Inf"} 3' in texto
+    assert 'pf_rag_stage_seconds_count{stage="query.\\"dense\\""} 3' in texto
+
+    monkeypatch.setattr(Settings, "METRICS_ENABLED", False)
+    registro.inc("pf_rag_tokens_total", 1, kind="prompt")
+    assert registro.counter("pf_rag_tokens_total", kind="prompt") == 900
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requer os.fork")
+def test_worker_metrics_are_summed_whichever_worker_answers(tmp_path, monkeypatch):
+    monkeypatch.setattr(telemetry, "_multiprocess_dir", None)
+    metrics.reset()
+    metrics.inc("pf_rag_chunks_total", 10, stage="indexed")  # carga no pai, antes do fork
+    enable_multiprocess(str(tmp_path))
+    filhos = []
+    for n in (1, 2):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                reset_after_fork()
+                metrics.inc("pf_rag_requests_total", n, endpoint="/search")
+                metrics.observe("pf_rag_stage_seconds", 0.003, stage="query.dense")
+                metrics.dump(multiprocess_dir())
+            finally:
+                os._exit(0)
+        filhos.append(pid)
+    for pid in filhos:
+        os.waitpid(pid, 0)
+
+    texto = exposition()
+    assert 'pf_rag_requests_total{endpoint="/search"} 3' in texto
+    assert 'pf_rag_chunks_total{stage="indexed"} 10' in texto
+    assert 'pf_rag_stage_seconds_count{stage="query.dense"} 2' in texto
+    assert texto.count("pf_rag_process_info{") == 3
+    metrics.reset()
@@ -20,21 +20,13 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ROOT = os.path.dirname(BASE_DIR)
 sys.path.append(os.path.join(ROOT, "src"))
 
-from src.core.rag_service import RAGService
-from src.services.ollama_service import OllamaService
-from src.pf_rag.search import Searcher
-from src.pf_rag.cli import ingest_index
-from src.pf_rag.embed_index import Indexer
-from src.vector_backends.qdrant_backend import QdrantIndexer
+from src.core.query_client import get_query_client
+from src.services.ollama_service import get_health_monitor
 from src.utils.file_utils import FileUtils
 from src.config.settings import Settings
-from src.pf_rag.io_pdf import extract_text
-from src.pf_rag.normalize import clean_text
-from src.pf_rag.parse_norma import detect_structure
-from src.pf_rag.metadata_pf import extract as meta_extract
-from src.pf_rag.chunker import build_chunks
-from src.pf_rag.export_jsonl import export_chunks_jsonl
 from src.utils.ingest_manifest import diff_current_vs_manifest, save_manifest
+# RAGService (embeddings/índice) e a pilha de ingestão (pdfminer, Docling, OCR, Qdrant)
+# são importados no primeiro uso: com o servidor de consultas no ar a UI não os carrega
 
 st.set_page_config(page_title="Sistema RAG-PF", page_icon="🛡️", layout="wide")
 
@@ -43,6 +35,7 @@ def safe_extract_text(pdf_path: str):
     """Extrai texto de PDF suprimindo warnings de cores inválidas"""
     import io
     import contextlib
+    from src.pf_rag.io_pdf import extract_text
 
     with contextlib.redirect_stderr(io.StringIO()):
         with warnings.catch_warnings():
@@ -51,16 +44,19 @@ def safe_extract_text(pdf_path: str):
 
 # Cached singletons
 @st.cache_resource(show_spinner=False)
-def get_service() -> RAGService:
+def get_service():
+    from src.core.rag_service import RAGService
     return RAGService()
 
-@st.cache_resource(show_spinner=False)
+@st.cache_resource(show_spinner=False, ttl=30)
+def get_remote():
+    """Cliente do servidor de consultas (índice já aquecido em outro processo), se estiver no ar"""
+    return get_query_client()
+
 def get_searcher():
-    """Get searcher instance with database"""
+    """Searcher do serviço (mesmo índice BM25 e cache de resultados da cadeia de resposta)"""
     service = get_service()
-    if service and hasattr(service, 'document_service') and service.document_service.database:
-        return Searcher(service.document_service.database)
-    return None
+    return getattr(service, 'searcher', None) if service else None
 
 def get_service_with_progress():
     """Initialize service with progress bar if needed"""
@@ -703,8 +699,12 @@ if st.session_state.current_route == 'points':
     render_points_browser()
     st.stop()  # Para não continuar com o resto da interface
 
-# Connectivity status
-connected, err = OllamaService.check_connection()
+# Connectivity status (cached by the background health monitor; probes only when unknown/stale)
+health = get_health_monitor()
+connected, err = health.status()
+if err in ("NOT_CHECKED", "STALE"):
+    connected, err = health.refresh()
+    health.start()
 status_col1, status_col2 = st.columns([1, 3])
 with status_col1:
     st.markdown("**Ollama:** " + ("✅ online (local)" if connected else "❌ offline"))
@@ -758,12 +758,16 @@ with st.sidebar:
     # Botão de reindexação
     reindex = st.button("Reindexar base (ingestão)")
 
-# Initialize service
-try:
-    service = get_service_with_progress()
-except SystemExit:
-    st.error("Falha na inicialização do serviço. Verifique os logs.")
-    st.stop()
+# Initialize service: com o servidor de consultas no ar a página é cliente fino
+remote = get_remote()
+service = None
+if remote is None:
+    try:
+        service = get_service_with_progress()
+    except SystemExit:
+        st.error("Falha na inicialização do serviço. Verifique os logs.")
+        st.stop()
+engine = remote or service
 
 # Reindex handling
 if 'did_reindex' not in st.session_state:
@@ -783,6 +787,14 @@ if reindex:
         else:
             # Caminhos: full rebuild se houver removidos ou modificados; incremental se apenas adicionados
             do_full = bool(removed or modified)
+            from src.pf_rag.embed_index import Indexer
+            from src.vector_backends.qdrant_backend import QdrantIndexer
+            from src.pf_rag.normalize import clean_text_with_offsets
+            from src.pf_rag.parse_norma import detect_structure
+            from src.pf_rag.metadata_pf import extract as meta_extract
+            from src.pf_rag.chunker import build_chunks
+            from src.pf_rag.export_jsonl import export_chunks_jsonl
+
             use_qdrant = str(Settings.VECTOR_DB_BACKEND).lower().startswith("qdrant")
             indexer = Indexer()
             qindex = QdrantIndexer() if use_qdrant else None
@@ -796,16 +808,18 @@ if reindex:
                     status.markdown(f"Processando `{os.path.basename(pdf)}` ({idx}/{len(pdfs)})...")
                     try:
                         raw, pages, ocr = safe_extract_text(pdf)
-                        text, pages2 = clean_text(raw, pages)
+                        text, pages2, offsets = clean_text_with_offsets(raw, pages)
                         nodes, heading = detect_structure(text)
                         meta = meta_extract(text, heading, os.path.basename(pdf))
-                        chunks = build_chunks(nodes, text, meta, pdf, [p.index for p in pages2])
+                        chunks = build_chunks(nodes, text, meta, pdf, [p.index for p in pages2], offsets)
                         all_chunks.extend(chunks)
                     except Exception as e:
                         st.warning(f"Erro ao processar {os.path.basename(pdf)}: {e}")
                         continue
                     pbar.progress(min(0.2, idx/total_files*0.2), text=f"Chunks acumulados: {len(all_chunks)}")
 
+                indexed_chunks = all_chunks
+
                 def cb(frac: float, msg: str):
                     val = 0.2 + frac * 0.8
                     pbar.progress(min(1.0, val), text=f"Indexando: {msg}")
@@ -862,16 +876,18 @@ if reindex:
                     status.markdown(f"Processando `{os.path.basename(pdf)}` ({idx}/{len(added)})...")
                     try:
                         raw, pages, ocr = safe_extract_text(pdf)
-                        text, pages2 = clean_text(raw, pages)
+                        text, pages2, offsets = clean_text_with_offsets(raw, pages)
                         nodes, heading = detect_structure(text)
                         meta = meta_extract(text, heading, os.path.basename(pdf))
-                        chunks = build_chunks(nodes, text, meta, pdf, [p.index for p in pages2])
+                        chunks = build_chunks(nodes, text, meta, pdf, [p.index for p in pages2], offsets)
                         all_new_chunks.extend(chunks)
                     except Exception as e:
                         st.warning(f"Erro ao processar {os.path.basename(pdf)}: {e}")
                         continue
                     pbar.progress(min(0.2, idx/total_files*0.2), text=f"Novos chunks: {len(all_new_chunks)}")
 
+                indexed_chunks = all_new_chunks
+
                 # Carregar base existente (se houver) e apenas adicionar textos/metadados
                 if use_qdrant and qindex is not None:
                     db = qindex.load_qdrant()
@@ -924,20 +940,30 @@ if reindex:
                         except Exception as e:
                             st.warning(f"Falha ao exportar JSONL (append): {e}")
 
-            # Atualizar serviço em memória e reconstruir chain
-            service.document_service.database = db
+            # Nova geração do índice antes da chain (o Searcher guarda a geração nas chaves do cache)
             try:
-                service.rebuild_chain()
+                # Invalida só as respostas cujos chunks de origem mudaram nesta geração
+                if service is not None:
+                    service.cache.invalidate_for_reindex(indexed_chunks, full=do_full)
+                else:
+                    from src.utils.cache_utils import invalidate_for_reindex
+                    invalidate_for_reindex(indexed_chunks, full=do_full)
             except Exception:
                 pass
 
-            # Atualizar manifest e limpar cache de Q/A
+            # Atualizar serviço em memória e reconstruir chain (ou o servidor recarrega do disco)
             try:
-                save_manifest(new_map)
+                if service is not None:
+                    service.document_service.database = db
+                    service.rebuild_chain()
+                else:
+                    remote.reload()
             except Exception:
                 pass
+
+            # Atualizar manifest
             try:
-                service.cache.clear_all()
+                save_manifest(new_map)
             except Exception:
                 pass
 
@@ -956,17 +982,28 @@ btn = st.button("Consultar", type="primary")
 
 # Handle query
 if btn and query.strip():
-    with st.spinner("Consultando..."):
-        answer = service.answer_question(query.strip())
+    st.subheader("Resposta")
+    # Streaming: o texto aparece conforme o LLM gera; write_stream devolve a resposta completa
+    # Uma única busca: os mesmos trechos viram contexto do LLM e a prévia abaixo
+    # fontes e métricas desta consulta: o engine é compartilhado entre sessões (cache_resource)
+    sources, stats = [], {}
+    answer = st.write_stream(engine.stream_answer(query.strip(), top_k=top_k, sources=sources, stats=stats))
+    if answer and stats.get("error"):
+        st.warning(f"Resposta interrompida ({stats['error']}): o texto acima está incompleto.")
     if answer:
-        st.subheader("Resposta")
-        st.write(answer)
+        ttft = stats.get("ttft_s")
+        if ttft is not None:
+            legenda = f"Primeiro token em {ttft:.2f}s • total {stats.get('total_s', 0):.2f}s"
+            if "prompt_eval_s" in stats:
+                # prompt_eval cai quando o prefixo do prompt sai do cache KV do Ollama
+                legenda += (f" • prompt {stats.get('prompt_tokens', 0):.0f} tok em {stats['prompt_eval_s']:.2f}s"
+                            f" • geração {stats.get('eval_tokens', 0):.0f} tok em {stats.get('eval_s', 0):.2f}s")
+            st.caption(legenda)
 
         # Retrieval preview
-        if show_retrieval and service.document_service and service.document_service.database:
+        if show_retrieval and sources:
             try:
-                searcher = Searcher(service.document_service.database)
-                docs = searcher.query(query.strip(), top_k=top_k)
+                docs = sources
                 with st.expander("Ver trechos relevantes"):
                     for i, d in enumerate(docs, start=1):
                         md = d.metadata or {}
@@ -1007,8 +1044,12 @@ def render_sidebar():
 
         # Verificar status do serviço
         try:
-            service = get_service()
-            if service:
+            remote = get_remote()
+            service = None if remote is not None else get_service()
+            if remote is not None:
+                info = remote.health() or {}
+                st.success(f"✅ Servidor de consultas ativo\n🔁 Geração do índice: {info.get('geracao', '?')}")
+            elif service:
                 searcher = get_searcher()
                 if searcher and hasattr(searcher, 'db') and searcher.db is not None:
                     # Para Qdrant, tentar obter contagem